@@ -1,71 +1,771 @@
+import argparse
+import shutil
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
 import pandas as pd
 
-from conflict_parse import parse_conflicts
-from direction_parse import parse_directions
-from dosing_set_parse import parse_dosing_sets
-from order_string_parse import parse_order_strings
-from outside_location_parse import parse_locations
-from solarwinds_parse import parse_solarwinds
-from unit_of_measure_parse import parse_units
-
-SEARCH_FILENAMES = {
-    "dosing_sets": ["dosing", parse_dosing_sets],
-    "order_strings": ["order_string", parse_order_strings],
-    "directions": ["direction", parse_directions],
-    "outside_locations": ["location", parse_locations],
-    "conflicts": ["conflict", parse_conflicts],
-    "unit_of_measure": ["unit", parse_units],
-    "solarwinds": ["solarwinds", parse_solarwinds],
-}
-
-
-def get_file_list(search_params: dict[str, list]) -> dict[str, tuple]:
-    # Get files from the "input" folder
-    files = [f for f in Path("input").iterdir() if f.is_file()]
-    file_mapping = dict()
+from arrow_export import (
+    ARROW_FORMATS,
+    ArrowFolderWriter,
+    to_arrow_backed,
+    write_arrow,
+)
+from common_functions import dataframe_to_long
+from compressed_input import ReportInput, detect_compression
+from free_threading import gil_enabled
+from input_router import CACHE_PATH, InputRouter
+from order_string_duplicates import (
+    DEFAULT_THRESHOLD,
+    find_duplicate_order_strings,
+)
+from parallel_parse import parse_in_workers, transfer_summary
+from pipeline import run_pipeline
+from record_cache import CACHE_FOLDER, RecordCache
+from record_index import build_index, is_index_file, parse_one
+from regex_audit import MAX_EXPONENT, print_audit
+from run_ledger import HISTORY_PATH, RunRecorder, print_stats
+from shm_transport import (
+    TRANSPORTS,
+    attach_frame,
+    discard_frame,
+    release_block,
+    untracked_shared_memory,
+)
+from thread_benchmark import REPEAT, print_thread_benchmark
+from xlsx_export import (
+    ENGINES,
+    XlsxPackageWriter,
+    render_sheet_xml,
+    write_xlsx,
+)
+
 
-    # Loop through the search dictionary
-    for key, params in search_params.items():
-        # Find the file that contains the relevant search value
-        matching_file = next((f for f in files if params[0] in f.stem), None)
+def get_file_list(
+    router: InputRouter, input_folder: Path = Path("input")
+) -> dict[str, tuple]:
+    # Get files from the input folder, skipping record index sidecars
+    files = [
+        f
+        for f in input_folder.iterdir()
+        if f.is_file() and not is_index_file(f)
+    ]
+    file_mapping = dict()
 
-        # If a matching file is found, map the key to the file path and relevant function
-        if matching_file:
-            file_mapping[key] = (matching_file, params[1])
+    # Classify each file by its content and map the category to the first
+    # matching file and the registered parse function
+    for category, matching_files in router.route(files).items():
+        file_mapping[category] = (
+            matching_files[0],
+            router.parsers[category].func,
+        )
 
     return file_mapping
 
 
-def parse_file(category: str, file_path: Path, func) -> pd.DataFrame | None:
+def output_router(output_folder: Path = Path("output")) -> InputRouter:
+    # the routing cache is kept with the other caches in the output folder
+    return InputRouter(cache_path=Path(output_folder, CACHE_PATH.name))
+
+
+def parse_file(
+    category: str,
+    file_path: Path,
+    func,
+    record_cache: RecordCache | None = None,
+    limit: int | None = None,
+    sample: int | None = None,
+    threads: int | None = 1,
+    layout: str = "wide",
+) -> pd.DataFrame | None:
     print(f"Parsing {category} dictionary...")
     if func == None:
         return pd.DataFrame()
-    return func(file=file_path)
+    return func(
+        file=file_path,
+        **parser_kwargs(record_cache, limit, sample, threads, layout),
+    )
+
 
+def parser_kwargs(
+    record_cache: RecordCache | None = None,
+    limit: int | None = None,
+    sample: int | None = None,
+    threads: int | None = 1,
+    layout: str = "wide",
+) -> dict:
+    # only pass the options in use, not every parser takes every option
+    kwargs = dict()
+    if record_cache is not None:
+        kwargs["record_cache"] = record_cache
+    if limit is not None:
+        kwargs["limit"] = limit
+    if sample is not None:
+        kwargs["sample"] = sample
+    if threads != 1:
+        kwargs["threads"] = threads
+    if layout != "wide":
+        kwargs["layout"] = layout
+    return kwargs
+
+
+def parser_layout(router: InputRouter, category: str, layout: str) -> str:
+    # other parsers output the wide layout, which is melted on export
+    return layout if router.parsers[category].long_layout else "wide"
+
+
+def print_cache_use(category: str, hits: int, misses: int) -> None:
+    print(f"Reused {hits} of {hits + misses} {category} records")
+
+
+def collect_coercion_errors(dfs: list[tuple]) -> pd.DataFrame:
+    # gather the values each parser's schema couldn't coerce
+    errors = [
+        pd.DataFrame(df.attrs["coercion_errors"]).assign(Category=category)
+        for category, df in dfs
+        if df.attrs.get("coercion_errors")
+    ]
+    if not errors:
+        return pd.DataFrame()
+    errors = pd.concat(errors, ignore_index=True)
+    return errors[["Category"] + list(errors.columns[:-1])]
 
-def export_dfs_to_excel(dfs: list[tuple]) -> None:
-    filename = f"{"_".join([pairing[0] for pairing in dfs])}_dict_export.xlsx"
-    output_path = Path("output", filename)
-    with pd.ExcelWriter(output_path) as writer:
-        for sheetname, df in dfs:
-            df.to_excel(writer, sheet_name=sheetname)
 
+def export_name(categories: list[str]) -> str:
+    return "_".join(categories) + "_dict_export"
 
-def main() -> None:
-    # TODO - create input/output folders if needed
-    file_dict = get_file_list(SEARCH_FILENAMES)
+
+def export_dfs_to_excel(
+    dfs: list[tuple],
+    workers: int | None = None,
+    errors: pd.DataFrame | None = None,
+    engine: str = "package",
+    output_folder: Path = Path("output"),
+) -> None:
+    filename = export_name([pairing[0] for pairing in dfs]) + ".xlsx"
+    output_path = Path(output_folder, filename)
+    sheets = list(dfs)
+    if errors is not None and not errors.empty:
+        sheets.append(("coercion_errors", errors))
+    # each sheet is serialized in its own worker process
+    write_xlsx(sheets, output_path, workers=workers, engine=engine)
+
+
+def export_dfs_to_arrow(
+    dfs: list[tuple],
+    format: str = "parquet",
+    errors: pd.DataFrame | None = None,
+    output_folder: Path = Path("output"),
+) -> None:
+    # one file per category plus a manifest, in a folder named like the
+    # Excel export
+    folder = export_name([pairing[0] for pairing in dfs])
+    tables = list(dfs)
+    if errors is not None and not errors.empty:
+        tables.append(("coercion_errors", errors))
+    write_arrow(tables, Path(output_folder, folder), format=format)
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="exparse")
+    subparsers = parser.add_subparsers(dest="command")
+    stats = subparsers.add_parser(
+        "stats", help="show run history trends and throughput regressions"
+    )
+    stats.add_argument(
+        "--fraction",
+        type=float,
+        default=0.5,
+        help="flag parsers below this fraction of their rolling median",
+    )
+    stats.add_argument(
+        "--window",
+        type=int,
+        default=10,
+        help="number of previous runs in the rolling median",
+    )
+    stats.add_argument(
+        "--last", type=int, default=10, help="number of runs to show"
+    )
+    # also accepted after the subcommand; SUPPRESS keeps a value given
+    # before it
+    stats.add_argument(
+        "--history",
+        type=Path,
+        default=argparse.SUPPRESS,
+        help="run history file",
+    )
+    audit = subparsers.add_parser(
+        "audit-regex",
+        help="time every parser regex on adversarial inputs of growing size "
+        "and fail if any scales superlinearly",
+    )
+    audit.add_argument(
+        "--max-exponent",
+        type=float,
+        default=MAX_EXPONENT,
+        help="largest scaling exponent of match time that still passes",
+    )
+    index = subparsers.add_parser(
+        "index",
+        help="write a record index sidecar next to every input file, for "
+        "lookups of single records",
+    )
+    # the subcommands' --input is also accepted before the subcommand
+    index.add_argument(
+        "--input", type=Path, default=argparse.SUPPRESS, help="input folder"
+    )
+    lookup = subparsers.add_parser(
+        "lookup", help="parse the single record with a key from a report"
+    )
+    lookup.add_argument("file", type=Path, help="report file")
+    lookup.add_argument(
+        "key", help="record key, e.g. the Mnemonic of a conflicts report"
+    )
+    bench = subparsers.add_parser(
+        "bench-threads",
+        help="time the threaded parsers on the input files, in one thread "
+        "and on a thread pool",
+    )
+    bench.add_argument(
+        "--input", type=Path, default=argparse.SUPPRESS, help="input folder"
+    )
+    bench.add_argument(
+        "--pool-threads",
+        type=int,
+        default=0,
+        help="threads of the thread pool, 0 for one per CPU",
+    )
+    bench.add_argument(
+        "--repeat",
+        type=int,
+        default=REPEAT,
+        help="parses timed per mode, the fastest is kept",
+    )
+    duplicates = subparsers.add_parser(
+        "order-string-duplicates",
+        help="cluster near-duplicate order strings of the input folder into "
+        "order_string_duplicates.xlsx in the output folder",
+    )
+    duplicates.add_argument(
+        "--input", type=Path, default=argparse.SUPPRESS, help="input folder"
+    )
+    duplicates.add_argument(
+        "--threshold",
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help="Jaccard similarity of the normalized fields from which two "
+        "order strings are duplicates",
+    )
+    parser.add_argument(
+        "--layout",
+        choices=["wide", "long"],
+        default="wide",
+        help="export one column per heading, or one row per heading value",
+    )
+    parser.add_argument(
+        "--format",
+        choices=["xlsx", *ARROW_FORMATS],
+        default="xlsx",
+        help="export one Excel workbook, or one Parquet/Feather file per "
+        "category with Arrow backed string columns",
+    )
+    parser.add_argument(
+        "--xlsx-engine",
+        choices=ENGINES,
+        default="package",
+        help="render the workbook's sheets in worker processes, or write "
+        "them one by one with openpyxl as the original export did",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="only tokenize records that are new or changed since the "
+        "last incremental run",
+    )
+    parser.add_argument(
+        "--head",
+        type=int,
+        metavar="N",
+        help="preview: only read and parse the first N records of each file",
+    )
+    parser.add_argument(
+        "--sample",
+        type=int,
+        metavar="K",
+        help="preview: only parse every K-th record of each file",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="parse the input files in this many worker processes",
+    )
+    parser.add_argument(
+        "--transport",
+        choices=TRANSPORTS,
+        default="pickle",
+        help="how workers hand parsed tables back: pickled, or as Arrow IPC "
+        "in shared memory (needs pyarrow)",
+    )
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=1,
+        help="parse the records of each file on this many threads, 0 for "
+        "one per CPU; needs a free-threaded Python build, with the GIL "
+        "records are parsed in one thread",
+    )
+    parser.add_argument(
+        "--pipeline",
+        action=argparse.BooleanOptionalAction,
+        default=True,
+        help="read the next file and write each parsed category while the "
+        "current file is parsed, instead of exporting everything at the end",
+    )
+    parser.add_argument(
+        "--input",
+        type=Path,
+        default=Path("input"),
+        help="folder of the reports to parse",
+    )
+    parser.add_argument(
+        "--output",
+        type=Path,
+        default=Path("output"),
+        help="folder of the exports, the run history and the caches",
+    )
+    parser.add_argument(
+        "--history",
+        type=Path,
+        help=f"run history file, defaults to {HISTORY_PATH.name} in the "
+        "output folder",
+    )
+    return parser.parse_args(argv)
+
+
+def index_files(
+    input_folder: Path = Path("input"), output_folder: Path = Path("output")
+) -> None:
+    router = output_router(output_folder)
+    for category, file_and_func in get_file_list(router, input_folder).items():
+        spec = router.parsers[category]
+        if spec.record_key is None:
+            continue
+        if detect_compression(file_and_func[0]) is not None:
+            print(f"Skipped compressed file {file_and_func[0]}")
+            continue
+        index = build_index(file_and_func[0], spec)
+        print(
+            f"Indexed {len(index['records'])} {category} records in "
+            f"{file_and_func[0]}"
+        )
+
+
+def export_order_string_duplicates(
+    input_folder: Path = Path("input"),
+    threshold: float = DEFAULT_THRESHOLD,
+    output_folder: Path = Path("output"),
+) -> pd.DataFrame | None:
+    router = output_router(output_folder)
+    file_dict = get_file_list(router, input_folder)
+    if "order_strings" not in file_dict:
+        print(f"No order strings report in {input_folder}")
+        return None
+    clusters = find_duplicate_order_strings(
+        parse_file("order_strings", *file_dict["order_strings"]), threshold
+    )
+    print(
+        f"Found {clusters['Cluster'].nunique()} clusters holding "
+        f"{len(clusters)} order strings"
+    )
+    write_xlsx(
+        [("order_string_duplicates", clusters)],
+        Path(output_folder, "order_string_duplicates.xlsx"),
+        workers=1,
+    )
+    return clusters
+
+
+def parse_files_in_workers(
+    file_dict: dict[str, tuple],
+    router: InputRouter,
+    recorder: RunRecorder,
+    workers: int,
+    transport: str = "pickle",
+    incremental: bool = False,
+    preview: bool = False,
+    limit: int | None = None,
+    sample: int | None = None,
+    threads: int | None = 1,
+    layout: str = "wide",
+    cache_folder: Path = CACHE_FOLDER,
+) -> tuple[list[tuple], list]:
+    # parse each file in a worker process, returning the (category,
+    # dataframe) pairs and the shared memory blocks they were sent through
+    dataframes = list()
+    blocks = list()
+    jobs = [
+        (
+            category,
+            *file_dict[category],
+            parser_kwargs(
+                limit=limit,
+                sample=sample,
+                threads=threads if router.parsers[category].threaded else 1,
+                layout=parser_layout(router, category, layout),
+            ),
+            router.parsers[category].incremental,
+        )
+        for category in file_dict
+    ]
+    frames = list()
+    results = parse_in_workers(
+        jobs, workers, incremental, not preview, transport, cache_folder
+    )
+    # frame handed out but not attached yet
+    handle = None
+    try:
+        for category, result in results:
+            handle = result["frame"]
+            df, block = attach_frame(handle)
+            blocks.append(block)
+            handle = None
+            frames.append(result["frame"])
+            recorder.add_parser(
+                category,
+                file_dict[category][0],
+                records=result["records"],
+                wall_seconds=result["wall_seconds"],
+                cpu_seconds=result["cpu_seconds"],
+                transfer_bytes=result["frame"].bytes_moved,
+                transfer_seconds=result["frame"].seconds
+                + result["frame"].attach_seconds,
+                cache_hits=(result["cache"] or [0])[0],
+            )
+            dataframes.append((category, df))
+            if result["cache"] is not None:
+                recorder.cache_hits += result["cache"][0]
+                print_cache_use(category, *result["cache"])
+    except BaseException:
+        # the blocks are made without a resource tracker, so free every
+        # block before giving up: the other workers' frames, this one's if
+        # it wasn't attached, and those attached so far
+        results.close()
+        if handle is not None:
+            discard_frame(handle)
+        dataframes.clear()
+        for block in blocks:
+            release_block(block)
+        raise
+    print(transfer_summary(frames))
+    return dataframes, blocks
+
+
+def run(
+    history_path: Path = HISTORY_PATH,
+    layout: str = "wide",
+    format: str = "xlsx",
+    incremental: bool = False,
+    limit: int | None = None,
+    sample: int | None = None,
+    workers: int = 1,
+    transport: str = "pickle",
+    pipeline: bool = True,
+    threads: int | None = 1,
+    xlsx_engine: str = "package",
+    input_folder: Path = Path("input"),
+    output_folder: Path = Path("output"),
+) -> None:
+    input_folder.mkdir(parents=True, exist_ok=True)
+    output_folder.mkdir(parents=True, exist_ok=True)
+    preview = limit is not None or sample is not None
+    # the pipeline exports each category as soon as it is parsed; the
+    # openpyxl engine writes the whole workbook at the end
+    streamed = (
+        pipeline
+        and workers <= 1
+        and (format in ARROW_FORMATS or xlsx_engine == "package")
+    )
+    recorder = RunRecorder(
+        history_path,
+        pipelined=streamed,
+        incremental=incremental,
+        workers=workers,
+        # 0 for one thread per CPU, as on the command line
+        threads=threads or 0,
+    )
+    router = output_router(output_folder)
+    cache_folder = Path(output_folder, CACHE_FOLDER.name)
+    file_dict = get_file_list(router, input_folder)
+    recorder.cache_hits += router.cache_hits
+    if not file_dict:
+        print(f"No reports to parse in {input_folder}")
+        return
     print(f"Parsing files: {file_dict}")  # debug
+    if threads != 1 and gil_enabled():
+        print("The GIL is enabled, records are parsed in one thread")
+    if workers > 1 and transport == "arrow" and not untracked_shared_memory():
+        print(
+            "The Arrow transport needs Python 3.13 or later, workers send "
+            "pickled tables"
+        )
+        transport = "pickle"
+
+    def parse_category(category: str, report: ReportInput) -> pd.DataFrame:
+        record_cache = None
+        if incremental and router.parsers[category].incremental:
+            record_cache = RecordCache(category, cache_folder)
+        parser_threads = threads if router.parsers[category].threaded else 1
+        with recorder.time_parser(
+            category, file_dict[category][0], parser_threads
+        ) as timing:
+            timing["df"] = parse_file(
+                category,
+                report,
+                file_dict[category][1],
+                record_cache=record_cache,
+                limit=limit,
+                sample=sample,
+                threads=parser_threads,
+                layout=parser_layout(router, category, layout),
+            )
+            if record_cache is not None:
+                timing["cache_hits"] = record_cache.hits
+        if record_cache is not None:
+            # a preview only sees some records, saving would drop the rest
+            if not preview:
+                record_cache.save()
+            recorder.cache_hits += record_cache.hits
+            print_cache_use(category, record_cache.hits, record_cache.misses)
+        return timing["df"]
+
     dataframes = list()
-    for category in file_dict.keys():
-        dataframes.append(
-            (category, parse_file(category, *file_dict[category]))
+    # shared memory blocks the parsed tables live in, freed after export
+    blocks = list()
+    if workers > 1:
+        dataframes, blocks = parse_files_in_workers(
+            file_dict,
+            router,
+            recorder,
+            workers,
+            transport,
+            incremental,
+            preview,
+            limit,
+            sample,
+            threads,
+            layout,
+            cache_folder,
+        )
+    elif streamed:
+        exporter = StreamingExport(
+            list(file_dict), recorder, layout, format, output_folder
         )
+        try:
+            run_pipeline(
+                [(category, file_dict[category][0]) for category in file_dict],
+                parse_category,
+                exporter.write,
+                # previews only read the start of each file
+                read=(lambda file: file) if preview else Path.read_bytes,
+            )
+        except BaseException:
+            exporter.discard()
+            raise
+        exporter.close()
+    else:
+        for category in file_dict.keys():
+            dataframes.append(
+                (category, parse_category(category, file_dict[category][0]))
+            )
+
+    try:
+        if not streamed:
+            export(
+                dataframes,
+                recorder,
+                layout,
+                format,
+                xlsx_engine,
+                output_folder,
+            )
+    finally:
+        # the parsed tables may still point into the blocks
+        dataframes.clear()
+        for block in blocks:
+            release_block(block)
+    if preview:
+        # previews would skew the throughput of the full runs in the history
+        return
+    recorder.save()
+
+
+def export(
+    dataframes: list[tuple],
+    recorder: RunRecorder,
+    layout: str = "wide",
+    format: str = "xlsx",
+    xlsx_engine: str = "package",
+    output_folder: Path = Path("output"),
+) -> None:
+    errors = collect_coercion_errors(dataframes)
+    dataframes = [
+        (category, export_frame(df, layout, format))
+        for category, df in dataframes
+    ]
+
+    if not errors.empty:
+        print(f"{len(errors)} values failed type coercion")
+    with recorder.time_export():
+        if format in ARROW_FORMATS:
+            export_dfs_to_arrow(
+                dataframes, format, errors=errors, output_folder=output_folder
+            )
+        else:
+            export_dfs_to_excel(
+                dataframes,
+                errors=errors,
+                engine=xlsx_engine,
+                output_folder=output_folder,
+            )
+
+
+def export_frame(
+    df: pd.DataFrame, layout: str = "wide", format: str = "xlsx"
+) -> pd.DataFrame:
+    # reshape and convert a parsed dataframe for the chosen export, unless
+    # the parser already built the long layout
+    if layout == "long" and df.attrs.get("layout") != "long":
+        df = dataframe_to_long(df)
+    if format in ARROW_FORMATS:
+        df = to_arrow_backed(df)
+    return df
 
-    export_dfs_to_excel(dataframes)
+
+class StreamingExport:
+    """
+    Writes each parsed category to the export as soon as it is ready, so
+    parsed dataframes don't have to be kept until every file is parsed. The
+    coercion errors are written last, on close.
+    """
+
+    def __init__(
+        self,
+        categories: list[str],
+        recorder: RunRecorder,
+        layout: str = "wide",
+        format: str = "xlsx",
+        output_folder: Path = Path("output"),
+    ) -> None:
+        self.recorder = recorder
+        self.layout = layout
+        self.format = format
+        self.errors = list()
+        self.executor = None
+        if format in ARROW_FORMATS:
+            self.path = Path(output_folder, export_name(categories))
+            self.package = ArrowFolderWriter(self.path, format)
+            return
+        self.path = Path(output_folder, export_name(categories) + ".xlsx")
+        self.package = XlsxPackageWriter(self.path)
+        # sheets are rendered in a worker process, so rendering doesn't hold
+        # the GIL while the next file is parsed. The worker is started now,
+        # before the pipeline's threads, so it isn't forked from a threaded
+        # process
+        self.executor = ProcessPoolExecutor(max_workers=1)
+        self.executor.submit(int).result()
+
+    def add(self, category: str, df: pd.DataFrame) -> None:
+        if self.executor is None:
+            self.package.add_table(category, df)
+        else:
+            sheet_xml = self.executor.submit(render_sheet_xml, df).result()
+            self.package.add_sheet(category, sheet_xml)
+
+    def shutdown(self) -> None:
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+
+    def write(self, category: str, df: pd.DataFrame) -> None:
+        with self.recorder.time_export():
+            errors = collect_coercion_errors([(category, df)])
+            if not errors.empty:
+                self.errors.append(errors)
+            self.add(category, export_frame(df, self.layout, self.format))
+
+    def close(self) -> None:
+        with self.recorder.time_export():
+            if self.errors:
+                errors = pd.concat(self.errors, ignore_index=True)
+                print(f"{len(errors)} values failed type coercion")
+                self.add("coercion_errors", errors)
+            try:
+                self.package.close()
+            finally:
+                self.shutdown()
+
+    def discard(self) -> None:
+        # remove what a failed run had written so far
+        self.shutdown()
+        if self.executor is None:
+            # the folder has no manifest yet, so none of it is usable
+            shutil.rmtree(self.path, ignore_errors=True)
+        else:
+            self.package.zip.close()
+            self.path.unlink(missing_ok=True)
+
+
+def main(argv: list[str] | None = None) -> None:
+    args = parse_args(argv)
+    history = args.history or Path(args.output, HISTORY_PATH.name)
+    if args.command == "stats":
+        print_stats(history, args.fraction, args.window, args.last)
+        return
+    if args.command == "audit-regex":
+        failures = print_audit(args.max_exponent)
+        if not failures.empty:
+            raise SystemExit(1)
+        return
+    if args.command == "bench-threads":
+        router = output_router(args.output)
+        print_thread_benchmark(
+            get_file_list(router, args.input),
+            router.parsers,
+            args.pool_threads or None,
+            args.repeat,
+        )
+        return
+    if args.command == "order-string-duplicates":
+        clusters = export_order_string_duplicates(
+            args.input, args.threshold, args.output
+        )
+        if clusters is None:
+            raise SystemExit(1)
+        return
+    if args.command == "index":
+        index_files(args.input, args.output)
+        return
+    if args.command == "lookup":
+        print(parse_one(args.file, args.key).to_string())
+        return
+    run(
+        history,
+        args.layout,
+        args.format,
+        args.incremental,
+        args.head,
+        args.sample,
+        args.workers,
+        args.transport,
+        args.pipeline,
+        args.threads or None,
+        args.xlsx_engine,
+        args.input,
+        args.output,
+    )
+    print("Done!")
 
 
 if __name__ == "__main__":
     main()
-    print("Done!")
@@ -0,0 +1,182 @@
+import json
+from pathlib import Path
+
+import pandas as pd
+
+ARROW_FORMATS = {"parquet": ".parquet", "feather": ".feather"}
+MANIFEST_NAME = "manifest.json"
+
+
+def import_pyarrow():
+    try:
+        import pyarrow
+    except ImportError as e:
+        raise ImportError(
+            "Parquet and Feather export and the arrow transport need "
+            "pyarrow, install it with 'pip install exparse[arrow]'"
+        ) from e
+    return pyarrow
+
+
+def to_arrow_backed(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Convert the text columns of a parsed dataframe to pyarrow strings.
+    Arrow columns have a single type, so columns holding a mix of strings
+    and other values (e.g. the transposed conflicts) are stored as text.
+
+    This works on the output of any parser, which is how every parser's
+    output becomes Arrow backed: the parsers themselves build object columns
+    with pandas string methods, so they convert once at the end.
+
+    :param df: parsed dataframe
+    :type df: pd.DataFrame
+    :return: dataframe with pyarrow backed string columns
+    :rtype: pd.DataFrame
+    """
+    pa = import_pyarrow()
+    string_type = pd.ArrowDtype(pa.string())
+    df = df.copy()
+    for position in range(df.shape[1]):
+        values = df.iloc[:, position]
+        if values.dtype != object:
+            continue
+        text = values.where(values.isna(), values.astype(str))
+        df.isetitem(position, text.astype(string_type))
+    return df
+
+
+def unique_column_names(columns: pd.Index) -> list[str]:
+    """
+    Make column labels unique strings, as Arrow tables need. Repeated labels
+    get a numbered suffix, e.g. "Name", "Name.1".
+    """
+    names = list()
+    seen = dict()
+    for column in columns:
+        name = (
+            " ".join(str(level) for level in column)
+            if isinstance(column, tuple)
+            else str(column)
+        )
+        count = seen.get(name, 0)
+        seen[name] = count + 1
+        names.append(name if count == 0 else f"{name}.{count}")
+    return names
+
+
+def write_arrow_table(df: pd.DataFrame, path: Path, format: str) -> dict:
+    """
+    Write one dataframe to a Parquet or Feather file. Feather files are
+    written uncompressed so they can be memory-mapped without a copy.
+
+    :param df: dataframe to write
+    :type df: pd.DataFrame
+    :param path: output file
+    :type path: Path
+    :param format: "parquet" or "feather"
+    :type format: str
+    :return: manifest entry with the file's schema and row count
+    :rtype: dict
+    """
+    pa = import_pyarrow()
+    import pyarrow.feather
+    import pyarrow.parquet
+
+    df = df.set_axis(unique_column_names(df.columns), axis=1)
+    table = pa.Table.from_pandas(df)
+    if format == "parquet":
+        pyarrow.parquet.write_table(table, path)
+    else:
+        pyarrow.feather.write_feather(table, path, compression="uncompressed")
+
+    return {
+        "file": path.name,
+        "format": format,
+        "rows": table.num_rows,
+        "columns": len(df.columns),
+        "bytes": path.stat().st_size,
+        "schema": [
+            {"name": field.name, "type": str(field.type)}
+            for field in table.schema
+        ],
+    }
+
+
+class ArrowFolderWriter:
+    """
+    Writes categories to their own Parquet or Feather files as they are
+    added, and the manifest on close.
+    """
+
+    def __init__(self, output_dir: Path, format: str = "parquet") -> None:
+        if format not in ARROW_FORMATS:
+            raise ValueError(f"Unknown Arrow export format {format!r}")
+        output_dir.mkdir(parents=True, exist_ok=True)
+        self.output_dir = output_dir
+        self.manifest = {"format": format, "categories": dict()}
+
+    def __enter__(self) -> "ArrowFolderWriter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def add_table(self, category: str, df: pd.DataFrame) -> None:
+        format = self.manifest["format"]
+        path = Path(self.output_dir, category + ARROW_FORMATS[format])
+        self.manifest["categories"][category] = write_arrow_table(
+            df, path, format
+        )
+
+    def close(self) -> None:
+        Path(self.output_dir, MANIFEST_NAME).write_text(
+            json.dumps(self.manifest, indent=2)
+        )
+
+
+def write_arrow(
+    dfs: list[tuple], output_dir: Path, format: str = "parquet"
+) -> dict:
+    """
+    Write every category to its own Parquet or Feather file, plus a manifest
+    recording each file's schema and row count.
+
+    :param dfs: (category, dataframe) pairs
+    :type dfs: list[tuple]
+    :param output_dir: folder for the files and the manifest
+    :type output_dir: Path
+    :param format: "parquet" or "feather", defaults to "parquet"
+    :type format: str, optional
+    :return: the manifest
+    :rtype: dict
+    """
+    with ArrowFolderWriter(output_dir, format) as folder:
+        for category, df in dfs:
+            folder.add_table(category, df)
+    return folder.manifest
+
+
+def read_arrow(output_dir: Path, category: str) -> pd.DataFrame:
+    """
+    Load one exported category back from its folder. Feather files are
+    memory-mapped and their string columns stay Arrow backed.
+
+    :param output_dir: folder written by write_arrow
+    :type output_dir: Path
+    :param category: category to load
+    :type category: str
+    :return: the exported dataframe
+    :rtype: pd.DataFrame
+    """
+    import_pyarrow()
+    import pyarrow.feather
+    import pyarrow.parquet
+
+    manifest = json.loads(Path(output_dir, MANIFEST_NAME).read_text())
+    entry = manifest["categories"][category]
+    path = Path(output_dir, entry["file"])
+    if entry["format"] == "parquet":
+        table = pyarrow.parquet.read_table(path)
+    else:
+        table = pyarrow.feather.read_table(path, memory_map=True)
+    return table.to_pandas(types_mapper=pd.ArrowDtype)
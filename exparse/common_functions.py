@@ -1,48 +1,840 @@
 import re
+from dataclasses import dataclass
 from pathlib import Path
+from typing import Callable
 
+import numpy as np
 import pandas as pd
 import xlwings as xw
 
+from compressed_input import ReportInput, buffer_input, open_input
+from free_threading import map_chunks
+from record_cache import RecordCache
 
-def file_to_dataframe(
-    file: Path, headings: list[str], id: str, replace: list[tuple[str, str]]
-):
+# Regex patterns to match report headers and blank lines
+COMMON_CLEANUP_PATTERNS = [
+    (r"^\s*\n", ""),
+    (r"[^\x00-\x7F]+", ""),
+    (r"^-+\n", ""),
+    (r"^\*LIVE\*.*\n.*\n.*", ""),
+    (r"^\*LSTD\*.*\n.*\n.*", ""),
+    (r"^\*TEST\*.*\n.*\n.*", ""),
+    (r"^\*TSTD\*.*\n.*\n.*", ""),
+    (r"DATE:.*\n", ""),
+    (r"USER:.*\n", ""),
+]
+# characters read by the first pass of a preview, doubled until enough
+# records have been read
+READ_CHUNK_SIZE = 1 << 16
+# Match words with optional single spaces between them, followed by at least
+# 2 whitespaces or the end of the line. The lookbehinds only let a heading
+# start at the beginning of a word run, so a run that fails isn't rescanned
+# from each of its characters (which made the scan quadratic)
+HEADING_REGEX = r"(?<!\S)(?<!\S )(?:\S+(?: \S+)*(?=\s{2,})|\S+(?: \S+)*$)"
+
+
+def file_to_long(
+    file: ReportInput,
+    headings: list[str],
+    id: str,
+    replace: list[tuple[str, str]],
+    limit: int | None = None,
+    sample: int | None = None,
+    where: list["RecordFilter"] | None = None,
+    columns: list[str] | None = None,
+    threads: int | None = 1,
+) -> "LongTable":
+    groups = file_to_records(
+        file,
+        id_splitter(id, replace),
+        limit,
+        sample,
+        keep=record_filter(where, headings),
+    )
+
+    # convert to long format records
+    return records_to_long(
+        groups,
+        headings,
+        where=where,
+        columns=columns,
+        threads=threads,
+    )
 
-    # Read the text file
-    with open(file, "r") as f:
-        data = f.read()
 
-    # cleanup file
-    data = regex_substitution(data, replace)
-    debug_test_current_data(data)
+def file_to_dataframe(
+    file: ReportInput,
+    headings: list[str],
+    id: str,
+    replace: list[tuple[str, str]],
+    limit: int | None = None,
+    sample: int | None = None,
+    where: list["RecordFilter"] | None = None,
+    columns: list[str] | None = None,
+    threads: int | None = 1,
+):
+    table = file_to_long(
+        file=file,
+        headings=headings,
+        id=id,
+        replace=replace,
+        limit=limit,
+        sample=sample,
+        where=where,
+        columns=columns,
+        threads=threads,
+    )
     # convert to dataframe
-    df = text_data_to_dataframe(text=data, id=id, headings=headings)
+    df = long_to_wide(table)
     return df
 
 
+def id_splitter(
+    id: str, replace: list[tuple[str, str]]
+) -> Callable[[str, bool], list[str]]:
+    """
+    Get a function cleaning up a report's text and splitting it into records
+    starting at each ID, for file_to_records. The first record is the text
+    before the first ID.
+    """
+
+    def split(text: str, complete: bool) -> list[str]:
+        # cleanup text and split it into groups based on ID
+        groups = re.split(f"(?={id})", regex_substitution(text, replace))
+        return groups if complete else groups[:-1]
+
+    return split
+
+
+def file_to_records(
+    file: ReportInput,
+    split: Callable[[str, bool], list[str]],
+    limit: int | None = None,
+    sample: int | None = None,
+    preamble: bool = True,
+    keep: Callable[[str], bool] | None = None,
+) -> list[str]:
+    """
+    Read a report and split it into records, or only the records a preview
+    needs. A preview picks its records from those passing keep, so it isn't
+    cut short by records the parser would filter out.
+
+    :param file: text file, report text or bytes, or binary stream
+    :type file: ReportInput
+    :param split: function taking a text and whether it is the whole file,
+        returning the complete records in it
+    :type split: Callable[[str, bool], list[str]]
+    :param limit: maximum number of records, defaults to all
+    :type limit: int | None, optional
+    :param sample: step between picked records, defaults to every record
+    :type sample: int | None, optional
+    :param preamble: whether the first record is the text before the first
+        ID, which is always kept, defaults to True
+    :type preamble: bool, optional
+    :param keep: test of each record's text, see record_filter, defaults to
+        keeping every record
+    :type keep: Callable[[str], bool] | None, optional
+    :return: the records
+    :rtype: list[str]
+    """
+    if keep is not None and (limit is not None or sample is not None):
+        split_all = split
+
+        def split(text: str, complete: bool) -> list[str]:
+            records = split_all(text, complete)
+            return records[: int(preamble)] + [
+                record for record in records[int(preamble) :] if keep(record)
+            ]
+
+    if limit is None:
+        # Read the text file
+        with open_input(file) as f:
+            records = split(f.read(), True)
+    else:
+        records = read_records(
+            file, split, int(preamble) + limit * (sample or 1)
+        )
+    if not preamble:
+        return select_records(records, limit, sample)
+    return records[:1] + select_records(records[1:], limit, sample)
+
+
+def file_to_rows(
+    file: ReportInput,
+    split: Callable[[str, bool], list[str]],
+    parse: Callable[[list[str]], list[list[dict]]],
+    headings: list[str],
+    record_cache: RecordCache | None = None,
+    limit: int | None = None,
+    sample: int | None = None,
+    preamble: bool = True,
+    keep: Callable[[str], bool] | None = None,
+) -> list[list[dict]]:
+    """
+    Read a report and get the output rows of each of its records. With a
+    record cache, an input identical to the cached one reuses every cached
+    row without being split, and otherwise only the records missing from the
+    cache are parsed.
+
+    :param file: text file, report text or bytes, or binary stream
+    :type file: ReportInput
+    :param split: function taking a text and whether it is the whole file,
+        returning the complete records in it
+    :type split: Callable[[str, bool], list[str]]
+    :param parse: function taking records and returning the rows of each,
+        each record's rows depending only on its own text
+    :type parse: Callable[[list[str]], list[list[dict]]]
+    :param headings: headings the parser captures, cached rows are only
+        reused for the same headings
+    :type headings: list[str]
+    :param record_cache: cache of the rows of each record, defaults to None
+    :type record_cache: RecordCache | None, optional
+    :param limit: maximum number of records, defaults to all
+    :type limit: int | None, optional
+    :param sample: step between picked records, defaults to every record
+    :type sample: int | None, optional
+    :param preamble: whether the first record is the text before the first
+        ID, defaults to True
+    :type preamble: bool, optional
+    :param keep: test of each record's text a preview picks its records
+        from, defaults to keeping every record
+    :type keep: Callable[[str], bool] | None, optional
+    :return: the rows of each record, in file order
+    :rtype: list[list[dict]]
+    """
+    if record_cache is None:
+        return parse(
+            file_to_records(file, split, limit, sample, preamble, keep)
+        )
+
+    record_cache.use_headings(headings)
+    text = None
+    if limit is None:
+        with open_input(file) as f:
+            text = f.read()
+        rows = record_cache.get_file(text)
+        if rows is not None:
+            return rows
+        records = split(text, True)
+    else:
+        records = file_to_records(file, split, limit, sample, preamble, keep)
+
+    rows = [record_cache.get(record) for record in records]
+    missing = [i for i, record_rows in enumerate(rows) if record_rows is None]
+    if missing:
+        parsed = parse([records[i] for i in missing])
+        for i, record_rows in zip(missing, parsed):
+            rows[i] = record_rows
+            record_cache.put(records[i], record_rows)
+    if text is not None:
+        record_cache.put_file(text, records)
+    return rows
+
+
+def frame_to_rows(df: pd.DataFrame, n_records: int) -> list[list[dict]]:
+    """
+    Split a dataframe into the rows of each record, as file_to_rows returns
+    them. Missing values are left out of the rows.
+
+    :param df: dataframe indexed by the position of each row's record
+    :type df: pd.DataFrame
+    :param n_records: number of records
+    :type n_records: int
+    :return: the rows of each record
+    :rtype: list[list[dict]]
+    """
+    rows = [list() for _ in range(n_records)]
+    columns = list(df.columns)
+    for position, values in zip(df.index, df.itertuples(False, None)):
+        rows[position].append(
+            {
+                column: value
+                for column, value in zip(columns, values)
+                if not (isinstance(value, float) and np.isnan(value))
+            }
+        )
+    return rows
+
+
+def rows_to_frame(rows: list[list[dict]]) -> pd.DataFrame:
+    """
+    Build a dataframe from the rows of each record. Columns are ordered by
+    first appearance, and each row is indexed by its record's position.
+
+    :param rows: the rows of each record
+    :type rows: list[list[dict]]
+    :return: the dataframe
+    :rtype: pd.DataFrame
+    """
+    return pd.DataFrame(
+        [row for record_rows in rows for row in record_rows],
+        index=pd.Index(
+            [i for i, record_rows in enumerate(rows) for _ in record_rows],
+            dtype=np.int64,
+        ),
+    )
+
+
+def rows_to_long(
+    rows: list[list[dict]], heading_order: list[str]
+) -> pd.DataFrame:
+    """
+    Convert the single row of each record to the long export layout, as
+    long_to_rows does for a long format table.
+
+    :param rows: the rows of each record, at most one per record
+    :type rows: list[list[dict]]
+    :param heading_order: order of the headings within each record
+    :type heading_order: list[str]
+    :return: dataframe of Record, Heading and Value
+    :rtype: pd.DataFrame
+    """
+    order = {heading: i for i, heading in enumerate(heading_order)}
+    cells = sorted(
+        (
+            (record, order.get(heading, len(order)), heading, value)
+            for record, record_rows in enumerate(rows)
+            for row in record_rows
+            for heading, value in row.items()
+            if pd.notna(value)
+        ),
+        key=lambda cell: cell[:2],
+    )
+    return pd.DataFrame(
+        [(record, heading, value) for record, _, heading, value in cells],
+        columns=["Record", "Heading", "Value"],
+    )
+
+
+def read_prefix(file: Path | str | bytes, size: int) -> tuple[str, bool]:
+    """
+    Read the start of a text file. Unless the whole file fits in size
+    characters, the text is cut before its last line break so it only holds
+    whole lines. Compressed files are only decompressed as far as needed.
+
+    :param file: text file, or report text or bytes
+    :type file: Path | str | bytes
+    :param size: number of characters to read
+    :type size: int
+    :return: the text and whether it is the whole file
+    :rtype: tuple[str, bool]
+    """
+    with open_input(file) as f:
+        text = f.read(size)
+        complete = f.read(1) == ""
+    if not complete:
+        text = text[: max(text.rfind("\n"), 0)]
+    return text, complete
+
+
+def read_records(
+    file: ReportInput,
+    split: Callable[[str, bool], list],
+    count: int,
+    chunk_size: int = READ_CHUNK_SIZE,
+) -> list:
+    """
+    Read a growing prefix of a file until it holds count complete records,
+    so the cost of a preview depends on the number of records rather than
+    the file size.
+
+    :param file: text file, report text or bytes, or binary stream
+    :type file: ReportInput
+    :param split: function taking a text and whether it is the whole file,
+        returning the complete records in it
+    :type split: Callable[[str, bool], list]
+    :param count: number of records needed
+    :type count: int
+    :param chunk_size: characters read by the first pass, defaults to
+        READ_CHUNK_SIZE
+    :type chunk_size: int, optional
+    :return: at least count records, or every record of a shorter file
+    :rtype: list
+    """
+    # a stream can only be read once, the prefixes are read from its bytes
+    file = buffer_input(file)
+    size = chunk_size
+    while True:
+        text, complete = read_prefix(file, size)
+        records = split(text, complete)
+        if complete or len(records) >= count:
+            return records
+        size *= 2
+
+
+def select_records(
+    records: list, limit: int | None = None, sample: int | None = None
+) -> list:
+    """
+    Pick every sample-th record, then the first limit of those.
+
+    :param records: records in file order
+    :type records: list
+    :param limit: maximum number of records, defaults to all
+    :type limit: int | None, optional
+    :param sample: step between picked records, defaults to every record
+    :type sample: int | None, optional
+    :return: the picked records
+    :rtype: list
+    """
+    if sample is not None:
+        records = records[::sample]
+    if limit is not None:
+        records = records[:limit]
+    return records
+
+
 def regex_substitution(text: str, substitutions: list[tuple]) -> str:
-    # Regex patterns to match headers and blank lines
-    common_cleanup_regex = [
-        (r"^\s*\n", ""),
-        (r"[^\x00-\x7F]+", ""),
-        (r"^-+\n", ""),
-        (r"^\*LIVE\*.*\n.*\n.*", ""),
-        (r"^\*LSTD\*.*\n.*\n.*", ""),
-        (r"^\*TEST\*.*\n.*\n.*", ""),
-        (r"^\*TSTD\*.*\n.*\n.*", ""),
-        (r"DATE:.*\n", ""),
-        (r"USER:.*\n", ""),
-    ]
-    substitutions = common_cleanup_regex + substitutions
+    substitutions = COMMON_CLEANUP_PATTERNS + substitutions
     # Apply all match subtitutions to the text
     for regex, replacement in substitutions:
         text = re.sub(regex, replacement, text, flags=re.MULTILINE)
     return text
 
 
+@dataclass
+class LongTable:
+    """
+    Parsed records in long (record, heading, value) format. Only the headings
+    present in each record are stored, so sparse reports with many headings
+    take a fraction of the memory of the wide layout.
+
+    :param record_ids: record number of each value
+    :param heading_ids: position in headings of each value's heading
+    :param values: stripped text of each value
+    :param headings: heading names
+    :param n_records: number of records that were tokenized, including
+        records without any headings
+    """
+
+    record_ids: np.ndarray
+    heading_ids: np.ndarray
+    values: np.ndarray
+    headings: list[str]
+    n_records: int
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+
+@dataclass(frozen=True)
+class RecordFilter:
+    """
+    Record predicate pushed down into a parser's tokenizer: only records
+    whose value under heading passes test are parsed. Headings are as they
+    appear in the report, e.g. "Mnemonic", and records without the heading
+    are skipped.
+
+    :param heading: heading whose value is tested, ideally the record ID or
+        another field near the start of the record
+    :param test: function taking the stripped value and returning whether
+        the record is kept
+    """
+
+    heading: str
+    test: Callable[[str], bool]
+
+
+def record_value(
+    record: str, heading: str, heading_regex: re.Pattern
+) -> str | None:
+    """
+    Get the value of the first occurrence of a heading in a record, scanning
+    only as far as the heading that follows it.
+    """
+    matches = heading_regex.finditer(record)
+    for match in matches:
+        if match.group() == heading:
+            following = next(matches, None)
+            end = following.start() if following else len(record)
+            return record[match.end() : end].strip()
+    return None
+
+
+def record_passes(
+    record: str, where: list[RecordFilter], heading_regex: re.Pattern
+) -> bool:
+    for record_filter in where:
+        value = record_value(record, record_filter.heading, heading_regex)
+        if value is None or not record_filter.test(value):
+            return False
+    return True
+
+
+def record_filter(
+    where: list[RecordFilter] | None, headings: list[str]
+) -> Callable[[str], bool] | None:
+    """
+    Get a test of a record's text against record filters, as records_to_long
+    applies them, so a preview can pick records that pass them.
+
+    :param where: filters every kept record passes
+    :type where: list[RecordFilter] | None
+    :param headings: list of headings contained within each record
+    :type headings: list[str]
+    :return: the test, or None without filters
+    :rtype: Callable[[str], bool] | None
+    """
+    if not where:
+        return None
+    heading_regex = re.compile("|".join(re.escape(key) for key in headings))
+    return lambda record: record_passes(record, where, heading_regex)
+
+
+def filter_rows(df: pd.DataFrame, where: list[RecordFilter]) -> pd.DataFrame:
+    """
+    Apply record filters to the rows of a dataframe, for parsers that read
+    their input as a whole table rather than record by record. Rows missing
+    the filtered value are dropped.
+
+    :param df: parsed dataframe
+    :type df: pd.DataFrame
+    :param where: filters every kept row passes
+    :type where: list[RecordFilter]
+    :return: the rows passing every filter
+    :rtype: pd.DataFrame
+    :raises ValueError: if a filter's heading isn't a column
+    """
+    keep = np.ones(len(df), dtype=bool)
+    for record_filter in where:
+        if record_filter.heading not in df.columns:
+            raise ValueError(
+                f"Unknown heading {record_filter.heading!r} in record filter"
+            )
+        # the first column of a repeated heading, as in record_value
+        values = df.loc[:, df.columns == record_filter.heading].iloc[:, 0]
+        keep &= np.array(
+            [
+                pd.notna(value) and record_filter.test(str(value).strip())
+                for value in values
+            ],
+            dtype=bool,
+        )
+    return df[keep]
+
+
+def tokenize_record(
+    record: str,
+    heading_regex: re.Pattern,
+    heading_ids: dict[str, int],
+    wanted: set[int] | None = None,
+) -> list[tuple[int, str]]:
+    """
+    Get the (heading id, value) pair of every heading in a record. A value
+    runs from the end of its heading to the start of the next heading or the
+    end of the record. Every heading still bounds the values, but only the
+    values of wanted heading ids are captured.
+    """
+    matches = list(heading_regex.finditer(record))
+    ends = [match.start() for match in matches[1:]] + [len(record)]
+    tokens = list()
+    for match, end in zip(matches, ends):
+        heading_id = heading_ids[match.group()]
+        if wanted is None or heading_id in wanted:
+            tokens.append((heading_id, record[match.end() : end].strip()))
+    return tokens
+
+
+def records_to_long(
+    records: list[str],
+    headings: list[str],
+    where: list[RecordFilter] | None = None,
+    columns: list[str] | None = None,
+    threads: int | None = 1,
+) -> LongTable:
+    """
+    Tokenize each record into the value following every heading it contains.
+
+    :param records: text of each record
+    :type records: list[str]
+    :param headings: list of headings contained within each record
+    :type headings: list[str]
+    :param where: filters checked before a record is tokenized, records
+        failing any of them get no values, defaults to None
+    :type where: list[RecordFilter] | None, optional
+    :raises ValueError: if a filter's heading isn't in headings
+    :param columns: only capture the values of these headings, defaults to
+        all headings
+    :type columns: list[str] | None, optional
+    :param threads: threads tokenizing the records on a free-threaded
+        interpreter, None for one per CPU, defaults to 1
+    :type threads: int | None, optional
+    :return: long format table of every heading value
+    :rtype: LongTable
+    """
+    heading_regex = re.compile("|".join(re.escape(key) for key in headings))
+    heading_ids = {heading: i for i, heading in enumerate(headings)}
+    for record_filter in where or []:
+        if record_filter.heading not in heading_ids:
+            raise ValueError(
+                f"Unknown heading {record_filter.heading!r} in record filter"
+            )
+    wanted = None
+    if columns is not None:
+        wanted = {heading_ids[h] for h in columns if h in heading_ids}
+
+    def tokenize_records(chunk: list[tuple[int, str]]) -> tuple[list, ...]:
+        record_ids = list()
+        value_heading_ids = list()
+        values = list()
+        for record_id, record in chunk:
+            if where and not record_passes(record, where, heading_regex):
+                continue
+            tokens = tokenize_record(
+                record, heading_regex, heading_ids, wanted
+            )
+            for heading_id, value in tokens:
+                record_ids.append(record_id)
+                value_heading_ids.append(heading_id)
+                values.append(value)
+        return record_ids, value_heading_ids, values
+
+    record_ids = list()
+    value_heading_ids = list()
+    values = list()
+    for chunk_record_ids, chunk_heading_ids, chunk_values in map_chunks(
+        tokenize_records, list(enumerate(records)), threads
+    ):
+        record_ids.extend(chunk_record_ids)
+        value_heading_ids.extend(chunk_heading_ids)
+        values.extend(chunk_values)
+
+    return LongTable(
+        record_ids=np.array(record_ids, dtype=np.int64),
+        heading_ids=np.array(value_heading_ids, dtype=np.int32),
+        values=np.array(values, dtype=object),
+        headings=list(headings),
+        n_records=len(records),
+    )
+
+
+def text_data_to_long(
+    text: str,
+    id: str,
+    headings: list[str],
+    threads: int | None = 1,
+) -> LongTable:
+    """
+    Converts a string into long format records by splitting it into chunks
+    based on an ID and capturing the value after each heading in a chunk.
+
+    :param text: string to convert
+    :type text: str
+    :param id: ID string to group the data by
+    :type id: str
+    :param headings: list of headings contained within each group
+    :type headings: list[str]
+    :param threads: threads tokenizing the groups on a free-threaded
+        interpreter, None for one per CPU, defaults to 1
+    :type threads: int | None, optional
+    :return: long format table with one row per heading value
+    :rtype: LongTable
+    """
+    # split the data into groups based on ID
+    groups = re.split(f"(?={id})", text)
+    return records_to_long(groups, headings, threads=threads)
+
+
+def long_to_wide(
+    table: LongTable,
+    columns: list[str] | None = None,
+    drop_empty: bool = True,
+) -> pd.DataFrame:
+    """
+    Pivot a long format table to one row per record and one column per
+    heading. If a heading occurs more than once in a record the last value is
+    kept. Columns are ordered by first appearance in the text.
+
+    :param table: long format table
+    :type table: LongTable
+    :param columns: only pivot these headings, defaults to all headings
+    :type columns: list[str] | None, optional
+    :param drop_empty: drop records without any values, defaults to True
+    :type drop_empty: bool, optional
+    :return: wide dataframe indexed by record number
+    :rtype: pd.DataFrame
+    """
+    record_ids = table.record_ids
+    heading_ids = table.heading_ids
+    values = table.values
+    if columns is not None:
+        wanted = np.isin(
+            heading_ids,
+            [i for i, h in enumerate(table.headings) if h in set(columns)],
+        )
+        record_ids = record_ids[wanted]
+        heading_ids = heading_ids[wanted]
+        values = values[wanted]
+
+    # order columns by first appearance, as building from a list of dicts does
+    present, first_seen = np.unique(heading_ids, return_index=True)
+    present = present[np.argsort(first_seen)]
+    column_position = np.full(len(table.headings), -1, dtype=np.int64)
+    column_position[present] = np.arange(len(present))
+
+    if drop_empty:
+        rows = np.unique(record_ids)
+    else:
+        rows = np.arange(table.n_records)
+    row_position = np.searchsorted(rows, record_ids)
+
+    # keep the last value of any heading repeated within a record
+    cell = row_position * max(len(present), 1) + column_position[heading_ids]
+    _, last_seen = np.unique(cell[::-1], return_index=True)
+    last_seen = len(cell) - 1 - last_seen
+
+    wide = np.full((len(rows), len(present)), np.nan, dtype=object)
+    wide[row_position[last_seen], column_position[heading_ids[last_seen]]] = (
+        values[last_seen]
+    )
+    return pd.DataFrame(
+        wide,
+        index=pd.Index(rows) if drop_empty else None,
+        columns=[table.headings[i] for i in present],
+    )
+
+
+def heading_order(records: list[str], headings: list[str]) -> list[str]:
+    """
+    Get the headings found in the records in order of first appearance, the
+    order long_to_wide gives its columns, without tokenizing the records.
+
+    :param records: text of each record
+    :type records: list[str]
+    :param headings: list of headings contained within each record
+    :type headings: list[str]
+    :return: the headings found
+    :rtype: list[str]
+    """
+    heading_regex = re.compile("|".join(re.escape(key) for key in headings))
+    found = dict()
+    for record in records:
+        for match in heading_regex.finditer(record):
+            found.setdefault(match.group())
+        if len(found) == len(headings):
+            break
+    return list(found)
+
+
+def long_to_rows(
+    table: LongTable, heading_order: list[str] | None = None
+) -> pd.DataFrame:
+    """
+    Convert a long format table to the long export layout without pivoting
+    it, with one row per record and heading. If a heading occurs more than
+    once in a record the last value is kept, as long_to_wide does.
+
+    :param table: long format table
+    :type table: LongTable
+    :param heading_order: order of the headings within each record, headings
+        not in it come last, defaults to the order of table.headings
+    :type heading_order: list[str] | None, optional
+    :return: dataframe of Record, Heading and Value, ordered by record and
+        heading
+    :rtype: pd.DataFrame
+    """
+    cell = table.record_ids * len(table.headings) + table.heading_ids
+    _, last_seen = np.unique(cell[::-1], return_index=True)
+    keep = len(cell) - 1 - last_seen
+    rank = np.arange(len(table.headings))
+    if heading_order is not None:
+        order = {heading: i for i, heading in enumerate(heading_order)}
+        rank = np.array(
+            [order.get(h, len(order)) for h in table.headings], dtype=np.int64
+        )
+    keep = keep[
+        np.lexsort((rank[table.heading_ids[keep]], table.record_ids[keep]))
+    ]
+    return pd.DataFrame(
+        {
+            "Record": table.record_ids[keep],
+            "Heading": np.array(table.headings, dtype=object)[
+                table.heading_ids[keep]
+            ],
+            "Value": table.values[keep],
+        }
+    )
+
+
+def long_to_records(table: LongTable) -> list[list[dict]]:
+    """
+    Get the row of each record of a long format table as a dict of heading
+    to value, in the order the headings appear in the record, as file_to_rows
+    takes them. Records without any values get no row, and the last value
+    of a repeated heading is kept, as long_to_wide does.
+
+    :param table: long format table
+    :type table: LongTable
+    :return: the rows of each record
+    :rtype: list[list[dict]]
+    """
+    rows = [dict() for _ in range(table.n_records)]
+    for record_id, heading_id, value in zip(
+        table.record_ids.tolist(), table.heading_ids.tolist(), table.values
+    ):
+        rows[record_id][table.headings[heading_id]] = value
+    return [[row] if row else list() for row in rows]
+
+
+def long_to_dataframe(table: LongTable) -> pd.DataFrame:
+    """
+    Convert a long format table to a three column dataframe.
+
+    :param table: long format table
+    :type table: LongTable
+    :return: dataframe of Record, Heading and Value
+    :rtype: pd.DataFrame
+    """
+    return pd.DataFrame(
+        {
+            "Record": table.record_ids,
+            "Heading": pd.Categorical.from_codes(
+                table.heading_ids, categories=table.headings
+            ),
+            "Value": table.values,
+        }
+    )
+
+
+def dataframe_to_long(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Convert any parsed dataframe to long format, with one row per non-empty
+    cell. Row labels are kept as the leading columns, and the levels of
+    MultiIndex column labels are joined into one Heading string.
+
+    :param df: wide dataframe
+    :type df: pd.DataFrame
+    :return: dataframe of the row labels, Heading and Value
+    :rtype: pd.DataFrame
+    """
+    df = df.copy()
+    df.index.names = [
+        (
+            name
+            if name is not None
+            else "Record" if df.index.nlevels == 1 else f"Record {i}"
+        )
+        for i, name in enumerate(df.index.names)
+    ]
+    # flatten by position, as some parsers output duplicated column labels
+    values = df.to_numpy(dtype=object).ravel()
+    keep = pd.notna(values)
+    rows = np.repeat(np.arange(len(df)), df.shape[1])[keep]
+    columns = np.tile(np.arange(df.shape[1]), len(df))[keep]
+    long = df.index[rows].to_frame(index=False)
+    headings = df.columns.to_numpy()
+    if df.columns.nlevels > 1:
+        headings = np.array(
+            [" ".join(str(level) for level in label) for label in headings],
+            dtype=object,
+        )
+    long["Heading"] = headings[columns]
+    long["Value"] = values[keep]
+    return long
+
+
 def text_data_to_dataframe(
-    text: str, id: str, headings: list[str]
+    text: str, id: str, headings: list[str], threads: int | None = 1
 ) -> pd.DataFrame:
     """
     Converts a string into a dataframe through use of a regex to split the string into chunks based on an ID and then by applying a regex search using a list of headings contained within the text.
@@ -53,30 +845,15 @@ def text_data_to_dataframe(
     :type id: str
     :param headings: list of headings contained within each group
     :type headings: list[str]
+    :param threads: threads tokenizing the groups on a free-threaded
+        interpreter, None for one per CPU, defaults to 1
+    :type threads: int | None, optional
     :return: dataframe containing each ID as a row and the list of headings as columns
     :rtype: pd.DataFrame
     """
-    # split the data into groups based on ID
-    groups = re.split(f"(?={id})", text)
-
-    heading_pattern = "|".join(re.escape(key) for key in headings)
-    all_entries = list()
-    for group in groups:
-        # capture data to a dict using a list of headings
-        split_data = re.split(r"(" + heading_pattern + r")", group)
-        string_dict = dict()
-        current_key = None
-        for part in split_data:
-            if part in headings:
-                current_key = part
-            elif current_key:
-                string_dict[current_key] = part.strip()
-                current_key = None
-        all_entries.append(string_dict)
-
-    df = pd.DataFrame(all_entries)
-    df.dropna(how="all", axis="index", inplace=True)
-    return df
+    return long_to_wide(
+        text_data_to_long(text=text, id=id, headings=headings, threads=threads)
+    )
 
 
 def debug_test_current_data(text: str, error_flag: bool = False) -> None:
@@ -186,11 +963,8 @@ def infer_table_structure(
     content_lines = lines[1:]
     longest_line_length = max([len(line) for line in lines])
 
-    # Match words with optional spaces between them, followed by at least 2 whitespaces or the last heading
-    pattern = r"\S+(?: \S+)*(?=\s{2,})|\S+(?: \S+)*$"
-
     # This will match each heading as a sequence of non-whitespace characters
-    headings = re.finditer(pattern, header_line)
+    headings = re.finditer(HEADING_REGEX, header_line)
 
     # Get the start index for each heading
     column_starts = [match.start() for match in headings]
@@ -0,0 +1,139 @@
+import bz2
+import gzip
+import io
+import lzma
+import os
+from pathlib import Path
+from typing import IO, BinaryIO
+
+# magic bytes at the start of each supported compressed format
+COMPRESSIONS = {
+    "gzip": (b"\x1f\x8b", gzip.open, ".gz"),
+    "bz2": (b"BZh", bz2.open, ".bz2"),
+    "xz": (b"\xfd7zXZ\x00", lzma.open, ".xz"),
+}
+MAGIC_BYTES = max(len(magic) for magic, _, _ in COMPRESSIONS.values())
+
+
+class ReportText(str):
+    """
+    Text of a report held in memory, e.g. received from another service. A
+    plain str is the path of a report file.
+    """
+
+
+# a report given as a path, as its text or bytes, or as a binary stream
+ReportInput = Path | str | ReportText | bytes | BinaryIO
+
+
+def is_path(file: ReportInput) -> bool:
+    # a plain str is a path, report text is wrapped in ReportText
+    return isinstance(file, os.PathLike) or (
+        isinstance(file, str) and not isinstance(file, ReportText)
+    )
+
+
+def buffer_input(file: ReportInput) -> Path | str | bytes:
+    """
+    Read a binary stream into bytes, so the input can be opened more than
+    once (e.g. to classify it and then parse it). Other inputs are returned
+    unchanged.
+    """
+    if isinstance(file, (str, bytes)) or is_path(file):
+        return file
+    return file.read()
+
+
+def head_compression(head: bytes) -> str | None:
+    for compression, (magic, _, _) in COMPRESSIONS.items():
+        if head.startswith(magic):
+            return compression
+    return None
+
+
+def detect_compression(file: Path | str | ReportText | bytes) -> str | None:
+    """
+    Get the compression format of a file from its first bytes, so archives
+    are recognised whatever their file name.
+
+    :param file: input file, or report text or bytes
+    :type file: Path | str | ReportText | bytes
+    :return: "gzip", "bz2" or "xz", or None for an uncompressed file or text
+    :rtype: str | None
+    """
+    if isinstance(file, ReportText):
+        return None
+    if isinstance(file, bytes):
+        return head_compression(file[:MAGIC_BYTES])
+    with open(file, "rb") as f:
+        return head_compression(f.read(MAGIC_BYTES))
+
+
+def open_input(file: ReportInput, mode: str = "r") -> IO:
+    """
+    Open an input for reading, decompressing gzip, bz2 and xz content as it
+    is read. Text, bytes and streams are read in memory, so nothing is
+    written to disk. A stream is read from its current position and left
+    open; use buffer_input to read it more than once.
+
+    :param file: input file, report text or bytes, or binary stream,
+        compressed or not
+    :type file: ReportInput
+    :param mode: "r" for text or "rb" for bytes, defaults to "r"
+    :type mode: str, optional
+    :return: file object reading the uncompressed content
+    :rtype: IO
+    """
+    if isinstance(file, ReportText):
+        if "b" in mode:
+            return io.BytesIO(file.encode())
+        # translate line endings like open does
+        return io.StringIO(file, newline=None)
+
+    if is_path(file):
+        compression = detect_compression(file)
+        if compression is None:
+            return open(file, mode)
+        source = file
+    elif isinstance(file, bytes):
+        compression = detect_compression(file)
+        source = io.BytesIO(file)
+    else:
+        # peek at the magic bytes without consuming them
+        source = io.BufferedReader(UnclosedStream(file))
+        compression = head_compression(source.peek(MAGIC_BYTES))
+
+    if compression is None:
+        return source if "b" in mode else io.TextIOWrapper(source)
+    open_compressed = COMPRESSIONS[compression][1]
+    # the compression modules default to bytes, "rt" reads text
+    return open_compressed(source, mode if "b" in mode else "rt")
+
+
+class UnclosedStream(io.RawIOBase):
+    """
+    Reads from a caller's binary stream without closing it when the file
+    objects wrapping it are closed.
+    """
+
+    def __init__(self, stream: BinaryIO) -> None:
+        self.stream = stream
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        data = self.stream.read(len(buffer))
+        buffer[: len(data)] = data
+        return len(data)
+
+
+def inner_name(file: Path) -> str:
+    """
+    Get the name of the file inside a compressed file, e.g. "conflicts.txt"
+    for "conflicts.txt.gz". Other file names are returned unchanged.
+    """
+    for _, _, suffix in COMPRESSIONS.values():
+        if file.name.endswith(suffix):
+            return file.name[: -len(suffix)]
+    return file.name
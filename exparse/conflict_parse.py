@@ -1,14 +1,124 @@
-from pathlib import Path
-
+import numpy as np
 import pandas as pd
 
 from common_functions import (
-    file_to_dataframe,
+    RecordFilter,
+    file_to_rows,
+    id_splitter,
+    long_to_records,
+    long_to_wide,
     parse_fixed_width_table_from_text,
+    record_filter,
+    records_to_long,
+    rows_to_frame,
 )
+from compressed_input import ReportInput
+from free_threading import map_chunks
+from parser_registry import register_parser
+from record_cache import RecordCache
+from schema import Column, apply_schema
+
+SCHEMA = [
+    Column("Name", required=True),
+    Column("Active", "boolean"),
+    Column("Use Dose Range Checking", "boolean"),
+    Column("Dose Range Check Requires Override", "boolean"),
+    Column("Restrict PRN Dose Checks", "boolean"),
+    Column("Restrict Frequency Checks", "boolean"),
+    Column("Allowed Low Rounding Percent", "numeric"),
+    Column("Allowed Max Rounding Percent", "numeric"),
+    Column("Restrict General Warnings", "boolean"),
+    Column("Allow Interaction Auto-Override Acute", "boolean"),
+    Column("Check Against DC'd Orders", "boolean"),
+    Column("DC'd Within How Many Days", "numeric"),
+    Column("Check Interactions Against Home Medications", "boolean"),
+    Column("Check Duplicates Against Home Medications", "boolean"),
+    Column("Stop Checking Home Medications After LOS Days", "numeric"),
+    Column("Exclude Medications on Other Visits after LOS Days", "numeric"),
+    Column("Hide Comments When Not Required", "boolean"),
+    Column("Allow Interaction Auto-Override Amb", "boolean"),
+    Column("Check Supplemental Allergens", "boolean"),
+    Column("Check Immunization Conflicts", "boolean"),
+    Column("Immunization Conflict Requires Override", "boolean"),
+    Column("Check Immunization Schedule Conflicts", "boolean"),
+    Column("Immunization Schedule Conflict Requires Override", "boolean"),
+    Column("Check Interactions for Not Given", "boolean"),
+]
+PATTERNS = [
+    ("Preferences", ""),
+    ("Immunizations", ""),
+    ("Dose Checking", ""),
+    ("Inpt/OBS Visits", ""),
+    ("Allergy Checking", ""),
+    (
+        "Ignore Pharmacogenomics",
+        "Ignore Pharmacogenomic",
+    ),
+    ("Pharmacogenomics", ""),
+    (
+        r"PRN Checks\n Require Override",
+        "Dose Range Check Requires Override",
+    ),
+    (
+        r"Restrict Frequency Checks\n Require Override",
+        "Restrict Frequency Checks\n Dose Range Check Requires Override",
+    ),
+    # "\s+(value)?\s+" is written as "\s+value\s+|\s{2,}" throughout, so
+    # the two whitespace runs can't split a long gap in every possible way
+    (
+        r"(Stop Checking Home Medications After LOS Days(?:\s+\d+\s+|\s{2,}))Require Override",
+        r"\1Immunization Conflict Requires Override",
+    ),
+    (
+        r"(Hide Comments When Not Required(?:\s+(?:\d+|Yes|No)\s+|\s{2,}))Require Override",
+        r"\1Immunization Schedule Conflict Requires Override",
+    ),
+    (
+        r"Restrict Dose Type \(Inpatient\)\s+Restrict Dose Type \(Outpatient\)",
+        "Restrict Dose Type",
+    ),
+    (r"Visit Medications(?:\s+\d+\s+|\s{2,})Discharge Home Medications", ""),
+    (
+        r"(Problem Status to Include in Screening\n)(\s+)(Acute)",
+        lambda m: f"{m.group(1)}Status{' ' * (len(m.group(2)) - len('Status'))}{m.group(3)}",
+    ),
+    (
+        r"(Schedule)(\s+)(Dose Type)(\s+)(Default)(\s+)(Dose Type)(\s+)(Default)",
+        r"\1\2\3\4\5\6Outpatient \7\8Outpatient \9",
+    ),
+    (
+        r"(Allow Interaction Auto-Override)(\s+(?:\d+|Yes|No)\s+|\s{2,})(Allow Interaction Auto-Override)",
+        r"\1 Acute\2\3 Amb",
+    ),
+]
+ACTIVE_REGEX = r"(?i)active\s+(Yes|No)$"
+# start of each record in the raw report, keyed by its Mnemonic
+RECORD_KEY = r"^Mnemonic[ \t]+(\S+)"
 
 
-def parse_conflicts(file: Path) -> pd.DataFrame:
+@register_parser(
+    "conflicts",
+    signatures=[
+        r"Use Dose Range Checking",
+        r"Drug Screening Conflicts",
+        r"Allow Interaction Auto-Override",
+    ],
+    filename_hint="conflict",
+    schema=SCHEMA,
+    patterns=PATTERNS + [ACTIVE_REGEX],
+    incremental=True,
+    record_key=RECORD_KEY,
+    threaded=True,
+)
+def parse_conflicts(
+    file: ReportInput,
+    record_cache: RecordCache | None = None,
+    limit: int | None = None,
+    sample: int | None = None,
+    where: list[RecordFilter] | None = None,
+    columns: list[str] | None = None,
+    threads: int | None = 1,
+) -> pd.DataFrame:
     heading_groups = [
         [
             "Main",
@@ -81,51 +191,6 @@ def parse_conflicts(file: Path) -> pd.DataFrame:
             ],
         ],
     ]
-    regex_replacements = [
-        ("Preferences", ""),
-        ("Immunizations", ""),
-        ("Dose Checking", ""),
-        ("Inpt/OBS Visits", ""),
-        ("Allergy Checking", ""),
-        (
-            "Ignore Pharmacogenomics",
-            "Ignore Pharmacogenomic",
-        ),
-        ("Pharmacogenomics", ""),
-        (
-            r"PRN Checks\n Require Override",
-            "Dose Range Check Requires Override",
-        ),
-        (
-            r"Restrict Frequency Checks\n Require Override",
-            "Restrict Frequency Checks\n Dose Range Check Requires Override",
-        ),
-        (
-            r"(Stop Checking Home Medications After LOS Days\s+)(\d+)?(\s+)Require Override",
-            r"\1\2\3Immunization Conflict Requires Override",
-        ),
-        (
-            r"(Hide Comments When Not Required\s+)(\d+|Yes|No)?(\s+)Require Override",
-            r"\1\2\3Immunization Schedule Conflict Requires Override",
-        ),
-        (
-            r"Restrict Dose Type \(Inpatient\)\s+Restrict Dose Type \(Outpatient\)",
-            "Restrict Dose Type",
-        ),
-        (r"(Visit Medications\s+)(\d+)?(\s+)Discharge Home Medications", ""),
-        (
-            r"(Problem Status to Include in Screening\n)(\s+)(Acute)",
-            lambda m: f"{m.group(1)}Status{' ' * (len(m.group(2)) - len('Status'))}{m.group(3)}",
-        ),
-        (
-            r"(Schedule)(\s+)(Dose Type)(\s+)(Default)(\s+)(Dose Type)(\s+)(Default)",
-            r"\1\2\3\4\5\6Outpatient \7\8Outpatient \9",
-        ),
-        (
-            r"(Allow Interaction Auto-Override)(\s+)(\d+|Yes|No)?(\s+)(Allow Interaction Auto-Override)",
-            r"\1 Acute\2\3\4\5 Amb",
-        ),
-    ]
 
     headings_to_extract = [
         item for _, group in heading_groups for item in group
@@ -134,55 +199,95 @@ def parse_conflicts(file: Path) -> pd.DataFrame:
         item: parent for parent, group in heading_groups for item in group
     }
 
-    df = file_to_dataframe(
-        file=file,
-        headings=headings_to_extract,
-        id="Mnemonic",
-        replace=regex_replacements,
-    )
+    # the Active status is extracted from the Name
+    capture = None if columns is None else ["Mnemonic", "Name"] + list(columns)
+    subtables = [
+        ("Drug Screening Conflicts", []),
+        ("Drug Screening Warnings", []),
+        ("Problem Status to Include in Screening", []),
+        (
+            "Restrict Dose Type",
+            ["Outpatient Dose Type", "Outpatient Default"],
+        ),
+        ("Restrict Dose Type", ["Dose Type", "Default"]),
+    ]
+    subtable_columns = {column for column, _ in subtables}
+    heading_parents["Active"] = "Main"
 
-    # set row index to Mnemonic
-    df.set_index("Mnemonic", inplace=True)
-    # Extract Active status from Name column
-    df["Active"] = df["Name"].str.extract(
-        r"(?i)active\s+(Yes|No)$", expand=True
-    )
-    # Remove the "active Yes/No" part from the original "Name" column
-    df["Name"] = (
-        df["Name"]
-        .str.replace(r"(?i)active\s+(Yes|No)$", "", regex=True)
-        .str.strip()
-    )
+    def parse(records: list[str]) -> list[list[dict]]:
+        table = records_to_long(
+            records,
+            headings_to_extract,
+            where=where,
+            columns=capture,
+            threads=threads,
+        )
+        df = long_to_wide(table)
+        rows = [list() for _ in records]
+        if df.empty:
+            return rows
 
-    df, new_column_parents = parse_subtables(
-        df,
-        [
-            ("Drug Screening Conflicts", []),
-            ("Drug Screening Warnings", []),
-            ("Problem Status to Include in Screening", []),
-            (
-                "Restrict Dose Type",
-                ["Outpatient Dose Type", "Outpatient Default"],
-            ),
-            ("Restrict Dose Type", ["Dose Type", "Default"]),
-        ],
-    )
+        # Extract Active status from Name column
+        names = df.get("Name", pd.Series(np.nan, index=df.index, dtype=object))
+        active = names.str.extract(ACTIVE_REGEX, expand=False)
+        # Remove the "active Yes/No" part from the original "Name" column
+        names = names.str.replace(ACTIVE_REGEX, "", regex=True).str.strip()
+        # projected columns may leave out some of the subtables
+        flattened = parse_subtables(
+            df,
+            [(column, drop) for column, drop in subtables if column in df],
+            threads,
+        )
 
-    # add additional headings that were created during runtime
-    heading_parents.update(
-        [
-            ("Active", "Main"),
-        ]
-        + new_column_parents
+        # each row keeps its headings in the order of the record's text, so
+        # the columns come out in order of first appearance
+        values = long_to_records(table)
+        for position, name, active_value, subtable_values in zip(
+            df.index, names, active, flattened
+        ):
+            row = {
+                (heading_parents[heading], heading): value
+                for heading, value in values[position][0].items()
+                if heading not in subtable_columns
+            }
+            if pd.notna(name):
+                row[("Main", "Name")] = name
+            if pd.notna(active_value):
+                row[("Main", "Active")] = active_value
+            row.update(subtable_values)
+            rows[position].append(row)
+        return rows
+
+    if where or columns is not None:
+        # cached rows are whole records, parsed without filters
+        record_cache = None
+    rows = file_to_rows(
+        file,
+        id_splitter("Mnemonic", PATTERNS),
+        parse,
+        headings_to_extract,
+        record_cache=record_cache,
+        limit=limit,
+        sample=sample,
+        keep=record_filter(where, headings_to_extract),
     )
+    df = rows_to_frame(rows)
+    if df.empty:
+        # no record passed the record filters, keep the declared parameters
+        df = pd.DataFrame(
+            columns=[
+                (heading_parents[heading], heading)
+                for heading in ["Mnemonic"]
+                + [column.name for column in SCHEMA]
+            ]
+        )
 
-    # Create a MultiIndex from heading_parents, checking if the heading is in use
-    multi_index = pd.MultiIndex.from_tuples(
-        [(heading_parents[column], column) for column in df.columns],
-        names=["Section", "Parameter"],
+    # set row index to Mnemonic
+    df = df.set_index(("Main", "Mnemonic")).rename_axis("Mnemonic")
+    # set columns to use a (Section, Parameter) multi-index
+    df.columns = pd.MultiIndex.from_tuples(
+        df.columns, names=["Section", "Parameter"]
     )
-    # set columns to use multi-index
-    df.columns = multi_index
     # sort columns by Section using a predefined order
     section_order = [
         "Main",
@@ -199,64 +304,74 @@ def parse_conflicts(file: Path) -> pd.DataFrame:
     ]
     df = df.reindex(
         columns=pd.MultiIndex.from_tuples(
-            sorted(df.columns, key=lambda x: section_order.index(x[0])),
+            sorted(
+                df.columns,
+                # Active was added after the headings of the report
+                key=lambda x: (
+                    section_order.index(x[0]),
+                    x == ("Main", "Active"),
+                ),
+            ),
             names=["Section", "Parameter"],
         )
     )
     # transpose dataframe
     df = df.T
+    # the schema names the Parameter rows of the transposed layout
+    df = apply_schema(df, SCHEMA, axis="index")
 
     # debug_test_dataframe(df, show_index=True)
     return df
 
 
 def parse_subtables(
-    df: pd.DataFrame, columns: list[tuple[str, list[str]]]
-) -> tuple[pd.DataFrame, list[tuple[str, str]]]:
+    df: pd.DataFrame,
+    columns: list[tuple[str, list[str]]],
+    threads: int | None = 1,
+) -> list[dict]:
     """
-    Examines subtables present in the specified columns and flattens them into the main DataFrame. Flattening is done by prefixing headings in each column with the value in column 1.
+    Examines subtables present in the specified columns and flattens them. Flattening is done by prefixing headings in each column with the value in column 1.
 
     :param df: Dataframe containing the main data
     :type df: pd.DataFrame
     :param columns: Columns containing subtables to be flattened and subcolumns to be omitted
     :type columns: list[str]
-    :return: Tuple containing the updated DataFrame and a list pairings of new columns to their parent columns
-    :rtype: tuple[pd.DataFrame, list[tuple[str, str]]]
+    :param threads: threads parsing the rows' subtables on a free-threaded
+        interpreter, None for one per CPU, defaults to 1
+    :type threads: int | None, optional
+    :return: the flattened values of each row, keyed by the subtable's column
+        and the new column's name
+    :rtype: list[dict]
     """
-    # Initialize a list to store flattened data
-    flattened_data = []
-    new_parent_pairings = []
-    cols_to_drop = []
-    for _, row in df.iterrows():
-        flattened_row = {df.index.name: row.name}
-        for column, sub_cols_to_drop in columns:
-            cols_to_drop.append(column)
-            subtable_text = str(row[column])
 
-            # Parse subtable into a DataFrame
-            parsed_df = parse_fixed_width_table_from_text(
-                table_text=subtable_text,
-                exclude_columns=sub_cols_to_drop,
-            )
+    def flatten_rows(rows: list[tuple]) -> list[dict]:
+        flattened_data = []
+        for _, row in rows:
+            flattened_row = dict()
+            for column, sub_cols_to_drop in columns:
+                subtable_text = str(row[column])
 
-            # Flatten the subtable into a single dictionary
-            for _, sub_row in parsed_df.iterrows():
-                for col in parsed_df.columns[1:]:
-                    # Create a column name by combining first column label with the other headings
-                    flattened_column_name = f"{sub_row.iloc[0]} - {col}"
-                    flattened_row[flattened_column_name] = sub_row[col]
-                    new_parent_pairings.append((flattened_column_name, column))
+                # Parse subtable into a DataFrame
+                parsed_df = parse_fixed_width_table_from_text(
+                    table_text=subtable_text,
+                    exclude_columns=sub_cols_to_drop,
+                )
 
-        flattened_data.append(flattened_row)
+                # Flatten the subtable into a single dictionary
+                for _, sub_row in parsed_df.iterrows():
+                    for col in parsed_df.columns[1:]:
+                        # Create a column name by combining first column label with the other headings
+                        flattened_column_name = f"{sub_row.iloc[0]} - {col}"
+                        flattened_row[(column, flattened_column_name)] = (
+                            sub_row[col]
+                        )
 
-    # Create a DataFrame from the flattened data
-    flattened_df = pd.DataFrame(flattened_data)
+            flattened_data.append(flattened_row)
+        return flattened_data
 
-    # Merge the flattened DataFrame with the main DataFrame
-    final_df = pd.merge(
-        df.drop(columns=cols_to_drop),
-        flattened_df.set_index(df.index.name),
-        left_index=True,
-        right_index=True,
-    )
-    return final_df, new_parent_pairings
+    # each row's subtables are parsed on their own, so rows can be split
+    # across threads
+    flattened_data = []
+    for rows_data in map_chunks(flatten_rows, list(df.iterrows()), threads):
+        flattened_data.extend(rows_data)
+    return flattened_data
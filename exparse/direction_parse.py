@@ -1,11 +1,95 @@
-from pathlib import Path
-
+import numpy as np
 import pandas as pd
 
-from common_functions import file_to_dataframe
+from common_functions import (
+    RecordFilter,
+    file_to_rows,
+    frame_to_rows,
+    id_splitter,
+    long_to_records,
+    long_to_wide,
+    record_filter,
+    records_to_long,
+    rows_to_frame,
+)
+from compressed_input import ReportInput
+from direction_schedule import (
+    KEY_COLUMNS,
+    DirectionSchedules,
+    build_schedules,
+)
+from parser_registry import register_parser
+from record_cache import RecordCache
+from schema import Column, apply_schema
+
+SCHEMA = [
+    Column("Mnemonic", required=True),
+    Column("Active", "boolean"),
+    Column("Use as Equivalent", "boolean"),
+    Column("Average Doses Per Day", "numeric"),
+    Column("Rank", "numeric"),
+    Column("Default Schedule for Meds", "boolean"),
+    Column("Number of Hours to First Dose", "numeric"),
+    Column("Location", "categorical"),
+    Column("Facility", "categorical"),
+    Column("Facility Active", "boolean"),
+    Column("Application", "categorical"),
+    Column("Use Day Schedule from Start Time", "boolean"),
+]
+PATTERNS = [
+    (r"^Facility.*", ""),
+    (r"^\s*\n", ""),
+    ("Day Schedule Display", "DayScheduleDisplay"),
+    # the lazy part ends on a non-space character, so the whitespace before
+    # "Name" is only scanned from the start of each run of spaces
+    (r"(Mnemonic(?:[^\n]*?\S)??)(\s+)Name", r"\1\2Direction Name"),
+    (r"(Location(?:[^\n]*?\S)??)(\s+)Name", r"\1\2Equiv Name"),
+]
+# facility_col_regex = r"\s*(?P<Application>.{13})(?P<UseDayScheduleFromStartTime>.{3})(?P<Time>.{5})(?P<SpecialTime>.*)"
+FACILITY_COL_REGEX = (
+    r"^\s*(?P<Application>[A-Za-z.]+)?"  # Application is optional
+    r"(?:\s+(?P<UseDayScheduleFromStartTime>Yes))?"  # UseDaySchedule is optional
+    r"(?:\s+(?P<Time>[0-9]{2}:[0-9]{2}))?"  # Time is optional
+    r"(?:\s+(?P<SpecialTime>.+))?$"  # SpecialTime is optional
+)
+# columns split out of each facility's detail column
+FACILITY_HEADERS = [
+    # "Facility",
+    # "Active",
+    "Application",
+    "Use Day Schedule from Start Time",
+    "Time",
+    "Special Time",
+]
+FACILITY_COLUMNS = ["Facility", "Facility Active"] + FACILITY_HEADERS
+# start of each record in the raw report, keyed by its Mnemonic
+RECORD_KEY = r"^Mnemonic[ \t]+(\S+)"
 
 
-def parse_directions(file: Path) -> pd.DataFrame:
+@register_parser(
+    "directions",
+    signatures=[
+        r"Day Schedule Display",
+        r"Average Doses Per Day",
+        r"Number of Hours to First Dose",
+    ],
+    filename_hint="direction",
+    schema=SCHEMA,
+    patterns=PATTERNS + [FACILITY_COL_REGEX],
+    incremental=True,
+    record_key=RECORD_KEY,
+    threaded=True,
+)
+def parse_directions(
+    file: ReportInput,
+    with_schedules: bool = False,
+    record_cache: RecordCache | None = None,
+    limit: int | None = None,
+    sample: int | None = None,
+    where: list[RecordFilter] | None = None,
+    columns: list[str] | None = None,
+    threads: int | None = 1,
+) -> pd.DataFrame | tuple[pd.DataFrame, DirectionSchedules]:
     HEADINGS = [
         "Directions",
         "Mnemonic",
@@ -29,83 +113,130 @@ def parse_directions(file: Path) -> pd.DataFrame:
         "MPC",
         "MPD",
     ]
-
-    patterns = [
-        (r"^Facility.*", ""),
-        (r"^\s*\n", ""),
-        ("Day Schedule Display", "DayScheduleDisplay"),
-        (r"(Mnemonic.*?)(\s+)Name", r"\1\2Direction Name"),
-        (r"(Location.*?)(\s+)Name", r"\1\2Equiv Name"),
-    ]
-    df = file_to_dataframe(
-        file=file, id="Mnemonic", headings=HEADINGS, replace=patterns
-    )
-    df.dropna(how="all", axis="index", inplace=True)
-
     facilities = ["MPAC", "MPAD", "MPC", "MPD"]
-    facility_headers = [
-        # "Facility",
-        # "Active",
-        "Application",
-        "Use Day Schedule from Start Time",
-        "Time",
-        "Special Time",
-    ]
 
-    # facility_col_regex = r"\s*(?P<Application>.{13})(?P<UseDayScheduleFromStartTime>.{3})(?P<Time>.{5})(?P<SpecialTime>.*)"
-    facility_col_regex = (
-        r"^\s*(?P<Application>[A-Za-z.]+)?"  # Application is optional
-        r"(?:\s+(?P<UseDayScheduleFromStartTime>Yes))?"  # UseDaySchedule is optional
-        r"(?:\s+(?P<Time>[0-9]{2}:[0-9]{2}))?"  # Time is optional
-        r"(?:\s+(?P<SpecialTime>.+))?$"  # SpecialTime is optional
-    )
+    capture = None
+    if columns is not None:
+        # the facility columns are always captured as they make up the rows
+        capture = ["Mnemonic"] + facilities + list(columns)
+        if with_schedules:
+            capture.append("Day Schedule")
 
-    facilities_df = pd.DataFrame()
-    for facility in facilities:
-        # create separate facility dataframe
-        facility_df = df[["Mnemonic", facility]].copy()
-        # Add facility column
-        facility_df["Facility"] = facility
-        # get Active column
-        facility_df[["Facility Active", facility]] = facility_df[
-            facility
-        ].str.split(" ", n=1, expand=True)
-        # split into separate row for each new line
-        facility_df[facility] = facility_df[facility].str.split("\n")
-        facility_df = facility_df.explode(facility)
-        # pad strings to same length
-        facility_df[facility] = (
-            facility_df[facility].astype(str).str.ljust(100)
+    def parse(records: list[str]) -> list[list[dict]]:
+        table = records_to_long(
+            records, HEADINGS, where=where, columns=capture, threads=threads
         )
-        # split into columns based on regex
-        facility_df[facility_headers] = (
-            # facility_df = (
-            facility_df[facility]
-            .astype(str)
-            .str.extract(facility_col_regex)
-        )
-        # fill in blank applications
-        facility_df["Application"] = facility_df["Application"].ffill()
-        # fill NaN values in Time column
-        facility_df["Time"] = facility_df["Time"].fillna("")
-        # merge time values for each application
-        facility_df["Time"] = facility_df.groupby(["Mnemonic", "Application"])[
-            "Time"
-        ].transform(lambda x: ", ".join(x))
-        # remove duplicate rows
-        facility_df.drop_duplicates(
-            subset=["Mnemonic", "Application"], inplace=True
-        )
-        # add this facility's data to the list of facilities
-        facilities_df = pd.concat([facilities_df, facility_df])
+        df = long_to_wide(table)
+        df.dropna(how="all", axis="index", inplace=True)
+        if df.empty:
+            return [list() for _ in records]
+        # the records parsed together may not all have every facility
+        for facility in facilities:
+            if facility not in df.columns:
+                df[facility] = np.nan
+
+        facilities_df = pd.DataFrame()
+        for facility in facilities:
+            # create separate facility dataframe
+            facility_df = df[[facility]].copy()
+            # rows are grouped by the record they came from
+            facility_df["Record"] = df.index
+            # Add facility column
+            facility_df["Facility"] = facility
+            # get Active column
+            facility_df[["Facility Active", facility]] = facility_df[
+                facility
+            ].str.split(" ", n=1, expand=True)
+            # split into separate row for each new line
+            facility_df[facility] = facility_df[facility].str.split("\n")
+            facility_df = facility_df.explode(facility)
+            # pad strings to same length
+            facility_df[facility] = (
+                facility_df[facility].astype(str).str.ljust(100)
+            )
+            # split into columns based on regex
+            facility_df[FACILITY_HEADERS] = (
+                # facility_df = (
+                facility_df[facility]
+                .astype(str)
+                .str.extract(FACILITY_COL_REGEX)
+            )
+            # fill in blank applications from the lines above in the same
+            # record, so a record parses alike whatever it is parsed with
+            facility_df["Application"] = (
+                facility_df.groupby("Record")["Application"].ffill().to_numpy()
+            )
+            # fill NaN values in Time column
+            facility_df["Time"] = facility_df["Time"].fillna("")
+            # merge time values for each application
+            facility_df["Time"] = facility_df.groupby(
+                ["Record", "Application"], dropna=False
+            )["Time"].transform(lambda x: ", ".join(x))
+            # remove duplicate rows
+            facility_df.drop_duplicates(
+                subset=["Record", "Application"], inplace=True
+            )
+            # add this facility's data to the list of facilities
+            facilities_df = pd.concat([facilities_df, facility_df])
+
+        # remove facility detail column
+        facilities_df.drop(columns=["Record", *facilities], inplace=True)
+        # remove leading and trailing whitespace, the headings' values are
+        # already stripped
+        for col in facilities_df.columns:
+            facilities_df[col] = facilities_df[col].str.strip(" ")
+
+        # merge facility specific data back to main direction data, each row
+        # keeping its headings in the order of the record's text
+        values = long_to_records(table)
+        rows = list()
+        for record_values, record_facilities in zip(
+            values, frame_to_rows(facilities_df, len(records))
+        ):
+            main = {
+                heading: value
+                for row in record_values
+                for heading, value in row.items()
+                if heading not in facilities
+            }
+            rows.append([main | facility for facility in record_facilities])
+        return rows
+
+    if where or columns is not None:
+        # cached rows are whole records, parsed without filters
+        record_cache = None
+    rows = file_to_rows(
+        file,
+        id_splitter("Mnemonic", PATTERNS),
+        parse,
+        HEADINGS,
+        record_cache=record_cache,
+        limit=limit,
+        sample=sample,
+        keep=record_filter(where, HEADINGS),
+    )
+    df = rows_to_frame(rows).reset_index(drop=True)
+    if df.empty:
+        # no record passed the record filters
+        df = pd.DataFrame(columns=[column.name for column in SCHEMA])
+    # the facility columns follow the direction's, and are kept even if they
+    # have no values
+    df = df.reindex(
+        columns=[
+            column for column in df.columns if column not in FACILITY_COLUMNS
+        ]
+        + FACILITY_COLUMNS
+    ).astype(object)
+    df = apply_schema(df, SCHEMA)
 
-    # remove facility detail column
-    facilities_df.drop(columns=facilities, inplace=True)
-    df.drop(columns=facilities, inplace=True)
-    # merge facility specific data back to main direction data
-    df = pd.merge(df, facilities_df, how="left", on="Mnemonic")
+    schedules = None
+    if with_schedules:
+        # array-backed schedule per Mnemonic/Facility/Application row
+        schedules = build_schedules(df)
+    if columns is not None:
+        keep = set(KEY_COLUMNS) | set(columns)
+        df = df[[column for column in df.columns if column in keep]]
 
-    # remove leading and trailing whitespace for entire dataframe
-    for col in df.columns:
-        df[col] = df[col].str.strip(" ")
+    if with_schedules:
+        return df, schedules
     return df
@@ -0,0 +1,256 @@
+import re
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+KEY_COLUMNS = ["Mnemonic", "Facility", "Application"]
+ALL_DAYS = 0b1111111
+# bit position of each weekday in the mask is its position in this list
+WEEKDAYS = [
+    "MONDAY",
+    "TUESDAY",
+    "WEDNESDAY",
+    "THURSDAY",
+    "FRIDAY",
+    "SATURDAY",
+    "SUNDAY",
+]
+# other abbreviations; two letter ones only where they aren't words, so
+# e.g. "WE" in free text isn't taken for Wednesday
+DAY_ABBREVIATIONS = {
+    "MO": 0,
+    "TU": 1,
+    "WEDS": 2,
+    "TH": 3,
+    "FR": 4,
+    "SA": 5,
+    "SU": 6,
+}
+# day of each accepted spelling: the full name, any prefix of three letters
+# or more ("THU", "THURS") and the abbreviations
+DAY_NAMES = {
+    name[:end]: day
+    for day, name in enumerate(WEEKDAYS)
+    for end in range(3, len(name) + 1)
+} | DAY_ABBREVIATIONS
+WEEKDAY_MASK = 0b0011111
+WEEKEND_MASK = 0b1100000
+DAY_GROUPS = {
+    "WEEKDAY": WEEKDAY_MASK,
+    "WEEKDAYS": WEEKDAY_MASK,
+    "WEEKEND": WEEKEND_MASK,
+    "WEEKENDS": WEEKEND_MASK,
+}
+# words joining the first and last day of a range, e.g. "MON-FRI"
+RANGE_WORDS = {"-", "THRU", "THROUGH", "TO"}
+TIME_REGEX = r"(?<!\d)(?P<hour>[01]?\d|2[0-3]):(?P<minute>[0-5]\d)(?!\d)"
+
+
+@dataclass
+class DirectionSchedules:
+    """
+    Compact schedule for every Mnemonic/Facility/Application row of the
+    parsed directions. Administration times are stored as minutes since
+    midnight in one flat array; the times of schedule i are
+    minutes[offsets[i]:offsets[i + 1]], sorted and unique.
+    """
+
+    keys: pd.DataFrame
+    weekdays: np.ndarray
+    offsets: np.ndarray
+    minutes: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.weekdays)
+
+    def times(self, position: int) -> np.ndarray:
+        return self.minutes[
+            self.offsets[position] : self.offsets[position + 1]
+        ]
+
+
+def weekday_mask(day_schedule) -> int:
+    """
+    Convert a Day Schedule string into a weekday bitmask. Day names can be
+    listed ("MON,WED,FRI"), given as ranges ("MON-FRI", "FRI THRU MON") or
+    as "WEEKDAYS" and "WEEKENDS". Schedules without any recognisable day
+    names (e.g. blank or "DAILY") apply to every day.
+
+    :param day_schedule: free text day schedule, e.g. "MON,WED,FRI"
+    :return: bitmask with bit 0 for Monday through bit 6 for Sunday
+    :rtype: int
+    """
+    tokens = re.findall(r"[A-Z]+|-", str(day_schedule).upper())
+    mask = 0
+    position = 0
+    while position < len(tokens):
+        token = tokens[position]
+        position += 1
+        if token in DAY_GROUPS:
+            mask |= DAY_GROUPS[token]
+        if token not in DAY_NAMES:
+            continue
+        first = last = DAY_NAMES[token]
+        if (
+            position + 1 < len(tokens)
+            and tokens[position] in RANGE_WORDS
+            and tokens[position + 1] in DAY_NAMES
+        ):
+            last = DAY_NAMES[tokens[position + 1]]
+            position += 2
+        # ranges wrap around the end of the week, e.g. "FRI-MON"
+        for offset in range((last - first) % 7 + 1):
+            mask |= 1 << (first + offset) % 7
+    return mask or ALL_DAYS
+
+
+def build_schedules(df: pd.DataFrame) -> DirectionSchedules:
+    """
+    Build the compact schedule representation from the output of
+    parse_directions. Times are taken from the Time and Special Time columns.
+
+    :param df: dataframe from parse_directions
+    :type df: pd.DataFrame
+    :return: schedules aligned with the rows of df
+    :rtype: DirectionSchedules
+    """
+    keys = df[KEY_COLUMNS].reset_index(drop=True)
+
+    # day schedules repeat heavily, so only convert each distinct value once
+    day_schedule = (
+        df.get("Day Schedule", pd.Series("", index=df.index))
+        .fillna("")
+        .astype(str)
+    )
+    masks = {value: weekday_mask(value) for value in day_schedule.unique()}
+    weekdays = day_schedule.map(masks).to_numpy(np.uint8)
+
+    time_text = (
+        df["Time"].fillna("").astype(str)
+        + " "
+        + df.get("Special Time", pd.Series("", index=df.index))
+        .fillna("")
+        .astype(str)
+    ).reset_index(drop=True)
+    matches = time_text.str.extractall(TIME_REGEX)
+    rows = matches.index.get_level_values(0).to_numpy(np.int64)
+    minutes = (
+        matches["hour"].astype(np.int16) * 60
+        + matches["minute"].astype(np.int16)
+    ).to_numpy(np.int16)
+
+    # sort by row then time and drop repeated times within a row
+    order = np.lexsort((minutes, rows))
+    rows = rows[order]
+    minutes = minutes[order]
+    keep = np.ones(len(rows), dtype=bool)
+    keep[1:] = (rows[1:] != rows[:-1]) | (minutes[1:] != minutes[:-1])
+    rows = rows[keep]
+    minutes = minutes[keep]
+
+    offsets = np.zeros(len(keys) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=len(keys)), out=offsets[1:])
+    return DirectionSchedules(keys, weekdays, offsets, minutes)
+
+
+def doses_per_day(schedules: DirectionSchedules) -> np.ndarray:
+    """
+    Average number of doses per day for every schedule: the number of times
+    multiplied by the fraction of the week the schedule applies to.
+
+    :param schedules: schedules from build_schedules
+    :type schedules: DirectionSchedules
+    :return: float array aligned with the schedules
+    :rtype: np.ndarray
+    """
+    times_per_day = np.diff(schedules.offsets)
+    days_per_week = np.unpackbits(schedules.weekdays[:, None], axis=1).sum(
+        axis=1
+    )
+    return times_per_day * days_per_week / 7
+
+
+def average_dose_mismatches(
+    df: pd.DataFrame, schedules: DirectionSchedules, tolerance: float = 0.01
+) -> pd.DataFrame:
+    """
+    Find rows where Average Doses Per Day doesn't match the scheduled times.
+    Rows without any times (e.g. PRN directions) are ignored.
+
+    :param df: dataframe from parse_directions
+    :type df: pd.DataFrame
+    :param schedules: schedules built from the same dataframe
+    :type schedules: DirectionSchedules
+    :param tolerance: allowed absolute difference, defaults to 0.01
+    :type tolerance: float, optional
+    :return: key columns with the stated and the scheduled doses per day
+    :rtype: pd.DataFrame
+    """
+    stated = pd.to_numeric(
+        df["Average Doses Per Day"], errors="coerce"
+    ).to_numpy(float)
+    scheduled = doses_per_day(schedules)
+    mismatch = (
+        (np.diff(schedules.offsets) > 0)
+        & ~np.isnan(stated)
+        & (np.abs(stated - scheduled) > tolerance)
+    )
+    result = schedules.keys[mismatch].copy()
+    result["Average Doses Per Day"] = stated[mismatch]
+    result["Scheduled Doses Per Day"] = scheduled[mismatch]
+    return result
+
+
+def schedule_ids(schedules: DirectionSchedules) -> np.ndarray:
+    """
+    Assign the same integer ID to every pair of equivalent schedules, i.e.
+    the same weekdays and the same set of times.
+
+    :param schedules: schedules from build_schedules
+    :type schedules: DirectionSchedules
+    :return: int array of schedule IDs aligned with the schedules
+    :rtype: np.ndarray
+    """
+    times = np.split(schedules.minutes, schedules.offsets[1:-1])
+    signatures = [
+        bytes([weekdays]) + minutes.tobytes()
+        for weekdays, minutes in zip(schedules.weekdays, times)
+    ]
+    ids, _ = pd.factorize(pd.Series(signatures, dtype=object))
+    return ids
+
+
+def equivalent_schedules(
+    schedules: DirectionSchedules, left, right
+) -> np.ndarray:
+    """
+    Check element-wise whether pairs of schedules are equivalent.
+
+    :param schedules: schedules from build_schedules
+    :type schedules: DirectionSchedules
+    :param left: positions of the first schedule of each pair
+    :param right: positions of the second schedule of each pair
+    :return: boolean array, True where the two schedules are equivalent
+    :rtype: np.ndarray
+    """
+    ids = schedule_ids(schedules)
+    return ids[np.asarray(left)] == ids[np.asarray(right)]
+
+
+def duplicate_schedules(schedules: DirectionSchedules) -> pd.DataFrame:
+    """
+    Group schedules that are equivalent across the whole table.
+
+    :param schedules: schedules from build_schedules
+    :type schedules: DirectionSchedules
+    :return: key columns plus a "Schedule Group" ID, for every schedule that
+        shares its group with at least one other row
+    :rtype: pd.DataFrame
+    """
+    ids = schedule_ids(schedules)
+    counts = np.bincount(ids)
+    duplicated = counts[ids] > 1
+    result = schedules.keys[duplicated].copy()
+    result["Schedule Group"] = ids[duplicated]
+    return result.sort_values("Schedule Group", kind="stable")
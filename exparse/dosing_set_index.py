@@ -0,0 +1,337 @@
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+DRUG_COLUMN = "DrugMnemonic"
+AGE_COLUMNS = ("FromAge", "ThruAge")
+WEIGHT_COLUMNS = ("FromWeightorBSA", "ThruWeightorBSA")
+# rows of a drug only overlap if they are for the same route and dosing set
+OVERLAP_COLUMNS = ("Route", "DosingSet")
+
+
+@dataclass
+class DrugIntervals:
+    """
+    Elementary segment decomposition of one drug's dosing rows. Ages are split
+    at every range boundary; each age segment holds its own weight boundaries
+    and the rows that apply in every (age, weight) cell.
+    """
+
+    age_edges: np.ndarray
+    weight_edges: list[np.ndarray]
+    cell_rows: list[list[np.ndarray]]
+
+
+def range_bounds(
+    df: pd.DataFrame, columns: tuple[str, str]
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Get half-open [low, high) bounds for inclusive From/Thru columns. Missing
+    bounds are treated as unbounded.
+
+    :param df: dataframe containing the From and Thru columns
+    :type df: pd.DataFrame
+    :param columns: names of the From and Thru columns
+    :type columns: tuple[str, str]
+    :return: arrays of lower and (exclusive) upper bounds
+    :rtype: tuple[np.ndarray, np.ndarray]
+    """
+    low, high = (
+        (
+            pd.to_numeric(df[column], errors="coerce").to_numpy(np.float64)
+            if column in df.columns
+            else np.full(len(df), np.nan)
+        )
+        for column in columns
+    )
+    low = np.where(np.isnan(low), -np.inf, low)
+    # Thru values are inclusive, so the exclusive bound is the next float up
+    high = np.where(np.isnan(high), np.inf, np.nextafter(high, np.inf))
+    return low, high
+
+
+def decompose(
+    rows: np.ndarray, low: np.ndarray, high: np.ndarray
+) -> tuple[np.ndarray, list[np.ndarray]]:
+    """
+    Split a set of intervals into elementary segments. Each interval spans a
+    run of consecutive segments, so the (segment, row) pairs are generated
+    per interval and sorted by segment, rather than testing every interval
+    against every segment.
+
+    :param rows: row positions of the intervals
+    :type rows: np.ndarray
+    :param low: inclusive lower bounds, aligned with rows
+    :type low: np.ndarray
+    :param high: exclusive upper bounds, aligned with rows
+    :type high: np.ndarray
+    :return: sorted segment edges and the rows active in each segment
+    :rtype: tuple[np.ndarray, list[np.ndarray]]
+    """
+    edges = np.unique(np.concatenate([low, high]))
+    first = np.searchsorted(edges, low)
+    # intervals with From after Thru don't cover any segment
+    counts = np.maximum(np.searchsorted(edges, high) - first, 0)
+    intervals = np.repeat(np.arange(len(rows)), counts)
+    offsets = np.arange(len(intervals)) - np.repeat(
+        np.cumsum(counts) - counts, counts
+    )
+    segments = np.repeat(first, counts) + offsets
+    # stable, so each segment keeps its rows in their original order
+    order = np.argsort(segments, kind="stable")
+    bounds = np.searchsorted(segments[order], np.arange(len(edges)))
+    members = rows[intervals[order]]
+    return edges, [
+        members[bounds[s] : bounds[s + 1]] for s in range(len(edges) - 1)
+    ]
+
+
+def overlap_keys(df: pd.DataFrame) -> np.ndarray:
+    # one code per distinct route and dosing set, missing values included
+    columns = [column for column in OVERLAP_COLUMNS if column in df.columns]
+    if not columns:
+        return np.zeros(len(df), dtype=np.int64)
+    return df.groupby(columns, dropna=False, sort=False).ngroup().to_numpy()
+
+
+def segment_gaps(
+    edges: np.ndarray, segment_rows: list[np.ndarray], tolerance: float
+) -> list[tuple[float, float]]:
+    """
+    Find uncovered segments between the first and last covered segment.
+
+    :return: list of (start, end) pairs for gaps wider than the tolerance
+    :rtype: list[tuple[float, float]]
+    """
+    covered = [len(rows) > 0 for rows in segment_rows]
+    if not any(covered):
+        return []
+    first = covered.index(True)
+    last = len(covered) - 1 - covered[::-1].index(True)
+    return [
+        (float(edges[s]), float(edges[s + 1]))
+        for s in range(first, last)
+        if not covered[s] and edges[s + 1] - edges[s] > tolerance
+    ]
+
+
+class DosingSetIndex:
+    """
+    Interval index over the output of parse_dosing_sets, keyed by drug
+    mnemonic. Lookups binary search the age boundaries and then the weight
+    boundaries of the matching age segment, so each query is logarithmic in
+    the number of dosing rows for the drug.
+    """
+
+    def __init__(
+        self,
+        df: pd.DataFrame,
+        drugs: dict[str, DrugIntervals],
+        issues: pd.DataFrame,
+    ) -> None:
+        self.df = df
+        self.drugs = drugs
+        # overlapping and gap ranges found while building the index
+        self.issues = issues
+
+    def rows_for(self, drug: str, age: float, weight: float) -> np.ndarray:
+        """
+        Get the positions of the dosing rows that apply to a single query.
+
+        :param drug: drug mnemonic
+        :type drug: str
+        :param age: patient age, in the units used by the dosing sets
+        :type age: float
+        :param weight: patient weight or BSA
+        :type weight: float
+        :return: row positions in the indexed dataframe
+        :rtype: np.ndarray
+        """
+        intervals = self.drugs.get(drug)
+        if intervals is None or np.isnan(age) or np.isnan(weight):
+            return np.empty(0, dtype=np.int64)
+        segment = np.searchsorted(intervals.age_edges, age, side="right") - 1
+        if not 0 <= segment < len(intervals.age_edges) - 1:
+            return np.empty(0, dtype=np.int64)
+        weight_edges = intervals.weight_edges[segment]
+        cell = np.searchsorted(weight_edges, weight, side="right") - 1
+        if not 0 <= cell < len(weight_edges) - 1:
+            return np.empty(0, dtype=np.int64)
+        return intervals.cell_rows[segment][cell]
+
+    def lookup(self, drug: str, age: float, weight: float) -> pd.DataFrame:
+        """
+        Get the dosing rows that apply to drug D at age A and weight W.
+
+        :return: matching rows of the indexed dataframe
+        :rtype: pd.DataFrame
+        """
+        return self.df.iloc[self.rows_for(drug, float(age), float(weight))]
+
+    def query(
+        self,
+        queries: pd.DataFrame,
+        drug: str = "Drug",
+        age: str = "Age",
+        weight: str = "Weight",
+    ) -> pd.DataFrame:
+        """
+        Answer a batch of queries at once. Queries are grouped by drug and
+        age segment so the binary searches run vectorised per group.
+
+        :param queries: dataframe with one query per row
+        :type queries: pd.DataFrame
+        :param drug: name of the drug mnemonic column, defaults to "Drug"
+        :type drug: str, optional
+        :param age: name of the age column, defaults to "Age"
+        :type age: str, optional
+        :param weight: name of the weight/BSA column, defaults to "Weight"
+        :type weight: str, optional
+        :return: one row per (query, matching dosing row) pair, with the
+            query's index label in "Query" and the dosing row's index label
+            in "Dosing Row"
+        :rtype: pd.DataFrame
+        """
+        ages = pd.to_numeric(queries[age], errors="coerce").to_numpy(float)
+        weights = pd.to_numeric(queries[weight], errors="coerce").to_numpy(
+            float
+        )
+        query_positions = list()
+        row_positions = list()
+        for drug_name, positions in queries.groupby(
+            drug, sort=False
+        ).indices.items():
+            intervals = self.drugs.get(drug_name)
+            if intervals is None:
+                continue
+            segments = (
+                np.searchsorted(
+                    intervals.age_edges, ages[positions], side="right"
+                )
+                - 1
+            )
+            in_range = (segments >= 0) & (
+                segments < len(intervals.age_edges) - 1
+            )
+            for segment in np.unique(segments[in_range]):
+                members = positions[in_range & (segments == segment)]
+                weight_edges = intervals.weight_edges[segment]
+                cells = (
+                    np.searchsorted(
+                        weight_edges, weights[members], side="right"
+                    )
+                    - 1
+                )
+                valid = (cells >= 0) & (cells < len(weight_edges) - 1)
+                for member, cell in zip(members[valid], cells[valid]):
+                    rows = intervals.cell_rows[segment][cell]
+                    query_positions.append(np.full(len(rows), member))
+                    row_positions.append(rows)
+
+        if query_positions:
+            query_positions = np.concatenate(query_positions)
+            row_positions = np.concatenate(row_positions)
+        else:
+            query_positions = np.empty(0, dtype=np.int64)
+            row_positions = np.empty(0, dtype=np.int64)
+        return pd.DataFrame(
+            {
+                "Query": queries.index[query_positions],
+                "Dosing Row": self.df.index[row_positions],
+            }
+        )
+
+
+def build_dosing_set_index(
+    df: pd.DataFrame, gap_tolerance: float = 1.0
+) -> DosingSetIndex:
+    """
+    Build an interval index from the output of parse_dosing_sets. From/Thru
+    ranges are inclusive and missing bounds are open-ended.
+
+    Overlapping ranges (two rows of the same drug, route and dosing set
+    applying to the same age and weight) and gaps in coverage wider than
+    gap_tolerance are recorded in the index's issues table. A weight gap
+    running through consecutive age segments is recorded once, for the ages
+    of all of them.
+
+    :param df: dataframe from parse_dosing_sets
+    :type df: pd.DataFrame
+    :param gap_tolerance: uncovered spans up to this width are treated as
+        adjacent ranges, e.g. Thru Age 11 and From Age 12, defaults to 1.0
+    :type gap_tolerance: float, optional
+    :return: the dosing set index
+    :rtype: DosingSetIndex
+    """
+    age_low, age_high = range_bounds(df, AGE_COLUMNS)
+    weight_low, weight_high = range_bounds(df, WEIGHT_COLUMNS)
+    keys = overlap_keys(df)
+
+    drugs = dict()
+    issues = list()
+    for drug, positions in df.groupby(DRUG_COLUMN).indices.items():
+        positions = np.asarray(positions, dtype=np.int64)
+        age_edges, age_rows = decompose(
+            positions, age_low[positions], age_high[positions]
+        )
+        for start, end in segment_gaps(age_edges, age_rows, gap_tolerance):
+            issues.append((drug, "age gap", start, end, np.nan, np.nan, ()))
+
+        weight_edges = list()
+        cell_rows = list()
+        overlaps = set()
+        # [from age, thru age] runs of each (start, end) weight gap
+        weight_gaps = dict()
+        for segment, rows in enumerate(age_rows):
+            edges, rows_by_cell = decompose(
+                rows, weight_low[rows], weight_high[rows]
+            )
+            weight_edges.append(edges)
+            cell_rows.append(rows_by_cell)
+            for start, end in segment_gaps(edges, rows_by_cell, gap_tolerance):
+                ages = weight_gaps.setdefault((start, end), list())
+                if ages and ages[-1][1] == age_edges[segment]:
+                    # the same gap as in the age segment before
+                    ages[-1][1] = float(age_edges[segment + 1])
+                else:
+                    ages.append(
+                        [
+                            float(age_edges[segment]),
+                            float(age_edges[segment + 1]),
+                        ]
+                    )
+            for members in rows_by_cell:
+                if len(members) < 2:
+                    continue
+                member_keys = keys[members]
+                for key in np.unique(member_keys):
+                    same = members[member_keys == key]
+                    if len(same) > 1:
+                        overlaps.add(tuple(df.index[same]))
+        for from_age, thru_age, start, end in sorted(
+            (*ages, *gap) for gap, runs in weight_gaps.items() for ages in runs
+        ):
+            issues.append(
+                (drug, "weight gap", from_age, thru_age, start, end, ())
+            )
+        for rows in sorted(overlaps):
+            issues.append(
+                (drug, "overlap", np.nan, np.nan, np.nan, np.nan, rows)
+            )
+
+        drugs[drug] = DrugIntervals(age_edges, weight_edges, cell_rows)
+
+    issues_df = pd.DataFrame(
+        issues,
+        columns=[
+            "Drug",
+            "Issue",
+            "From Age",
+            "Thru Age",
+            "From Weight or BSA",
+            "Thru Weight or BSA",
+            "Dosing Rows",
+        ],
+    )
+    return DosingSetIndex(df, drugs, issues_df)
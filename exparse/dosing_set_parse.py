@@ -1,9 +1,66 @@
-from pathlib import Path
+import re
 
 import pandas as pd
 
+from common_functions import RecordFilter, read_records, select_records
+from compressed_input import ReportInput, open_input
+from free_threading import map_chunks
+from parser_registry import register_parser
+from schema import Column, apply_schema, empty_frame
 
-def parse_dosing_sets(file: Path) -> pd.DataFrame:
+SCHEMA = [
+    Column("DosingSet", required=True),
+    Column("PHASite", "categorical"),
+    Column("DrugMnemonic", required=True),
+    Column("DosingAmount", "numeric"),
+    Column("DosingUnit", "categorical"),
+    Column("DosingperFactor", "numeric"),
+    Column("RoundTo", "numeric"),
+    Column("Frequency", "categorical"),
+    Column("Route", "categorical"),
+    Column("TotalDoses", "numeric"),
+    Column("MinDose", "numeric"),
+    Column("MinDosageUnit", "categorical"),
+    Column("MaxDose", "numeric"),
+    Column("MaxDosageUnit", "categorical"),
+    Column("FromAge", "numeric"),
+    Column("ThruAge", "numeric"),
+    Column("FromWeightorBSA", "numeric"),
+    Column("ThruWeightorBSA", "numeric"),
+    Column("OrderType", "categorical"),
+    Column("InfuseOverUnit", "categorical"),
+]
+# columns split in two, into the columns and on the separator given
+SPLIT_COLUMNS = {
+    "DosingSet": ("DosingSet", "SetName", " "),
+    "Drug": ("DrugMnemonic", "Drug", " - "),
+}
+# start of each dosing set in the raw report, keyed by the set's ID on the
+# line below the heading
+RECORD_KEY = r"^Dosing Set[ \t]*\r?\n(\S+)"
+
+
+@register_parser(
+    "dosing_sets",
+    signatures=[
+        r"^Dosing Set\s*$",
+        r"Min/Max Dose Error",
+        r"From Weight or BSA",
+        r"Dosing Amount",
+    ],
+    filename_hint="dosing",
+    schema=SCHEMA,
+    record_key=RECORD_KEY,
+    threaded=True,
+)
+def parse_dosing_sets(
+    file: ReportInput,
+    limit: int | None = None,
+    sample: int | None = None,
+    where: list[RecordFilter] | None = None,
+    columns: list[str] | None = None,
+    threads: int | None = 1,
+) -> pd.DataFrame:
     headers = [
         "Dosing Set",
         "PHA Site",
@@ -43,8 +100,17 @@ def parse_dosing_sets(file: Path) -> pd.DataFrame:
     ]
 
     print("Reading file")
-    with open(file) as f:
-        lines = f.read()
+    # filters are tested on the parsed sets, so a filtered preview reads
+    # every set and picks from those passing them
+    if limit is None or where:
+        with open_input(file) as f:
+            sets = split_dosing_sets(f.read(), True)
+    else:
+        sets = read_records(file, split_dosing_sets, 1 + limit * (sample or 1))
+    if not where:
+        # the first chunk is the report header before the first dosing set
+        sets = sets[:1] + select_records(sets[1:], limit, sample)
+    lines = "".join(sets)
     # Get dosing set name on the same row as the header
     lines = lines.replace("Dosing Set\n", "Dosing Set ")
 
@@ -79,26 +145,81 @@ def parse_dosing_sets(file: Path) -> pd.DataFrame:
     # convert the rows back into a string
     new_lines = "\n".join(filtered_rows)
 
+    def unspaced(heading: str) -> str:
+        # report heading as it is marked in the filtered rows
+        return heading.replace("Dose Unit", "Dosage Unit").replace(" ", "")
+
+    filters = list()
+    for record_filter in where or []:
+        # filters name the output columns, including those split out below
+        if unspaced(record_filter.heading) not in unspaced_headers + [
+            column
+            for first, second, _ in SPLIT_COLUMNS.values()
+            for column in (first, second)
+        ]:
+            raise ValueError(
+                f"Unknown heading {record_filter.heading!r} in record filter"
+            )
+        filters.append((unspaced(record_filter.heading), record_filter.test))
+    wanted = None
+    if columns is not None:
+        # the set and drug columns are split up below
+        wanted = {"DosingSet", "Drug"} | {unspaced(c) for c in columns}
+
     # split into dosing set chunks
     set_delimiter = "SET DELIMITER"
     new_lines = new_lines.replace(unspaced_headers[0], set_delimiter)
     chunk_list = new_lines.split(set_delimiter)
-    dosing_set_list = list()
     header_tuple = tuple(unspaced_headers)
-    for chunk in chunk_list:
-        # re-add the DosingSet header
-        chunk = unspaced_headers[0] + chunk
-        # split chunk string into a list
-        chunk_items = chunk.split("\n")
-        set_dict = dict()
-        # if the item starts with a header, add to a dict under that header as a key
-        for item in chunk_items:
-            if any(
-                item.startswith(match := header) for header in unspaced_headers
-            ):
-                set_dict[match] = item[len(match) :]
-
-        dosing_set_list.append(set_dict)
+
+    def dosing_set_rows(chunks: list[str]) -> list[dict]:
+        rows = list()
+        for chunk in chunks:
+            # re-add the DosingSet header
+            chunk = unspaced_headers[0] + chunk
+            # split chunk string into a list
+            chunk_items = chunk.split("\n")
+            set_dict = dict()
+            # if the item starts with a header, add to a dict under that header as a key
+            for item in chunk_items:
+                if any(
+                    item.startswith(match := header)
+                    for header in unspaced_headers
+                ):
+                    set_dict[match] = item[len(match) :]
+
+            # test the filters before the set becomes a dataframe row
+            if filters:
+                values = split_set_values(set_dict)
+                if not all(
+                    heading in values and test(values[heading])
+                    for heading, test in filters
+                ):
+                    continue
+            if wanted is not None:
+                set_dict = {
+                    heading: value
+                    for heading, value in set_dict.items()
+                    if heading in wanted
+                }
+            rows.append(set_dict)
+        return rows
+
+    # each dosing set is read on its own, so the sets can be split across
+    # threads
+    dosing_set_list = [
+        set_dict
+        for rows in map_chunks(dosing_set_rows, chunk_list[1:], threads)
+        for set_dict in rows
+    ]
+    if where:
+        dosing_set_list = select_records(dosing_set_list, limit, sample)
+    # the first chunk is the text before the first dosing set
+    dosing_set_list = dosing_set_rows(chunk_list[:1]) + dosing_set_list
+
+    if not dosing_set_list:
+        # no dosing set passed the record filters
+        return empty_frame(SCHEMA)
 
     # convert to dataframe
     df = pd.DataFrame(dosing_set_list)
@@ -108,23 +229,16 @@ def parse_dosing_sets(file: Path) -> pd.DataFrame:
         df[column] = df[column].str.strip()
 
     # split columns where needed
-    df[["DosingSet", "SetName"]] = df["DosingSet"].str.split(
-        " ", n=1, expand=True
-    )
-    df[["DrugMnemonic", "Drug"]] = df["Drug"].str.split(
-        " - ", n=1, expand=True
-    )
+    for column, (first, second, separator) in SPLIT_COLUMNS.items():
+        df[[first, second]] = df[column].str.split(separator, n=1, expand=True)
 
     # strip leading and trailing whitespace from all columns again
     for column in df.columns:
         df[column] = df[column].str.strip()
 
-    # convert numeric strings to numeric datatypes
-    # NB: this will break in a future version of pandas
-    df = df.apply(
-        pd.to_numeric,
-        errors="ignore",
-    )
+    # convert columns to their declared types, failures are kept in
+    # df.attrs["coercion_errors"]
+    df = apply_schema(df, SCHEMA)
     # print(df.dtypes)
     # drop rows and columns where all values are missing
     df.dropna(axis="index", how="all", inplace=True)
@@ -135,5 +249,36 @@ def parse_dosing_sets(file: Path) -> pd.DataFrame:
     return df
 
 
+def split_set_values(set_dict: dict[str, str]) -> dict[str, str]:
+    """
+    Get the stripped values of a dosing set as they end up in the output
+    columns, with the set's ID and name and the drug's mnemonic and name split
+    up as parse_dosing_sets splits them.
+
+    :param set_dict: raw text under each unspaced heading of the set
+    :type set_dict: dict[str, str]
+    :return: value of each output column the set has
+    :rtype: dict[str, str]
+    """
+    values = {heading: value.strip() for heading, value in set_dict.items()}
+    for column, (first, second, separator) in SPLIT_COLUMNS.items():
+        if column in values:
+            parts = values.pop(column).split(separator, 1)
+            values[first] = parts[0].strip()
+            if len(parts) > 1:
+                values[second] = parts[1].strip()
+    return values
+
+
+def split_dosing_sets(text: str, complete: bool) -> list[str]:
+    """
+    Split the raw report into the text of each dosing set, starting at its
+    "Dosing Set" heading line. The last set of a partly read file is left
+    out as it may continue past the cut.
+    """
+    sets = re.split(r"(?=^Dosing Set\s*$)", text, flags=re.MULTILINE)
+    return sets if complete else sets[:-1]
+
+
 # if __name__ == "__main__":
 #     parse_dosing_sets(FILE)
@@ -0,0 +1,59 @@
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+# chunks per thread, so threads that finish early pick up more of the work
+CHUNKS_PER_THREAD = 4
+
+
+def gil_enabled() -> bool:
+    # sys._is_gil_enabled only exists from Python 3.13
+    is_gil_enabled = getattr(sys, "_is_gil_enabled", None)
+    return True if is_gil_enabled is None else is_gil_enabled()
+
+
+def record_threads(threads: int | None = 1) -> int:
+    """
+    Get the number of threads record-level work runs on. With the GIL the
+    threads would only take turns, so the work stays in the calling thread.
+
+    :param threads: requested number of threads, None for one per CPU,
+        defaults to 1
+    :type threads: int | None, optional
+    :return: number of threads to use
+    :rtype: int
+    """
+    if gil_enabled():
+        return 1
+    if threads is None:
+        return os.cpu_count() or 1
+    return max(threads, 1)
+
+
+def map_chunks(
+    func: Callable[[list], object], items: list, threads: int | None = 1
+) -> list:
+    """
+    Apply a function to contiguous chunks of a list on a thread pool, for
+    record-level work that scales across cores on a free-threaded
+    interpreter. With one thread, or when the GIL is enabled, the function
+    is called once on the whole list in the calling thread.
+
+    :param func: function taking a chunk of items
+    :type func: Callable[[list], object]
+    :param items: items to process, e.g. the records of a report
+    :type items: list
+    :param threads: requested number of threads, None for one per CPU,
+        defaults to 1
+    :type threads: int | None, optional
+    :return: the result for each chunk, in the order of the items
+    :rtype: list
+    """
+    threads = record_threads(threads)
+    if threads <= 1 or len(items) <= 1:
+        return [func(items)]
+    size = -(-len(items) // (threads * CHUNKS_PER_THREAD))
+    chunks = [items[i : i + size] for i in range(0, len(items), size)]
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        return list(executor.map(func, chunks))
@@ -0,0 +1,225 @@
+import hashlib
+import json
+from pathlib import Path
+
+import pandas as pd
+
+from compressed_input import (
+    ReportInput,
+    buffer_input,
+    inner_name,
+    is_path,
+    open_input,
+)
+from parser_registry import ParserSpec, load_parsers
+
+HEAD_BYTES = 8192
+CACHE_PATH = Path("output", ".route_cache.json")
+
+
+def file_head(file: ReportInput, size: int = HEAD_BYTES) -> bytes:
+    # compressed files are classified by their decompressed head
+    with open_input(file, "rb") as f:
+        return f.read(size)
+
+
+def head_hash(head: bytes, file_size: int) -> str:
+    """
+    Hash a file's head together with its size. Signatures are only matched
+    against the head, so unlike a hash of the whole file this identifies
+    everything routing by content depends on without reading the file.
+    """
+    digest = hashlib.sha1(head)
+    digest.update(str(file_size).encode())
+    return digest.hexdigest()
+
+
+def classify_head(
+    head: str, filename: str, parsers: dict[str, ParserSpec]
+) -> str | None:
+    """
+    Pick the parser whose signatures best match the head of a file. Ties
+    (including no signature matching at all) are broken by the parsers'
+    file name hints.
+
+    :param head: decoded start of the file
+    :type head: str
+    :param filename: file name, used for tie breaks
+    :type filename: str
+    :param parsers: registered parsers
+    :type parsers: dict[str, ParserSpec]
+    :return: category of the best matching parser, or None
+    :rtype: str | None
+    """
+    scores = {
+        category: sum(
+            1 for signature in spec.signatures if signature.search(head)
+        )
+        for category, spec in parsers.items()
+    }
+    best = max(scores.values(), default=0)
+    candidates = [
+        category for category, score in scores.items() if score == best
+    ]
+    if best > 0 and len(candidates) == 1:
+        return candidates[0]
+
+    hinted = [
+        category
+        for category in candidates
+        if parsers[category].filename_hint in filename
+    ]
+    if len(hinted) == 1:
+        return hinted[0]
+    return None
+
+
+class InputRouter:
+    """
+    Classifies input files by reading only the first few KB of each and
+    matching the registered parsers' signatures. Results decided by content
+    alone are cached by the hash of the file head, so a copy of a file under
+    another name isn't classified again. Results per file are cached with
+    its size and modification time, and unchanged files aren't read again
+    at all.
+    """
+
+    def __init__(
+        self,
+        parsers: dict[str, ParserSpec] | None = None,
+        cache_path: Path | None = CACHE_PATH,
+    ) -> None:
+        self.parsers = parsers if parsers is not None else load_parsers()
+        self.cache_path = cache_path
+        self.cache_hits = 0
+        self.files = dict()
+        self.hashes = dict()
+        # cached results are only valid for the same set of signatures
+        self.signature_hash = hashlib.sha1(
+            json.dumps(
+                {
+                    category: [s.pattern for s in spec.signatures]
+                    + [spec.filename_hint]
+                    for category, spec in self.parsers.items()
+                },
+                sort_keys=True,
+            ).encode()
+        ).hexdigest()
+        if cache_path is not None and cache_path.exists():
+            try:
+                cache = json.loads(cache_path.read_text())
+            except (OSError, ValueError):
+                cache = dict()
+            if cache.get("signatures") == self.signature_hash:
+                self.files = cache.get("files", dict())
+                self.hashes = cache.get("hashes", dict())
+
+    def classify(self, file: ReportInput) -> str | None:
+        """
+        Get the parser category of a single file. Reports held in memory
+        aren't cached, and have no file name to break ties with. A stream's
+        head is read from it, so buffer_input a stream that is parsed after.
+
+        :param file: input file, report text or bytes, or binary stream
+        :type file: ReportInput
+        :return: parser category, or None if no parser matches
+        :rtype: str | None
+        """
+        if not is_path(file):
+            head = file_head(file)
+            return classify_head(
+                head.decode("utf-8", errors="ignore"), "", self.parsers
+            )
+
+        file = Path(file)
+        stat = file.stat()
+        key = str(file.resolve())
+        known = self.files.get(key)
+        if (
+            known
+            and known["size"] == stat.st_size
+            and known["mtime_ns"] == stat.st_mtime_ns
+            and "category" in known
+        ):
+            self.cache_hits += 1
+            return known["category"]
+
+        head = file_head(file)
+        digest = head_hash(head, stat.st_size)
+        if digest in self.hashes:
+            self.cache_hits += 1
+            category = self.hashes[digest]
+        else:
+            text = head.decode("utf-8", errors="ignore")
+            category = classify_head(text, "", self.parsers)
+            if category is not None:
+                self.hashes[digest] = category
+            else:
+                # a tie broken by the file name only holds for this file
+                category = classify_head(text, inner_name(file), self.parsers)
+        self.files[key] = {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "hash": digest,
+            "category": category,
+        }
+        return category
+
+    def route(self, files: list[Path]) -> dict[str, list[Path]]:
+        """
+        Classify a list of files.
+
+        :param files: input files
+        :type files: list[Path]
+        :return: files for each category, in registry order
+        :rtype: dict[str, list[Path]]
+        """
+        routed = {category: list() for category in self.parsers}
+        for file in sorted(files):
+            category = self.classify(file)
+            if category is not None:
+                routed[category].append(file)
+        self.save()
+        return {category: found for category, found in routed.items() if found}
+
+    def save(self) -> None:
+        if self.cache_path is None:
+            return
+        self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+        self.cache_path.write_text(
+            json.dumps(
+                {
+                    "signatures": self.signature_hash,
+                    "files": self.files,
+                    "hashes": self.hashes,
+                }
+            )
+        )
+
+
+def parse_report(
+    report: ReportInput, category: str | None = None, **kwargs
+) -> pd.DataFrame:
+    """
+    Parse a report, e.g. text or bytes received from another service,
+    without reading or writing any file but the report itself. Text is given
+    as ReportText, as a plain str is the path of a report file.
+
+    :param report: input file, report text or bytes, or binary stream,
+        compressed or not
+    :type report: ReportInput
+    :param category: parser category, defaults to classifying the report
+        by its content
+    :type category: str | None, optional
+    :raises ValueError: if no parser matches the report
+    :return: the parser's output
+    :rtype: pd.DataFrame
+    """
+    parsers = load_parsers()
+    if category is None:
+        # the stream is read twice, to classify and to parse it
+        report = buffer_input(report)
+        category = InputRouter(parsers, cache_path=None).classify(report)
+    if category is None:
+        raise ValueError("No parser matches the report")
+    return parsers[category].func(file=report, **kwargs)
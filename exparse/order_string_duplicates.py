@@ -0,0 +1,239 @@
+import hashlib
+import re
+from itertools import combinations
+
+import numpy as np
+import pandas as pd
+
+# order string fields compared for duplicates; the group columns, comments,
+# prescriber details and location restrictions don't change what is ordered
+FINGERPRINT_FIELDS = [
+    "Order Type: ",
+    "Description",
+    "Medication",
+    "Ingredient",
+    "Additive IV",
+    "IV Fluid",
+    "Dose Units",
+    "Route",
+    "Site",
+    "Frequency",
+    "Scheduled",
+    "Sch",
+    "Rate",
+    "Ordered Rate",
+    "Duration",
+    "Fixed Total Volume",
+    "Calculated Total Vol",
+    "Ordered Volume",
+    "Total Volume",
+    "Total Doses",
+    "Total Dose",
+    "PRN Level",
+    "PRN Reason",
+    "Infuse Volume",
+    "PCA Bolus Dose",
+    "Lockout",
+    "PCA Max Dose",
+    "Time Limit",
+    "Soft Stop",
+    "Total Bags",
+    "Total Volume to Infuse",
+    "Fill Frequency",
+    "Type",
+]
+DEFAULT_THRESHOLD = 0.8
+# hash functions in each MinHash signature
+NUM_PERM = 128
+MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+MAX_HASH = np.uint64((1 << 32) - 1)
+
+
+def order_string_tokens(row: pd.Series, fields: list[str]) -> frozenset:
+    """
+    Get the tokens an order string is compared by: each normalized field
+    value as a whole, so matching fields weigh most, and each of its words,
+    so e.g. doses in the same unit still partly match.
+    """
+    tokens = set()
+    for field in fields:
+        value = row.get(field)
+        if value is None or pd.isna(value):
+            continue
+        value = re.sub(r"\s+", " ", str(value)).strip().lower()
+        if not value:
+            continue
+        tokens.add(f"{field}={value}")
+        tokens.update(f"{field}:{word}" for word in value.split(" "))
+    return frozenset(tokens)
+
+
+def token_hash(token: str) -> int:
+    digest = hashlib.blake2b(token.encode(), digest_size=4).digest()
+    return int.from_bytes(digest, "little")
+
+
+def minhash_signatures(
+    token_sets: list[frozenset], num_perm: int = NUM_PERM, seed: int = 0
+) -> np.ndarray:
+    """
+    Get the MinHash signature of each token set. Two signatures agree at a
+    position with the probability of the sets' Jaccard similarity.
+
+    :param token_sets: non-empty token sets
+    :type token_sets: list[frozenset]
+    :param num_perm: number of hash functions, defaults to NUM_PERM
+    :type num_perm: int, optional
+    :param seed: seed of the hash functions, defaults to 0
+    :type seed: int, optional
+    :return: one row of num_perm minimum hashes per token set
+    :rtype: np.ndarray
+    """
+    rng = np.random.default_rng(seed)
+    # a * x stays below 2**64 for 32 bit token hashes
+    a = rng.integers(1, 1 << 32, num_perm, dtype=np.uint64)
+    b = rng.integers(0, 1 << 32, num_perm, dtype=np.uint64)
+    # field values repeat across order strings, each token is hashed once
+    hashes = {token: token_hash(token) for token in set().union(*token_sets)}
+    signatures = np.empty((len(token_sets), num_perm), dtype=np.uint64)
+    for i, tokens in enumerate(token_sets):
+        x = np.array([hashes[token] for token in tokens], dtype=np.uint64)
+        permuted = (x[:, None] * a + b) % MERSENNE_PRIME & MAX_HASH
+        signatures[i] = permuted.min(axis=0)
+    return signatures
+
+
+def lsh_bands(threshold: float, num_perm: int = NUM_PERM) -> tuple[int, int]:
+    """
+    Split signatures into bands so that pairs at the similarity threshold
+    most likely share a band, weighing missed pairs above the threshold
+    and candidates below it equally.
+
+    :return: number of bands and signature positions per band
+    :rtype: tuple[int, int]
+    """
+    similarity = np.linspace(0, 1, 1001)
+    below = similarity < threshold
+    best = None
+    for rows in range(1, num_perm + 1):
+        if num_perm % rows:
+            continue
+        bands = num_perm // rows
+        # probability of sharing at least one band
+        candidate = 1 - (1 - similarity**rows) ** bands
+        error = candidate[below].sum() + (1 - candidate[~below]).sum()
+        if best is None or error < best[0]:
+            best = (error, bands, rows)
+    return best[1], best[2]
+
+
+def jaccard(a: frozenset, b: frozenset) -> float:
+    return len(a & b) / len(a | b)
+
+
+def find_duplicate_order_strings(
+    df: pd.DataFrame,
+    threshold: float = DEFAULT_THRESHOLD,
+    fields: list[str] | None = None,
+    num_perm: int = NUM_PERM,
+) -> pd.DataFrame:
+    """
+    Cluster order strings whose normalized fields are nearly the same, e.g.
+    the same medication, dose and route in different groups or differing
+    only in a comment. Each order string gets a MinHash signature and only
+    order strings sharing a band of their signatures are compared, so the
+    time grows about linearly with the number of order strings rather than
+    with the number of pairs. Candidate pairs are kept if the Jaccard
+    similarity of their tokens reaches the threshold, and clusters are the
+    connected groups of kept pairs.
+
+    :param df: output of parse_order_strings
+    :type df: pd.DataFrame
+    :param threshold: Jaccard similarity from which two order strings are
+        duplicates, between 0 and 1, defaults to DEFAULT_THRESHOLD
+    :type threshold: float, optional
+    :param fields: columns compared, defaults to FINGERPRINT_FIELDS
+    :type fields: list[str] | None, optional
+    :param num_perm: hash functions per signature, defaults to NUM_PERM
+    :type num_perm: int, optional
+    :raises ValueError: if the threshold isn't between 0 and 1
+    :return: the order strings in a cluster, with their cluster number,
+        cluster size and similarity to the cluster's first order string,
+        ordered by cluster
+    :rtype: pd.DataFrame
+    """
+    if not 0 < threshold <= 1:
+        raise ValueError(f"Similarity threshold {threshold} isn't in (0, 1]")
+    fields = [f for f in fields or FINGERPRINT_FIELDS if f in df.columns]
+
+    # identical order strings are clustered without hashing
+    positions = dict()
+    for position in range(len(df)):
+        tokens = order_string_tokens(df.iloc[position], fields)
+        if tokens:
+            positions.setdefault(tokens, list()).append(position)
+    token_sets = list(positions)
+
+    parent = list(range(len(token_sets)))
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    if len(token_sets) > 1:
+        signatures = minhash_signatures(token_sets, num_perm)
+        bands, band_size = lsh_bands(threshold, num_perm)
+        compared = set()
+        for band in range(bands):
+            buckets = dict()
+            keys = signatures[:, band * band_size : (band + 1) * band_size]
+            for i, key in enumerate(keys):
+                buckets.setdefault(key.tobytes(), list()).append(i)
+            for members in buckets.values():
+                for pair in combinations(members, 2):
+                    if pair in compared:
+                        continue
+                    compared.add(pair)
+                    i, j = pair
+                    if (
+                        find(i) != find(j)
+                        and jaccard(token_sets[i], token_sets[j]) >= threshold
+                    ):
+                        parent[find(j)] = find(i)
+
+    clusters = dict()
+    for i, tokens in enumerate(token_sets):
+        clusters.setdefault(find(i), list()).extend(
+            (position, tokens) for position in positions[tokens]
+        )
+    # number the clusters by their first order string
+    clusters = sorted(
+        (
+            sorted(cluster, key=lambda member: member[0])
+            for cluster in clusters.values()
+            if len(cluster) > 1
+        ),
+        key=lambda cluster: cluster[0][0],
+    )
+
+    selected = list()
+    numbers = list()
+    sizes = list()
+    similarities = list()
+    for number, cluster in enumerate(clusters, start=1):
+        first = cluster[0][1]
+        for position, tokens in cluster:
+            selected.append(position)
+            numbers.append(number)
+            sizes.append(len(cluster))
+            similarities.append(jaccard(first, tokens))
+
+    duplicates = df.iloc[selected].copy()
+    # the parser's coercion errors belong to the parsed order strings
+    duplicates.attrs = dict()
+    duplicates.insert(0, "Cluster", numbers)
+    duplicates.insert(1, "Cluster Size", sizes)
+    duplicates.insert(2, "Similarity", similarities)
+    return duplicates
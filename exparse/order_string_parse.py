@@ -1,12 +1,84 @@
 import re
-from pathlib import Path
 
+import numpy as np
 import pandas as pd
 
-from common_functions import regex_substitution
+from common_functions import (
+    LongTable,
+    RecordFilter,
+    dataframe_to_long,
+    file_to_records,
+    file_to_rows,
+    frame_to_rows,
+    long_to_rows,
+    long_to_wide,
+    record_filter,
+    records_to_long,
+    regex_substitution,
+    rows_to_frame,
+    rows_to_long,
+)
+from compressed_input import ReportInput
+from parser_registry import register_parser
+from record_cache import RecordCache
+from schema import Column, apply_long_schema, apply_schema, empty_frame
 
+SCHEMA = [
+    Column("Group Mnemonic", required=True),
+    Column("Group Active", "boolean"),
+    Column("Group Type", "categorical"),
+    Column("Index by Fluid", "boolean"),
+    Column("Order Type: ", "categorical"),
+    Column("Route", "categorical"),
+    Column("Site", "categorical"),
+    Column("Frequency", "categorical"),
+    Column("Total Doses", "numeric"),
+    Column("PRN Level", "categorical"),
+    Column("Start Time", "time"),
+    Column("Total Bags", "numeric"),
+    Column("Type", "categorical"),
+]
+PATTERNS = [
+    (r"DATE:.+PAGE.+\nUSER:.+\n-+\n", ""),  # Remove headers and footers
+    (
+        r"-{2,}|Index by Restrict to|Group\s+Active\s+Name\s+Type Fluid\s+Order Type",
+        "",
+    ),  # match lines with dashes or headers
+    (r"^\s*\n", ""),  # remove empty lines
+]
+# start of each order string group in the raw report: the group mnemonic
+# followed by its Y/N active flag
+RECORD_KEY = r"^(\S+) +[YN] "
+# headings split up into several output columns
+SPLIT_HEADINGS = ["Group Mnemonic", "Order Type: "]
+COMMENT_HEADINGS = ["Label Comment", "Rx Comment"]
 
-def parse_order_strings(file: Path) -> pd.DataFrame:
+
+@register_parser(
+    "order_strings",
+    signatures=[
+        r"Index by\s+Restrict to",
+        r"Group\s+Active\s+Name\s+Type",
+        r"^\s+\d+\)\s",
+    ],
+    filename_hint="order_string",
+    schema=SCHEMA,
+    patterns=PATTERNS,
+    incremental=True,
+    record_key=RECORD_KEY,
+    threaded=True,
+    long_layout=True,
+)
+def parse_order_strings(
+    file: ReportInput,
+    record_cache: RecordCache | None = None,
+    limit: int | None = None,
+    sample: int | None = None,
+    where: list[RecordFilter] | None = None,
+    columns: list[str] | None = None,
+    threads: int | None = 1,
+    layout: str = "wide",
+) -> pd.DataFrame:
     HEADINGS = [
         "Group Mnemonic",
         "Group Active",
@@ -75,61 +147,132 @@ def parse_order_strings(file: Path) -> pd.DataFrame:
         "Ordered Dose",  # nonsense results here
     ]
 
-    # Read the text file
-    with open(file, "r") as f:
-        data = f.read()
-
-    substitutions = [
-        (r"DATE:.+PAGE.+\nUSER:.+\n-+\n", ""),  # Remove headers and footers
-        (
-            r"-{2,}|Index by Restrict to|Group\s+Active\s+Name\s+Type Fluid\s+Order Type",
-            "",
-        ),  # match lines with dashes or headers
-        (r"^\s*\n", ""),  # remove empty lines
-    ]
-    cleaned_data = regex_substitution(data, substitutions)
+    def split(text: str, complete: bool) -> list[str]:
+        cleaned_data = regex_substitution(text, PATTERNS)
+        # split the data into order_string groups
+        split_data = re.split(r"\n(?!\s)", cleaned_data)
+        # the last group of a partly read file may continue past the cut
+        return order_string_records(
+            split_data if complete else split_data[:-1]
+        )
 
-    #
-    # cleaned_data = re.sub(r"DATE:.+PAGE.+\nUSER:.+\n-+\n", "", data)
-    # # Regex to
-    # clean_line_pattern = r"-{2,}|Index by Restrict to|Group\s+Active\s+Name\s+Type Fluid\s+Order Type"
-    # # Remove all matches from the text
-    # cleaned_data = re.sub(clean_line_pattern, "", cleaned_data)
-    #
-    # cleaned_data = re.sub(r"^\s*\n", "", cleaned_data, flags=re.MULTILINE)
+    def parse(records: list[str]) -> list[list[dict]]:
+        # the rows of whole records, as the record cache keeps them
+        table = records_to_long(records, HEADINGS, threads=threads)
+        df = split_order_strings(long_to_wide(table, drop_empty=False))
+        return frame_to_rows(df, len(records))
 
-    # split the data into order_string groups
-    split_data = re.split(r"\n(?!\s)", cleaned_data)
+    if where or columns is not None:
+        # cached rows are whole records, parsed without filters
+        record_cache = None
+    if record_cache is not None:
+        rows = file_to_rows(
+            file,
+            split,
+            parse,
+            HEADINGS,
+            record_cache=record_cache,
+            limit=limit,
+            sample=sample,
+            preamble=False,
+        )
+        if layout == "long":
+            df = apply_long_schema(rows_to_long(rows, HEADINGS), SCHEMA)
+            df.attrs["layout"] = "long"
+            return df
+        df = rows_to_frame(rows)
+    else:
+        all_order_strings = file_to_records(
+            file,
+            split,
+            limit,
+            sample,
+            preamble=False,
+            keep=record_filter(where, HEADINGS),
+        )
 
-    heading_pattern = "|".join(re.escape(key) for key in HEADINGS)
-    all_order_strings = list()
-    for group in split_data:
-        # get shared part of order strings
-        common = "Group Mnemonic " + group[: group.find("1)")]
-        # get order_strings from group
-        order_strings = re.split(r"\d+\)\s*", group[group.find("1)") :])
-        # add the common component to each group
-        order_strings = [
-            f"{common} Order Type: {s}" for s in order_strings if s != ""
-        ]
-        for order_string in order_strings:
-            # capture data to a dict using a list of headings
-            split_data = re.split(r"(" + heading_pattern + r")", order_string)
-            string_dict = dict()
-            current_key = None
-            for part in split_data:
-                if part in HEADINGS:
-                    current_key = part
-                elif current_key:
-                    string_dict[current_key] = part.strip()
-                    current_key = None
-            all_order_strings.append(string_dict)
-
-    # create dataframe
-    df = pd.DataFrame(all_order_strings)
+        #
+        # cleaned_data = re.sub(r"DATE:.+PAGE.+\nUSER:.+\n-+\n", "", data)
+        # # Regex to
+        # clean_line_pattern = r"-{2,}|Index by Restrict to|Group\s+Active\s+Name\s+Type Fluid\s+Order Type"
+        # # Remove all matches from the text
+        # cleaned_data = re.sub(clean_line_pattern, "", cleaned_data)
+        #
+        # cleaned_data = re.sub(r"^\s*\n", "", cleaned_data, flags=re.MULTILINE)
+
+        # capture data to long format records using a list of headings,
+        # then create dataframe
+        capture = None
+        if columns is not None:
+            # the group and order type columns are split up below
+            capture = SPLIT_HEADINGS + list(columns)
+        table = records_to_long(
+            all_order_strings,
+            HEADINGS,
+            where=where,
+            columns=capture,
+            threads=threads,
+        )
+        if layout == "long":
+            df = apply_long_schema(
+                order_strings_long(table, HEADINGS, columns), SCHEMA
+            )
+            df.attrs["layout"] = "long"
+            return df
+
+        # records skipped by a filter have no values and get no row
+        df = long_to_wide(table, drop_empty=bool(where))
+    if df.empty:
+        # no record passed the record filters
+        return empty_frame(SCHEMA)
+    if record_cache is None:
+        df = split_order_strings(df)
+    # drop empty columns
+    df.dropna(how="all", axis="columns", inplace=True)
+
+    present_headings = [h for h in HEADINGS if h in df.columns]
+    if columns is not None:
+        keep = {"Group Mnemonic"} | set(columns)
+        present_headings = [h for h in present_headings if h in keep]
+    df = df[present_headings].copy()  # reorder the columns
+    df = apply_schema(df, SCHEMA)
+
+    return df
+
+
+def split_order_strings(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Clean up the values of each order string and split up the columns that
+    hold several values. Every step works row by row.
+
+    :param df: wide dataframe of the order strings
+    :type df: pd.DataFrame
+    :return: the dataframe with its output columns
+    :rtype: pd.DataFrame
+    """
     # remove leading and trailing whitespace for entire dataframe
     for col in df.columns:
         df[col] = df[col].str.strip(" ")
+    split_group_columns(df)
+
+    # comment fields: remove consecutive whitespace
+    for comment in COMMENT_HEADINGS:
+        if comment in df.columns:
+            df[comment] = df[comment].replace(r"\s+", " ", regex=True)
+
+    # drop nonsense columns
+    return df.drop(columns="Ordered Dose", errors="ignore")
+
+
+def split_group_columns(df: pd.DataFrame) -> None:
+    """
+    Split the group mnemonic and order type columns into the columns they
+    hold, in place.
+
+    :param df: wide dataframe with stripped Group Mnemonic and Order Type
+        columns
+    :type df: pd.DataFrame
+    """
     # split order type
     df[["Order Type: ", "Description"]] = df["Order Type: "].str.split(
         " ", n=1, expand=True
@@ -157,15 +300,69 @@ def parse_order_strings(file: Path) -> pd.DataFrame:
         "Group Mnemonic"
     ].str.extract(r"^(.*)\s(Y|N)\s(.*)$")
 
-    # comment fields: remove consecutive whitespace
-    df["Label Comment"] = df["Label Comment"].replace(r"\s+", " ", regex=True)
-    df["Rx Comment"] = df["Rx Comment"].replace(r"\s+", " ", regex=True)
 
-    # drop nonsense/empty columns
-    df.drop(axis="columns", labels="Ordered Dose", inplace=True)
-    df.dropna(how="all", axis="columns", inplace=True)
+def order_strings_long(
+    table: LongTable, headings: list[str], columns: list[str] | None = None
+) -> pd.DataFrame:
+    """
+    Build the long layout of the order strings from their long format table.
+    Only the group mnemonic and order type headings are pivoted, to split
+    them up; the other values are taken from the table as they are.
 
-    present_headings = [h for h in HEADINGS if h in df.columns]
-    df = df[present_headings]  # reorder the columns
+    :param table: long format table of the order strings
+    :type table: LongTable
+    :param headings: output headings, in order
+    :type headings: list[str]
+    :param columns: only keep these headings and the group mnemonic,
+        defaults to every heading
+    :type columns: list[str] | None, optional
+    :return: dataframe of Record, Heading and Value
+    :rtype: pd.DataFrame
+    """
+    if not len(table.values):
+        return pd.DataFrame(columns=["Record", "Heading", "Value"])
+    split = long_to_wide(table, columns=SPLIT_HEADINGS)
+    for col in split.columns:
+        split[col] = split[col].str.strip(" ")
+    split_group_columns(split)
 
-    return df
+    long = long_to_rows(table)
+    # the split columns replace any values of the same headings
+    long = long[~long["Heading"].isin([*split.columns, "Ordered Dose"])]
+    values = long["Value"].str.strip(" ")
+    comments = long["Heading"].isin(COMMENT_HEADINGS)
+    values[comments] = values[comments].replace(r"\s+", " ", regex=True)
+    long = pd.concat(
+        [dataframe_to_long(split), long.assign(Value=values)],
+        ignore_index=True,
+    )
+
+    if columns is not None:
+        keep = {"Group Mnemonic"} | set(columns)
+        long = long[long["Heading"].isin(keep)]
+    rank = long["Heading"].map({h: i for i, h in enumerate(headings)})
+    order = np.lexsort((rank.to_numpy(), long["Record"].to_numpy()))
+    return long.iloc[order].reset_index(drop=True)
+
+
+def order_string_records(groups: list[str]) -> list[str]:
+    """
+    Expand each order string group into one record per numbered order string,
+    prefixed with the group's shared text.
+
+    :param groups: text of each order string group
+    :type groups: list[str]
+    :return: text of each order string
+    :rtype: list[str]
+    """
+    all_order_strings = list()
+    for group in groups:
+        # get shared part of order strings
+        common = "Group Mnemonic " + group[: group.find("1)")]
+        # get order_strings from group
+        order_strings = re.split(r"\d+\)\s*", group[group.find("1)") :])
+        # add the common component to each group
+        all_order_strings.extend(
+            f"{common} Order Type: {s}" for s in order_strings if s != ""
+        )
+    return all_order_strings
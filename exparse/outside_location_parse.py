@@ -1,11 +1,72 @@
-from pathlib import Path
+import re
 
 import pandas as pd
 
-from common_functions import file_to_dataframe
+from common_functions import (
+    RecordFilter,
+    file_to_records,
+    file_to_rows,
+    heading_order,
+    id_splitter,
+    long_to_records,
+    long_to_rows,
+    long_to_wide,
+    record_filter,
+    records_to_long,
+    rows_to_frame,
+    rows_to_long,
+)
+from compressed_input import ReportInput
+from parser_registry import register_parser
+from record_cache import RecordCache
+from schema import Column, apply_long_schema, apply_schema, empty_frame
 
+SCHEMA = [
+    Column("Mnemonic", required=True),
+    Column("Active", "categorical"),
+    Column("Type", "categorical"),
+    Column("Town/City", "categorical"),
+    Column("County", "categorical"),
+]
+PATTERNS = [
+    (r"Address 2", "Addres2"),
+    (r"Fax Attention", "FaAttention"),
+]
+# only pharmacy entries are kept
+PHARMACY_FILTER = RecordFilter(
+    "Mnemonic", lambda mnemonic: re.search("PHA.", mnemonic) is not None
+)
+# start of each record in the raw report, keyed by its Mnemonic
+RECORD_KEY = r"^Mnemonic[ \t]+(\S+)"
 
-def parse_locations(file: Path) -> pd.DataFrame:
+
+@register_parser(
+    "outside_locations",
+    signatures=[
+        r"Performing Loc Exception",
+        r"NCPDP Identifier",
+        r"Direct Address",
+        r"Fax Attention",
+        r"Town/City",
+    ],
+    filename_hint="location",
+    schema=SCHEMA,
+    patterns=PATTERNS,
+    incremental=True,
+    record_key=RECORD_KEY,
+    threaded=True,
+    long_layout=True,
+)
+def parse_locations(
+    file: ReportInput,
+    record_cache: RecordCache | None = None,
+    limit: int | None = None,
+    sample: int | None = None,
+    where: list[RecordFilter] | None = None,
+    columns: list[str] | None = None,
+    threads: int | None = 1,
+    layout: str = "wide",
+) -> pd.DataFrame:
     HEADINGS = [
         "Mnemonic",
         "Name",
@@ -36,17 +97,86 @@ def parse_locations(file: Path) -> pd.DataFrame:
         "Web Address",
         "Description",
     ]
-    patterns = [
-        (r"Address 2", "Addres2"),
-        (r"Fax Attention", "FaAttention"),
-    ]
-    df = file_to_dataframe(
-        file=file, id="Mnemonic", headings=HEADINGS, replace=patterns
-    ).fillna("MISSING")
+    if where or columns is not None:
+        # cached rows are whole records, parsed without filters
+        record_cache = None
+    if record_cache is not None:
+        rows = file_to_rows(
+            file,
+            id_splitter("Mnemonic", PATTERNS),
+            lambda records: long_to_records(
+                records_to_long(records, HEADINGS, threads=threads)
+            ),
+            HEADINGS,
+            record_cache=record_cache,
+            limit=limit,
+            sample=sample,
+            keep=record_filter([PHARMACY_FILTER], HEADINGS),
+        )
+        # the columns of every record are kept, as when the whole report was
+        # parsed before filtering for pharmacy entries
+        present = list(
+            dict.fromkeys(
+                heading
+                for record_rows in rows
+                for row in record_rows
+                for heading in row
+            )
+        )
+        rows = [
+            record_rows if pharmacy_rows(record_rows) else list()
+            for record_rows in rows
+        ]
+        if layout == "long":
+            long = rows_to_long(rows, HEADINGS)
+        else:
+            df = rows_to_frame(rows).reindex(columns=present)
+    else:
+        # filter for just pharmacy entries while tokenizing
+        where = [PHARMACY_FILTER] + list(where or [])
+        records = file_to_records(
+            file,
+            id_splitter("Mnemonic", PATTERNS),
+            limit,
+            sample,
+            keep=record_filter(where, HEADINGS),
+        )
+        table = records_to_long(
+            records,
+            HEADINGS,
+            where=where,
+            columns=None if columns is None else ["Mnemonic"] + list(columns),
+            threads=threads,
+        )
+        if layout == "long":
+            long = long_to_rows(table, HEADINGS)
+        else:
+            df = long_to_wide(table)
+            if columns is None and not df.empty:
+                # the columns of every record are kept, as when the whole
+                # report was parsed before filtering for pharmacy entries
+                df = df.reindex(columns=heading_order(records, HEADINGS))
+    if layout == "long":
+        # one row per value, without pivoting the records
+        df = apply_long_schema(long, SCHEMA)
+        df.attrs["layout"] = "long"
+        return df
 
-    # filter for just pharmacy entries
-    df = df[df["Mnemonic"].str.contains("PHA.")]
+    if df.empty:
+        # no record passed the record filters
+        return empty_frame(SCHEMA)
+    df = df.fillna("MISSING")
+    df = apply_schema(df, SCHEMA)
 
     # debug_test_dataframe(df, error_flag=True)
 
     return df
+
+
+def pharmacy_rows(record_rows: list[dict]) -> bool:
+    # whether the parsed rows of a record pass PHARMACY_FILTER, testing the
+    # first Mnemonic as records_to_long does
+    mnemonic = next(
+        (row["Mnemonic"] for row in record_rows if "Mnemonic" in row), None
+    )
+    return mnemonic is not None and PHARMACY_FILTER.test(mnemonic)
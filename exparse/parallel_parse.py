@@ -0,0 +1,151 @@
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from pathlib import Path
+from typing import Callable, Iterator
+
+from record_cache import CACHE_FOLDER, RecordCache
+from shm_transport import SharedFrame, discard_frame, share_frame
+
+
+def parse_in_worker(
+    category: str,
+    file: Path,
+    func: Callable,
+    kwargs: dict,
+    incremental: bool = False,
+    save_cache: bool = True,
+    transport: str = "pickle",
+    cache_folder: Path = CACHE_FOLDER,
+) -> dict:
+    """
+    Parse one input file in a worker process and hand the result back
+    through the chosen transport. The worker keeps its own record cache, as
+    a cache sent to it wouldn't come back updated.
+
+    :param category: parser category
+    :type category: str
+    :param file: input file
+    :type file: Path
+    :param func: registered parse function
+    :type func: Callable
+    :param kwargs: keyword arguments for the parse function
+    :type kwargs: dict
+    :param incremental: reuse and update the category's record cache,
+        defaults to False
+    :type incremental: bool, optional
+    :param save_cache: save the record cache after parsing, defaults to True
+    :type save_cache: bool, optional
+    :param transport: "pickle" or "arrow", see shm_transport
+    :type transport: str, optional
+    :param cache_folder: folder of the record caches, defaults to
+        CACHE_FOLDER
+    :type cache_folder: Path, optional
+    :return: the shared frame, record count, timings and cache hits
+    :rtype: dict
+    """
+    print(f"Parsing {category} dictionary...")
+    record_cache = RecordCache(category, cache_folder) if incremental else None
+    if record_cache is not None:
+        kwargs = {**kwargs, "record_cache": record_cache}
+    start_wall = time.perf_counter()
+    # the worker process only runs this parse, so the CPU time of the whole
+    # process is the parser's, its thread pool included
+    start_cpu = time.process_time()
+    df = func(file=file, **kwargs)
+    result = {
+        "records": len(df),
+        "wall_seconds": time.perf_counter() - start_wall,
+        "cpu_seconds": time.process_time() - start_cpu,
+        "frame": share_frame(df, transport),
+        "cache": None,
+    }
+    if record_cache is not None:
+        if save_cache:
+            record_cache.save()
+        result["cache"] = (record_cache.hits, record_cache.misses)
+    return result
+
+
+def parse_in_workers(
+    jobs: list[tuple],
+    workers: int,
+    incremental: bool = False,
+    save_cache: bool = True,
+    transport: str = "pickle",
+    cache_folder: Path = CACHE_FOLDER,
+) -> Iterator[tuple[str, dict]]:
+    """
+    Parse several input files at once, one per worker process.
+
+    :param jobs: (category, file, func, kwargs, incremental) tuples, the
+        last one saying whether the parser can use a record cache
+    :type jobs: list[tuple]
+    :param workers: number of worker processes
+    :type workers: int
+    :param incremental: use record caches where the parser supports them
+    :type incremental: bool, optional
+    :param save_cache: save the record caches after parsing
+    :type save_cache: bool, optional
+    :param transport: "pickle" or "arrow", see shm_transport
+    :type transport: str, optional
+    :param cache_folder: folder of the record caches
+    :type cache_folder: Path, optional
+    :return: (category, result of parse_in_worker) pairs in job order; if a
+        worker fails or the caller closes the iterator, the frames not
+        handed out yet are freed
+    :rtype: Iterator[tuple[str, dict]]
+    """
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            (
+                category,
+                executor.submit(
+                    parse_in_worker,
+                    category,
+                    file,
+                    func,
+                    kwargs,
+                    incremental and can_cache,
+                    save_cache,
+                    transport,
+                    cache_folder,
+                ),
+            )
+            for category, file, func, kwargs, can_cache in jobs
+        ]
+        # results before this one have been handed to the caller
+        handed = 0
+        try:
+            for category, future in futures:
+                handed += 1
+                yield category, future.result()
+        except BaseException:
+            # a worker failed or the caller stopped: the frames nobody will
+            # attach would keep their shared memory blocks until reboot
+            for _, future in futures[handed:]:
+                discard_result(future)
+            raise
+
+
+def discard_result(future: Future) -> None:
+    """
+    Wait for a worker's result and free the shared memory block of its
+    frame, unless the worker never started or failed.
+    """
+    if future.cancel():
+        return
+    try:
+        result = future.result()
+    except Exception:
+        return
+    discard_frame(result["frame"])
+
+
+def transfer_summary(frames: list[SharedFrame]) -> str:
+    moved = sum(frame.bytes_moved for frame in frames)
+    seconds = sum(frame.seconds + frame.attach_seconds for frame in frames)
+    shared = sum(frame.shm_bytes for frame in frames)
+    return (
+        f"Moved {moved / 1e6:.1f} MB from workers ({shared / 1e6:.1f} MB "
+        f"through shared memory) in {seconds:.2f}s"
+    )
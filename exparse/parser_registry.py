@@ -0,0 +1,135 @@
+import importlib
+import re
+from dataclasses import dataclass, field
+from typing import Callable
+
+# parser modules in export order, importing them registers their parsers
+PARSER_MODULES = [
+    "dosing_set_parse",
+    "order_string_parse",
+    "direction_parse",
+    "outside_location_parse",
+    "conflict_parse",
+    "unit_of_measure_parse",
+    "solarwinds_parse",
+]
+
+
+@dataclass(frozen=True)
+class ParserSpec:
+    """
+    A registered parser and the information used to route input files to it.
+
+    :param category: name of the parsed category, also used as sheet name
+    :param func: parse function taking the input file as "file"
+    :param signatures: regexes for headings or report titles that appear near
+        the top of the parser's input files
+    :param filename_hint: substring of the file name used to break ties
+    :param schema: declared output columns of the parser
+    :param patterns: regexes the parser applies to its input text, either
+        (regex, replacement) substitutions or bare regexes, audited by
+        regex_audit
+    :param incremental: whether the parser takes a record_cache argument
+        and can reuse the parsed rows of the records of a previous run
+    :param record_key: regex matching the start of each record in the raw
+        report, with the record's key in group 1, used by record_index;
+        matches where group 1 doesn't take part start no record
+    :param record_preamble: whether a record parsed on its own needs the
+        text before the first record, e.g. a table's header row
+    :param threaded: whether the parser takes a threads argument and can
+        run its record-level work on a thread pool
+    :param long_layout: whether the parser takes a layout argument and can
+        build the long layout from its records without pivoting them
+    """
+
+    category: str
+    func: Callable
+    signatures: tuple[re.Pattern, ...]
+    filename_hint: str
+    schema: list = field(default_factory=list)
+    patterns: list = field(default_factory=list)
+    incremental: bool = False
+    record_key: str | None = None
+    record_preamble: bool = False
+    threaded: bool = False
+    long_layout: bool = False
+
+
+PARSERS: dict[str, ParserSpec] = dict()
+
+
+def register_parser(
+    category: str,
+    signatures: list[str],
+    filename_hint: str,
+    schema: list | None = None,
+    patterns: list | None = None,
+    incremental: bool = False,
+    record_key: str | None = None,
+    record_preamble: bool = False,
+    threaded: bool = False,
+    long_layout: bool = False,
+) -> Callable:
+    """
+    Decorator registering a parse function under a category.
+
+    :param category: name of the parsed category, e.g. "dosing_sets"
+    :type category: str
+    :param signatures: regexes matched against the head of input files
+    :type signatures: list[str]
+    :param filename_hint: substring of the file name used to break ties
+    :type filename_hint: str
+    :param schema: declared output columns, defaults to None
+    :type schema: list | None, optional
+    :param patterns: regexes applied to the input text, defaults to None
+    :type patterns: list | None, optional
+    :param incremental: whether the parse function takes a record_cache
+        argument, defaults to False
+    :type incremental: bool, optional
+    :param record_key: regex matching the start of each raw record, with
+        the record's key in group 1, defaults to None
+    :type record_key: str | None, optional
+    :param record_preamble: whether a single record needs the text before
+        the first record to be parsed, defaults to False
+    :type record_preamble: bool, optional
+    :param threaded: whether the parse function takes a threads argument,
+        defaults to False
+    :type threaded: bool, optional
+    :param long_layout: whether the parse function takes a layout argument,
+        defaults to False
+    :type long_layout: bool, optional
+    :return: decorator that registers and returns the parse function
+    :rtype: Callable
+    """
+
+    def decorator(func: Callable) -> Callable:
+        PARSERS[category] = ParserSpec(
+            category=category,
+            func=func,
+            signatures=tuple(
+                re.compile(signature, re.MULTILINE) for signature in signatures
+            ),
+            filename_hint=filename_hint,
+            schema=list(schema or []),
+            patterns=list(patterns or []),
+            incremental=incremental,
+            record_key=record_key,
+            record_preamble=record_preamble,
+            threaded=threaded,
+            long_layout=long_layout,
+        )
+        return func
+
+    return decorator
+
+
+def load_parsers() -> dict[str, ParserSpec]:
+    """
+    Import every parser module so its parsers are registered.
+
+    :return: the registered parsers in export order
+    :rtype: dict[str, ParserSpec]
+    """
+    for module in PARSER_MODULES:
+        importlib.import_module(module)
+    return PARSERS
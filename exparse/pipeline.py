@@ -0,0 +1,119 @@
+import queue
+import threading
+from pathlib import Path
+from typing import Callable, Iterable
+
+import pandas as pd
+
+from compressed_input import ReportInput
+
+# marks the end of a stage's output
+DONE = object()
+# seconds between checks whether another stage has failed
+POLL_SECONDS = 0.1
+
+
+def put(items: queue.Queue, item, stop: threading.Event) -> bool:
+    # block while the queue is full, unless another stage has failed
+    while not stop.is_set():
+        try:
+            items.put(item, timeout=POLL_SECONDS)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def get(items: queue.Queue, stop: threading.Event):
+    while not stop.is_set():
+        try:
+            return items.get(timeout=POLL_SECONDS)
+        except queue.Empty:
+            pass
+    return DONE
+
+
+def run_pipeline(
+    jobs: Iterable[tuple[str, Path]],
+    parse: Callable[[str, ReportInput], pd.DataFrame],
+    write: Callable[[str, pd.DataFrame], None],
+    read: Callable[[Path], ReportInput] = Path.read_bytes,
+    prefetch: int = 1,
+    backlog: int = 1,
+) -> None:
+    """
+    Read, parse and write the input files in three overlapping stages. A
+    reader thread reads the next files while the current one is parsed in
+    the calling thread, and a writer thread writes each parsed dataframe as
+    soon as it is ready. The queues between the stages are bounded, so at
+    most the dataframe being written, backlog queued ones and the one being
+    parsed are held at once; each is dropped once written.
+
+    :param jobs: (category, file) pairs in output order
+    :type jobs: Iterable[tuple[str, Path]]
+    :param parse: function parsing the read input of a category
+    :type parse: Callable[[str, ReportInput], pd.DataFrame]
+    :param write: function writing the dataframe of a category
+    :type write: Callable[[str, pd.DataFrame], None]
+    :param read: function reading an input file, defaults to reading its
+        bytes
+    :type read: Callable[[Path], ReportInput], optional
+    :param prefetch: number of read files waiting to be parsed, defaults
+        to 1
+    :type prefetch: int, optional
+    :param backlog: number of parsed dataframes waiting to be written,
+        defaults to 1
+    :type backlog: int, optional
+    :raises Exception: the first error raised by any stage, after the
+        other stages have stopped
+    """
+    inputs = queue.Queue(maxsize=prefetch)
+    outputs = queue.Queue(maxsize=backlog)
+    stop = threading.Event()
+    errors = list()
+
+    def fail(error: BaseException) -> None:
+        errors.append(error)
+        stop.set()
+
+    def read_stage() -> None:
+        try:
+            for category, file in jobs:
+                if not put(inputs, (category, read(file)), stop):
+                    return
+            put(inputs, DONE, stop)
+        except BaseException as e:
+            fail(e)
+
+    def write_stage() -> None:
+        try:
+            while (item := get(outputs, stop)) is not DONE:
+                write(*item)
+                # release the dataframe before waiting for the next one
+                del item
+        except BaseException as e:
+            fail(e)
+
+    threads = [
+        threading.Thread(target=read_stage, name="exparse-read"),
+        threading.Thread(target=write_stage, name="exparse-write"),
+    ]
+    for thread in threads:
+        thread.start()
+    try:
+        while (item := get(inputs, stop)) is not DONE:
+            category, report = item
+            del item
+            df = parse(category, report)
+            del report
+            if not put(outputs, (category, df), stop):
+                break
+            del df
+        put(outputs, DONE, stop)
+    except BaseException as e:
+        fail(e)
+    finally:
+        for thread in threads:
+            thread.join()
+    if errors:
+        raise errors[0]
@@ -0,0 +1,172 @@
+import hashlib
+import json
+import threading
+from pathlib import Path
+
+CACHE_FOLDER = Path("output", ".record_cache")
+# bumped when what the cached rows hold changes, so older caches are
+# discarded
+CACHE_VERSION = 3
+
+
+def record_hash(record: str) -> str:
+    return hashlib.sha1(record.encode()).hexdigest()
+
+
+class RecordCache:
+    """
+    Finished output rows of every record of one parser category, keyed by
+    the hash of the record's text. An incremental parse only parses new or
+    changed records and reuses the cached rows for the rest, so the result
+    is the same as a full parse. The hash of the whole input is kept too, so
+    an unchanged file reuses every row without being split into records.
+
+    Rows are dicts of column to value, with missing values left out; tuple
+    columns (MultiIndex labels) are stored as lists. Lookups, updates and
+    saving hold a lock, so records can be parsed on several threads.
+    """
+
+    def __init__(
+        self, category: str, cache_folder: Path | None = CACHE_FOLDER
+    ) -> None:
+        self.path = (
+            Path(cache_folder, f"{category}.json")
+            if cache_folder is not None
+            else None
+        )
+        self.headings_hash = None
+        self.file_hash = None
+        self.order = list()
+        self.records = dict()
+        self.used = dict()
+        self.hits = 0
+        self.misses = 0
+        # only write the cache back if this parse added or dropped rows
+        self.changed = False
+        self.lock = threading.Lock()
+        if self.path is not None and self.path.exists():
+            try:
+                cache = json.loads(self.path.read_text())
+            except (OSError, ValueError):
+                cache = dict()
+            self.headings_hash = cache.get("headings")
+            self.file_hash = cache.get("file")
+            self.order = cache.get("order", list())
+            self.records = cache.get("records", dict())
+
+    def use_headings(self, headings: list[str]) -> None:
+        """
+        Set the headings records are parsed with. Cached rows are only valid
+        for the same headings, so a different list clears the cache.
+
+        :param headings: headings the parser captures
+        :type headings: list[str]
+        """
+        headings_hash = record_hash(json.dumps([CACHE_VERSION, headings]))
+        with self.lock:
+            if headings_hash != self.headings_hash:
+                self.headings_hash = headings_hash
+                self.file_hash = None
+                self.order = list()
+                self.records = dict()
+                self.changed = True
+
+    def get_file(self, text: str) -> list[list[dict]] | None:
+        """
+        Get the rows of every record of an input identical to the cached one.
+
+        :param text: whole text of the input
+        :type text: str
+        :return: rows of each record in file order, or None if the input
+            changed
+        :rtype: list[list[dict]] | None
+        """
+        file_hash = record_hash(text)
+        with self.lock:
+            if file_hash != self.file_hash:
+                return None
+            if any(key not in self.records for key in self.order):
+                return None
+            self.hits += len(self.order)
+            self.used = {key: self.records[key] for key in self.order}
+            cached = [self.records[key] for key in self.order]
+        return [load_rows(rows) for rows in cached]
+
+    def put_file(self, text: str, records: list[str]) -> None:
+        """
+        Record the input the cached rows were last parsed from.
+
+        :param text: whole text of the input
+        :type text: str
+        :param records: records the input was split into, in file order
+        :type records: list[str]
+        """
+        file_hash = record_hash(text)
+        order = [record_hash(record) for record in records]
+        with self.lock:
+            self.file_hash = file_hash
+            self.order = order
+            self.changed = True
+
+    def get(self, record: str) -> list[dict] | None:
+        """
+        Get the cached output rows of a record.
+
+        :param record: text of the record
+        :type record: str
+        :return: the rows, or None if the record is new or changed
+        :rtype: list[dict] | None
+        """
+        key = record_hash(record)
+        with self.lock:
+            rows = self.records.get(key)
+            if rows is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.used[key] = rows
+        return load_rows(rows)
+
+    def put(self, record: str, rows: list[dict]) -> None:
+        key = record_hash(record)
+        rows = dump_rows(rows)
+        with self.lock:
+            self.records[key] = self.used[key] = rows
+            self.changed = True
+
+    def save(self) -> None:
+        """
+        Write the records seen in this parse, so records removed from the
+        file don't stay in the cache. Nothing is written if every row came
+        from the cache.
+        """
+        if self.path is None:
+            return
+        with self.lock:
+            if not self.changed and len(self.used) == len(self.records):
+                return
+            cache = json.dumps(
+                {
+                    "headings": self.headings_hash,
+                    "file": self.file_hash,
+                    "order": self.order,
+                    "records": self.used,
+                }
+            )
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.path.write_text(cache)
+
+
+def dump_rows(rows: list[dict]) -> list[list]:
+    # JSON objects only have string keys, so rows are stored as pairs
+    return [
+        [[list(c) if isinstance(c, tuple) else c, v] for c, v in row.items()]
+        for row in rows
+    ]
+
+
+def load_rows(rows: list[list]) -> list[dict]:
+    return [
+        {tuple(c) if isinstance(c, list) else c: v for c, v in row}
+        for row in rows
+    ]
@@ -0,0 +1,193 @@
+import hashlib
+import json
+import mmap
+import re
+from pathlib import Path
+
+import pandas as pd
+
+from compressed_input import detect_compression
+from input_router import InputRouter
+from parser_registry import ParserSpec, load_parsers
+
+INDEX_SUFFIX = ".idx.json"
+
+
+def index_path(file: Path) -> Path:
+    # the sidecar sits next to the report it indexes
+    return file.with_name(file.name + INDEX_SUFFIX)
+
+
+def is_index_file(file: Path) -> bool:
+    return file.name.endswith(INDEX_SUFFIX)
+
+
+def file_hash(file: Path) -> str:
+    digest = hashlib.sha1()
+    with open(file, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def scan_records(file: Path, record_key: str) -> tuple[int, dict]:
+    """
+    Find the byte offset and length of every record in a report with one
+    scan of the memory-mapped file. A record runs from its key match to the
+    next record's key match or the end of the file. Matches without a key,
+    e.g. page headers, start no record.
+
+    :param file: report file
+    :type file: Path
+    :param record_key: regex matching the start of each record, with the
+        record's key in group 1
+    :type record_key: str
+    :return: length of the text before the first record, and the
+        [offset, length] spans of each key in file order
+    :rtype: tuple[int, dict]
+    """
+    size = file.stat().st_size
+    if size == 0:
+        return 0, dict()
+    regex = re.compile(record_key.encode(), re.MULTILINE)
+    with (
+        open(file, "rb") as f,
+        mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data,
+    ):
+        starts = list()
+        keys = list()
+        for match in regex.finditer(data):
+            if match.group(1) is None:
+                continue
+            starts.append(match.start())
+            keys.append(match.group(1).decode("utf-8", errors="replace"))
+    ends = starts[1:] + [size]
+    records = dict()
+    for key, start, end in zip(keys, starts, ends):
+        # a key repeated in the report maps to all of its records
+        records.setdefault(key, list()).append([start, end - start])
+    preamble = starts[0] if starts else size
+    return preamble, records
+
+
+def build_index(file: Path, spec: ParserSpec) -> dict:
+    """
+    Index a report and write the index to its sidecar file.
+
+    :param file: report file
+    :type file: Path
+    :param spec: registered parser of the report
+    :type spec: ParserSpec
+    :raises ValueError: if the parser has no record key or the report is
+        compressed
+    :return: the index, with the file's hash, size and modification time,
+        the length of its preamble and the spans of each record key
+    :rtype: dict
+    """
+    if spec.record_key is None:
+        raise ValueError(f"The {spec.category} parser has no record key")
+    if detect_compression(file) is not None:
+        # byte offsets into a compressed stream can't be seeked to
+        raise ValueError(f"Compressed reports can't be indexed: {file}")
+    stat = file.stat()
+    preamble, records = scan_records(file, spec.record_key)
+    index = {
+        "category": spec.category,
+        "record_key": spec.record_key,
+        "hash": file_hash(file),
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "preamble": preamble,
+        "records": records,
+    }
+    index_path(file).write_text(json.dumps(index))
+    return index
+
+
+def load_index(file: Path, spec: ParserSpec) -> dict:
+    """
+    Load a report's index from its sidecar file, rebuilding it if the report
+    has changed. Unchanged size and modification time are trusted without
+    reading the report; otherwise the report is hashed and the index is only
+    kept if the hash still matches.
+
+    :param file: report file
+    :type file: Path
+    :param spec: registered parser of the report
+    :type spec: ParserSpec
+    :return: the report's index
+    :rtype: dict
+    """
+    path = index_path(file)
+    try:
+        index = json.loads(path.read_text())
+    except (OSError, ValueError):
+        return build_index(file, spec)
+    if (
+        index.get("category") != spec.category
+        or index.get("record_key") != spec.record_key
+    ):
+        return build_index(file, spec)
+
+    stat = file.stat()
+    if index["size"] == stat.st_size and index["mtime_ns"] == stat.st_mtime_ns:
+        return index
+    if index["size"] == stat.st_size and index["hash"] == file_hash(file):
+        # touched but not changed
+        index["mtime_ns"] = stat.st_mtime_ns
+        path.write_text(json.dumps(index))
+        return index
+    return build_index(file, spec)
+
+
+def read_record(file: Path, index: dict, key: str, preamble: bool) -> bytes:
+    """
+    Read the raw bytes of every record with a key, seeking straight to each.
+
+    :raises KeyError: if the key isn't in the index
+    """
+    spans = index["records"].get(key)
+    if spans is None:
+        raise KeyError(f"No record {key!r} in {file}")
+    parts = list()
+    with open(file, "rb") as f:
+        if preamble:
+            parts.append(f.read(index["preamble"]))
+        for offset, length in spans:
+            f.seek(offset)
+            parts.append(f.read(length))
+    return b"".join(parts)
+
+
+def parse_one(
+    file: Path | str, key: str, category: str | None = None
+) -> pd.DataFrame:
+    """
+    Parse the single record with a key, e.g. one Mnemonic of a conflicts
+    report, without reading the rest of the file. The report is indexed on
+    the first lookup and the index is kept in a sidecar file next to it.
+
+    :param file: report file
+    :type file: Path | str
+    :param key: record key, e.g. the Mnemonic, group mnemonic, dosing set
+        ID or first column, depending on the report
+    :type key: str
+    :param category: parser category, defaults to routing the file by its
+        content
+    :type category: str | None, optional
+    :raises ValueError: if the file matches no parser that can be indexed,
+        or is compressed
+    :raises KeyError: if the key isn't in the report
+    :return: the parser's output for that record
+    :rtype: pd.DataFrame
+    """
+    file = Path(file)
+    parsers = load_parsers()
+    if category is None:
+        # a lookup may run from any folder, so no route cache is kept
+        category = InputRouter(parsers, cache_path=None).classify(file)
+    if category is None:
+        raise ValueError(f"No parser matches {file}")
+    spec = parsers[category]
+    index = load_index(file, spec)
+    return spec.func(file=read_record(file, index, key, spec.record_preamble))
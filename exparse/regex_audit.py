@@ -0,0 +1,219 @@
+import re
+import time
+
+import numpy as np
+import pandas as pd
+
+from common_functions import COMMON_CLEANUP_PATTERNS, HEADING_REGEX
+from parser_registry import load_parsers
+
+# input lengths in characters, spread widely so timing noise barely moves
+# the fitted exponent
+SIZES = (4000, 16000, 64000)
+# text repeated after a pattern's literal prefix to build adversarial inputs
+FILLERS = (" ", "\n", " \n", "a", "a ", "1", " 1", "-")
+# a linear pattern takes 4 times as long on an input 4 times the size
+MAX_EXPONENT = 1.5
+# seconds a single scan may take before the pattern fails outright
+TIME_LIMIT = 1.0
+# minimum seconds timed per measurement, to smooth out fast scans
+MIN_TIMING = 0.005
+
+LITERAL_REGEX = re.compile(r"(?:\\[^\w\s]|[^\\()\[\]{}.*+?|^$])+")
+
+
+def literal_prefix(pattern: str) -> str:
+    """
+    Get the literal text a pattern starts with, e.g. "Mnemonic" for
+    "(Mnemonic.*?)(\\s+)Name". Patterns starting with a character class or
+    quantifier have an empty prefix.
+
+    :param pattern: regex source
+    :type pattern: str
+    :return: unescaped literal prefix
+    :rtype: str
+    """
+    pattern = re.sub(r"^(?:\(\?[a-zA-Z]+\)|\^|\((?!\?))*", "", pattern)
+    match = LITERAL_REGEX.match(pattern)
+    if match is None:
+        return ""
+    return re.sub(r"\\(.)", r"\1", match.group())
+
+
+def adversarial_inputs(pattern: str, size: int) -> dict[str, str]:
+    """
+    Build inputs of about size characters that make a pattern start matching
+    and then fail: one long unterminated match attempt after the pattern's
+    literal prefix, and many short attempts on separate lines.
+
+    :param pattern: regex source
+    :type pattern: str
+    :param size: length of each input in characters
+    :type size: int
+    :return: inputs keyed by a description of their shape
+    :rtype: dict[str, str]
+    """
+    prefix = literal_prefix(pattern)
+    inputs = dict()
+    for filler in FILLERS:
+        inputs[f"prefix + {filler!r} * n"] = prefix + filler * (
+            size // len(filler)
+        )
+        line = prefix + filler * 8 + "\n"
+        inputs[f"(prefix + {filler!r} * 8) lines"] = line * max(
+            1, size // len(line)
+        )
+    return inputs
+
+
+def scan_time(regex: re.Pattern, text: str) -> float:
+    """
+    Time finding every match of a regex in a text, the way re.sub and
+    finditer scan it.
+
+    :return: seconds per scan, the best of three measurements
+    :rtype: float
+    """
+    best = float("inf")
+    for _ in range(3):
+        runs = 0
+        start = time.perf_counter()
+        while True:
+            for _ in regex.finditer(text):
+                pass
+            runs += 1
+            elapsed = time.perf_counter() - start
+            if elapsed >= MIN_TIMING or elapsed >= TIME_LIMIT:
+                break
+        best = min(best, elapsed / runs)
+        if best >= TIME_LIMIT:
+            break
+    return best
+
+
+def scaling_exponent(sizes, seconds) -> float:
+    """
+    Fit seconds = c * size ** k and return k: about 1 for linear patterns
+    and 2 or more for patterns that backtrack catastrophically.
+    """
+    return float(np.polyfit(np.log(sizes), np.log(seconds), 1)[0])
+
+
+def audit_pattern(
+    pattern: str, sizes=SIZES, max_exponent: float = MAX_EXPONENT
+) -> dict:
+    """
+    Measure how the match time of one pattern grows over its adversarial
+    inputs and report the worst input.
+
+    :param pattern: regex source, compiled with re.MULTILINE as
+        regex_substitution does
+    :type pattern: str
+    :param sizes: input lengths to measure
+    :param max_exponent: largest scaling exponent that still passes
+    :type max_exponent: float
+    :return: the worst input shape, its exponent and largest timing, and
+        whether the pattern passed
+    :rtype: dict
+    """
+    regex = re.compile(pattern, re.MULTILINE)
+    worst = {"input": None, "exponent": 0.0, "seconds": 0.0}
+    for shape in adversarial_inputs(pattern, sizes[0]):
+        timings = list()
+        for size in sizes:
+            text = adversarial_inputs(pattern, size)[shape]
+            timings.append(scan_time(regex, text))
+            if timings[-1] >= TIME_LIMIT:
+                break
+        if timings[-1] >= TIME_LIMIT:
+            exponent = float("inf")
+        else:
+            exponent = scaling_exponent(sizes, timings)
+        if exponent > worst["exponent"]:
+            worst = {
+                "input": shape,
+                "exponent": exponent,
+                "seconds": timings[-1],
+            }
+    return {**worst, "passed": worst["exponent"] <= max_exponent}
+
+
+def registered_patterns() -> list[tuple[str, str]]:
+    """
+    Collect the shared cleanup patterns and every registered parser's
+    patterns.
+
+    :return: (source, regex) pairs, source being "common" or the parser
+        category
+    :rtype: list[tuple[str, str]]
+    """
+    patterns = [
+        ("common", pattern)
+        for pattern in [p for p, _ in COMMON_CLEANUP_PATTERNS]
+        + [HEADING_REGEX]
+    ]
+    for category, spec in load_parsers().items():
+        for pattern in spec.patterns:
+            if isinstance(pattern, tuple):
+                pattern = pattern[0]
+            patterns.append((category, pattern))
+        if spec.record_key is not None:
+            patterns.append((category, spec.record_key))
+    return patterns
+
+
+def audit_patterns(
+    patterns: list[tuple[str, str]] | None = None,
+    sizes=SIZES,
+    max_exponent: float = MAX_EXPONENT,
+) -> pd.DataFrame:
+    """
+    Audit every registered pattern against adversarial inputs of growing
+    size.
+
+    :param patterns: (source, regex) pairs, defaults to
+        registered_patterns()
+    :type patterns: list[tuple[str, str]] | None, optional
+    :param sizes: input lengths to measure
+    :param max_exponent: largest scaling exponent that still passes
+    :type max_exponent: float
+    :return: one row per pattern with its worst input, exponent, timing at
+        the largest size and whether it passed
+    :rtype: pd.DataFrame
+    """
+    if patterns is None:
+        patterns = registered_patterns()
+    rows = list()
+    for source, pattern in patterns:
+        rows.append(
+            {
+                "source": source,
+                "pattern": pattern,
+                **audit_pattern(pattern, sizes, max_exponent),
+            }
+        )
+    return pd.DataFrame(rows)
+
+
+def print_audit(max_exponent: float = MAX_EXPONENT) -> pd.DataFrame:
+    """
+    Print the audit of every registered pattern.
+
+    :param max_exponent: largest scaling exponent that still passes
+    :type max_exponent: float
+    :return: the patterns that failed
+    :rtype: pd.DataFrame
+    """
+    report = audit_patterns(max_exponent=max_exponent)
+    print(
+        report[
+            ["source", "pattern", "input", "exponent", "seconds", "passed"]
+        ].to_string(index=False)
+    )
+    failures = report[~report["passed"]]
+    for row in failures.itertuples(index=False):
+        print(
+            f"\nSUPERLINEAR: {row.source} pattern {row.pattern!r} scales "
+            f"with exponent {row.exponent:.2f} on {row.input}"
+        )
+    return failures
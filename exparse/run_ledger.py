@@ -0,0 +1,309 @@
+import json
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+
+HISTORY_PATH = Path("output", "run_history.jsonl")
+# run settings that change a parser's throughput, so each parser is only
+# compared with runs made with the same settings. Records written before a
+# setting was recorded get the default value
+RUN_SETTINGS = {
+    "pipelined": False,
+    "incremental": False,
+    "workers": 1,
+    "threads": 1,
+}
+
+
+def peak_rss_bytes() -> int | None:
+    """
+    Get the peak resident set size of the current process.
+
+    :return: peak RSS in bytes, or None if it can't be measured
+    :rtype: int | None
+    """
+    try:
+        import resource
+    except ImportError:
+        # Windows has no resource module, psutil (the "stats" extra)
+        # reports the peak working set
+        try:
+            import psutil
+        except ImportError:
+            return None
+        return int(psutil.Process().memory_info().peak_wset)
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return int(peak if sys.platform == "darwin" else peak * 1024)
+
+
+class RunRecorder:
+    """
+    Collects timings and sizes for one exparse run and appends them to the
+    run history file as a single JSON line.
+    """
+
+    def __init__(self, history_path: Path = HISTORY_PATH, **settings) -> None:
+        self.history_path = history_path
+        # the RUN_SETTINGS of this run, e.g. pipelined=True when files were
+        # read and exported while others were parsed
+        self.settings = RUN_SETTINGS | settings
+        self.started = datetime.now().isoformat(timespec="seconds")
+        self.start_wall = time.perf_counter()
+        self.parsers = list()
+        self.export_seconds = 0.0
+        self.cache_hits = 0
+
+    @contextmanager
+    def time_parser(
+        self, category: str, file: Path | None, threads: int | None = 1
+    ):
+        """
+        Time a parser call. The yielded dict takes the parsed dataframe under
+        "df" so the record count can be stored, and e.g. the number of
+        records reused from the record cache under "cache_hits". The CPU time of a parser
+        running in one thread is that thread's, so it leaves out the reading
+        and exporting done on other threads meanwhile; a parser running on a
+        thread pool is timed with the CPU time of the whole process.
+
+        :param category: parser category, e.g. "dosing_sets"
+        :type category: str
+        :param file: input file being parsed
+        :type file: Path | None
+        :param threads: threads the parser runs on, defaults to 1
+        :type threads: int | None, optional
+        """
+        cpu_time = time.thread_time if threads == 1 else time.process_time
+        result = dict()
+        start_wall = time.perf_counter()
+        start_cpu = cpu_time()
+        yield result
+        df = result.get("df")
+        self.add_parser(
+            category,
+            file,
+            records=len(df) if df is not None else 0,
+            wall_seconds=time.perf_counter() - start_wall,
+            cpu_seconds=cpu_time() - start_cpu,
+            **{key: value for key, value in result.items() if key != "df"},
+        )
+
+    def add_parser(
+        self,
+        category: str,
+        file: Path | None,
+        records: int,
+        wall_seconds: float,
+        cpu_seconds: float,
+        **extra,
+    ) -> None:
+        """
+        Record a parser call timed elsewhere, e.g. in a worker process.
+        Extra keyword arguments are stored with the timings.
+        """
+        self.parsers.append(
+            {
+                "category": category,
+                "file": str(file) if file is not None else None,
+                "input_bytes": file_size(file),
+                "records": records,
+                "wall_seconds": wall_seconds,
+                "cpu_seconds": cpu_seconds,
+                **extra,
+            }
+        )
+
+    @contextmanager
+    def time_export(self):
+        start = time.perf_counter()
+        yield
+        self.export_seconds += time.perf_counter() - start
+
+    def to_record(self) -> dict:
+        return {
+            "started": self.started,
+            "wall_seconds": time.perf_counter() - self.start_wall,
+            "input_bytes": sum(p["input_bytes"] for p in self.parsers),
+            "records": sum(p["records"] for p in self.parsers),
+            "parsers": self.parsers,
+            "export_seconds": self.export_seconds,
+            "peak_rss_bytes": peak_rss_bytes(),
+            "cache_hits": self.cache_hits,
+            **self.settings,
+        }
+
+    def save(self) -> dict:
+        """
+        Append this run's record to the history file.
+
+        :return: the record that was written
+        :rtype: dict
+        """
+        record = self.to_record()
+        self.history_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.history_path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+        return record
+
+
+def file_size(file: Path | None) -> int:
+    try:
+        return Path(file).stat().st_size
+    except (OSError, TypeError):
+        return 0
+
+
+def load_history(history_path: Path = HISTORY_PATH) -> pd.DataFrame:
+    """
+    Load the run history as one row per parser per run.
+
+    :param history_path: path of the run history file
+    :type history_path: Path
+    :return: dataframe of parser timings with run level columns prefixed
+        with "run_"
+    :rtype: pd.DataFrame
+    """
+    if not history_path.exists():
+        return pd.DataFrame()
+
+    rows = list()
+    with open(history_path) as f:
+        for run, line in enumerate(f):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            for parser in record.get("parsers", []):
+                rows.append(
+                    {
+                        "run": run,
+                        "run_started": record.get("started"),
+                        "run_export_seconds": record.get("export_seconds"),
+                        "run_peak_rss_bytes": record.get("peak_rss_bytes"),
+                        "run_cache_hits": record.get("cache_hits"),
+                        **{
+                            f"run_{name}": record.get(name, default)
+                            for name, default in RUN_SETTINGS.items()
+                        },
+                        **parser,
+                    }
+                )
+    df = pd.DataFrame(rows)
+    if df.empty:
+        return df
+    df["run_started"] = pd.to_datetime(df["run_started"])
+    # throughput in input megabytes per second of parser wall time
+    df["mb_per_second"] = (
+        df["input_bytes"]
+        / 1e6
+        / df["wall_seconds"].where(df["wall_seconds"] > 0)
+    )
+    return df
+
+
+def throughput_regressions(
+    history: pd.DataFrame, fraction: float = 0.5, window: int = 10
+) -> pd.DataFrame:
+    """
+    Compare each parser's throughput with the rolling median of its previous
+    runs made with the same RUN_SETTINGS and, as reused records make a
+    parser far faster, with the same use of its record cache.
+
+    :param history: dataframe from load_history
+    :type history: pd.DataFrame
+    :param fraction: flag runs below this fraction of the median, defaults
+        to 0.5
+    :type fraction: float, optional
+    :param window: number of previous runs in the rolling median, defaults
+        to 10
+    :type window: int, optional
+    :return: history with "rolling_median" and "regression" columns
+    :rtype: pd.DataFrame
+    """
+    history = history.sort_values(["category", "run"]).copy()
+    # records reused from the parser's record cache
+    hits = history.reindex(columns=["cache_hits"])["cache_hits"]
+    history["warm"] = hits.fillna(0) > 0
+    baseline = ["category", "warm"] + [f"run_{name}" for name in RUN_SETTINGS]
+    # shift so each run is compared with the runs before it only
+    history["rolling_median"] = history.groupby(baseline)[
+        "mb_per_second"
+    ].transform(lambda s: s.shift().rolling(window, min_periods=1).median())
+    history["regression"] = history["mb_per_second"] < (
+        fraction * history["rolling_median"]
+    )
+    return history
+
+
+def print_stats(
+    history_path: Path = HISTORY_PATH,
+    fraction: float = 0.5,
+    window: int = 10,
+    last: int = 10,
+) -> pd.DataFrame:
+    """
+    Print per-parser trends from the run history and flag any parser whose
+    latest throughput fell below a fraction of its rolling median.
+
+    :param history_path: path of the run history file
+    :type history_path: Path
+    :param fraction: regression threshold as a fraction of the median
+    :type fraction: float
+    :param window: number of previous runs in the rolling median
+    :type window: int
+    :param last: number of most recent runs to show per parser
+    :type last: int
+    :return: latest run of every parser that regressed
+    :rtype: pd.DataFrame
+    """
+    history = load_history(history_path)
+    if history.empty:
+        print(f"No runs recorded in {history_path}")
+        return history
+
+    history = throughput_regressions(history, fraction, window)
+    columns = [
+        "run_started",
+        "input_bytes",
+        "records",
+        "wall_seconds",
+        "cpu_seconds",
+        "mb_per_second",
+        "rolling_median",
+        "regression",
+    ]
+    for category, runs in history.groupby("category"):
+        print(f"\n{category}")
+        print(runs[columns].tail(last).to_string(index=False))
+
+    runs = (
+        history.sort_values("run")
+        .drop_duplicates("run", keep="last")
+        .tail(last)
+    )
+    print("\nruns")
+    print(
+        runs[
+            [
+                "run_started",
+                "run_export_seconds",
+                "run_peak_rss_bytes",
+                "run_cache_hits",
+                *(f"run_{name}" for name in RUN_SETTINGS),
+            ]
+        ].to_string(index=False)
+    )
+
+    latest = history.drop_duplicates("category", keep="last")
+    regressions = latest[latest["regression"]]
+    for row in regressions.itertuples(index=False):
+        print(
+            f"\nREGRESSION: {row.category} ran at {row.mb_per_second:.2f} MB/s, "
+            f"below {fraction:.0%} of its rolling median "
+            f"({row.rolling_median:.2f} MB/s)"
+        )
+    return regressions
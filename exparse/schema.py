@@ -0,0 +1,247 @@
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+COLUMN_TYPES = ("numeric", "boolean", "time", "categorical", "string")
+BOOLEAN_VALUES = {"YES": True, "Y": True, "NO": False, "N": False}
+TIME_FORMAT = "%H:%M"
+ERROR_COLUMNS = ["Column", "Row", "Value", "Expected"]
+
+
+@dataclass(frozen=True)
+class Column:
+    """
+    Declared type of one parser output column.
+
+    :param name: column name in the parser's output
+    :param type: one of numeric, boolean (Yes/No/Y/N), time (HH:MM),
+        categorical or string
+    :param required: whether every row must have a value
+    """
+
+    name: str
+    type: str = "string"
+    required: bool = False
+
+    def __post_init__(self) -> None:
+        if self.type not in COLUMN_TYPES:
+            raise ValueError(
+                f"Unknown column type {self.type!r} for {self.name!r}"
+            )
+
+
+def coerce_column(text: pd.Series, column_type: str) -> pd.Series:
+    """
+    Convert a column of stripped strings to the declared type. Values that
+    can't be converted become missing.
+
+    :param text: column values as stripped strings, missing values as NaN
+    :type text: pd.Series
+    :param column_type: declared column type
+    :type column_type: str
+    :return: the converted column
+    :rtype: pd.Series
+    """
+    if column_type == "numeric":
+        return pd.to_numeric(text, errors="coerce")
+    if column_type == "boolean":
+        return text.str.upper().map(BOOLEAN_VALUES).astype("boolean")
+    if column_type == "time":
+        # checked as a time of day but kept as HH:MM text, which reads the
+        # same in the export whatever the engine
+        times = pd.to_datetime(text, format=TIME_FORMAT, errors="coerce")
+        return times.dt.strftime(TIME_FORMAT)
+    if column_type == "categorical":
+        return text.astype("category")
+    return text
+
+
+def coerce_position(
+    df: pd.DataFrame, position: int, column: Column
+) -> list[pd.DataFrame]:
+    """
+    Coerce the column at a position in place.
+
+    :return: tables of the values that failed coercion or are missing
+    :rtype: list[pd.DataFrame]
+    """
+    values = df.iloc[:, position]
+    text = values.where(values.isna(), values.astype(str).str.strip())
+    present = text.notna() & (text != "")
+    failed = pd.Series(False, index=df.index)
+    if column.type != "string":
+        coerced = coerce_column(text.where(present), column.type)
+        failed = present & coerced.isna()
+        df.isetitem(position, coerced)
+    errors = list()
+    if failed.any():
+        errors.append(
+            pd.DataFrame(
+                {
+                    "Column": column.name,
+                    "Row": df.index[failed.to_numpy()],
+                    "Value": values[failed].to_numpy(),
+                    "Expected": column.type,
+                }
+            )
+        )
+    if column.required and not present.all():
+        errors.append(
+            pd.DataFrame(
+                {
+                    "Column": column.name,
+                    "Row": df.index[~present.to_numpy()],
+                    "Value": None,
+                    "Expected": "required value",
+                }
+            )
+        )
+    return errors
+
+
+def coerce_dataframe(
+    df: pd.DataFrame, schema: list[Column]
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Apply a parser's declared schema in one vectorised pass per column. String
+    columns are left as they are and only checked when required.
+
+    :param df: parsed dataframe, modified in place
+    :type df: pd.DataFrame
+    :param schema: declared columns of the parser's output
+    :type schema: list[Column]
+    :return: the coerced dataframe and a side table of every value that
+        failed coercion or was missing from a required column
+    :rtype: tuple[pd.DataFrame, pd.DataFrame]
+    """
+    errors = list()
+    # columns are matched by position, so repeated labels are each coerced,
+    # and by the last level of MultiIndex labels
+    labels = df.columns.get_level_values(-1)
+    for column in schema:
+        positions = np.flatnonzero(labels == column.name)
+        if len(positions) == 0:
+            if column.required:
+                errors.append(
+                    pd.DataFrame(
+                        [[column.name, None, None, "required column"]],
+                        columns=ERROR_COLUMNS,
+                    )
+                )
+            continue
+        for position in positions:
+            errors.extend(coerce_position(df, position, column))
+
+    if errors:
+        errors_df = pd.concat(errors, ignore_index=True)
+    else:
+        errors_df = pd.DataFrame(columns=ERROR_COLUMNS)
+    return df, errors_df
+
+
+def apply_schema(
+    df: pd.DataFrame, schema: list[Column], axis: str = "columns"
+) -> pd.DataFrame:
+    """
+    Coerce a parser's output and attach the coercion errors to the dataframe
+    as a list of records in df.attrs["coercion_errors"]. Plain records keep
+    attrs comparable, which pandas needs when concatenating frames.
+
+    :param df: parsed dataframe
+    :type df: pd.DataFrame
+    :param schema: declared columns of the parser's output
+    :type schema: list[Column]
+    :param axis: "columns" if the schema names the columns, or "index" if
+        it names the rows of a transposed layout, e.g. the conflicts with
+        one column per profile, defaults to "columns"
+    :type axis: str, optional
+    :return: the coerced dataframe
+    :rtype: pd.DataFrame
+    """
+    if axis == "index":
+        # each row is coerced as a column, the cells keep their types when
+        # transposed back into the profile columns; a frame without any
+        # profiles loses its dtypes when transposed
+        coerced, errors = coerce_dataframe(df.T.astype(object), schema)
+        df = coerced.T
+    else:
+        df, errors = coerce_dataframe(df, schema)
+    df.attrs["coercion_errors"] = errors.to_dict("records")
+    return df
+
+
+def empty_frame(schema: list[Column]) -> pd.DataFrame:
+    """
+    Get a dataframe with a parser's declared columns and no rows, returned
+    when no record passes the record filters.
+
+    :param schema: declared columns of the parser's output
+    :type schema: list[Column]
+    :return: the coerced empty dataframe
+    :rtype: pd.DataFrame
+    """
+    df = pd.DataFrame(columns=[column.name for column in schema], dtype=object)
+    return apply_schema(df, schema)
+
+
+def apply_long_schema(df: pd.DataFrame, schema: list[Column]) -> pd.DataFrame:
+    """
+    Coerce the values of a long layout, one Record, Heading and Value row per
+    value, heading by heading. Values that fail coercion are dropped, as they
+    would be missing from the long layout of a coerced wide dataframe, and
+    the errors are attached as apply_schema does.
+
+    :param df: long dataframe of Record, Heading and Value
+    :type df: pd.DataFrame
+    :param schema: declared columns of the parser's output
+    :type schema: list[Column]
+    :return: the coerced dataframe
+    :rtype: pd.DataFrame
+    """
+    records = df["Record"].to_numpy()
+    headings = df["Heading"].to_numpy()
+    values = df["Value"].to_numpy(dtype=object).copy()
+    keep = np.ones(len(df), dtype=bool)
+    errors = list()
+    for column in schema:
+        rows = np.flatnonzero(headings == column.name)
+        if len(rows) == 0:
+            # without any records there's no column to miss
+            if column.required and len(df):
+                errors.append(
+                    pd.DataFrame(
+                        [[column.name, None, None, "required column"]],
+                        columns=ERROR_COLUMNS,
+                    )
+                )
+            continue
+        cells = pd.DataFrame({column.name: values[rows]}, index=records[rows])
+        errors.extend(coerce_position(cells, 0, column))
+        if column.required:
+            # records without the heading have no row to check
+            missing = np.setdiff1d(np.unique(records), records[rows])
+            if len(missing):
+                errors.append(
+                    pd.DataFrame(
+                        {
+                            "Column": column.name,
+                            "Row": missing,
+                            "Value": None,
+                            "Expected": "required value",
+                        }
+                    )
+                )
+        if column.type != "string":
+            coerced = cells.iloc[:, 0]
+            values[rows] = coerced.to_numpy(dtype=object)
+            keep[rows] = coerced.notna().to_numpy()
+
+    df = df[keep].copy()
+    df["Value"] = values[keep]
+    if errors:
+        errors_df = pd.concat(errors, ignore_index=True)
+    else:
+        errors_df = pd.DataFrame(columns=ERROR_COLUMNS)
+    df.attrs["coercion_errors"] = errors_df.to_dict("records")
+    return df
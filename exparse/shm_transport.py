@@ -0,0 +1,223 @@
+import gc
+import pickle
+import sys
+import time
+from dataclasses import dataclass, field
+from multiprocessing.shared_memory import SharedMemory
+
+import pandas as pd
+
+from arrow_export import import_pyarrow
+
+TRANSPORTS = ("arrow", "pickle")
+
+
+def untracked_shared_memory() -> bool:
+    # blocks outlive the worker that wrote them only if its resource tracker
+    # leaves them alone, and SharedMemory only takes track from Python 3.13
+    return sys.version_info >= (3, 13)
+
+
+@dataclass
+class SharedFrame:
+    """
+    Handle to a dataframe parsed in a worker process. The columns Arrow can
+    type are written as an Arrow IPC stream into a shared memory block named
+    shm_name; the rest of the frame (e.g. the transposed conflicts, whose
+    columns mix booleans, numbers and text) travels pickled in payload.
+
+    :param shm_name: name of the shared memory block, None if nothing was
+        written to shared memory
+    :param shm_bytes: size of the Arrow stream in shared memory
+    :param arrow_positions: positions of the columns in the Arrow stream
+    :param payload: pickled columns, labels and attrs
+    :param seconds: time the worker spent writing the frame
+    """
+
+    shm_name: str | None
+    shm_bytes: int
+    arrow_positions: list[int]
+    payload: bytes
+    seconds: float = 0.0
+    # set by attach_frame in the parent process
+    attach_seconds: float = field(default=0.0, compare=False)
+
+    @property
+    def bytes_moved(self) -> int:
+        return self.shm_bytes + len(self.payload)
+
+
+def arrow_positions(df: pd.DataFrame) -> list[int]:
+    """
+    Get the positions of the columns Arrow can hold without changing their
+    values: typed columns, and object columns holding only strings.
+    """
+    positions = list()
+    for position in range(df.shape[1]):
+        values = df.iloc[:, position]
+        if values.dtype != object or pd.api.types.infer_dtype(
+            values, skipna=True
+        ) in ("string", "empty"):
+            positions.append(position)
+    return positions
+
+
+def arrow_table(df: pd.DataFrame) -> tuple[object | None, list[int]]:
+    """
+    Convert the columns of a dataframe Arrow can hold to an Arrow table,
+    keeping its index. Columns are named by position, so repeated and
+    non-string labels don't matter.
+
+    :return: the table, or None if no column (or the index) can be
+        converted, and the positions of the converted columns
+    :rtype: tuple[pa.Table | None, list[int]]
+    """
+    pa = import_pyarrow()
+    positions = arrow_positions(df)
+    if not positions:
+        return None, list()
+    frame = df.iloc[:, positions].set_axis([str(p) for p in positions], axis=1)
+    try:
+        return pa.Table.from_pandas(frame), positions
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+        return None, list()
+
+
+def write_ipc(table, buffer) -> None:
+    pa = import_pyarrow()
+    with pa.ipc.new_stream(buffer, table.schema) as writer:
+        writer.write_table(table)
+
+
+def share_frame(df: pd.DataFrame, transport: str = "arrow") -> SharedFrame:
+    """
+    Prepare a parsed dataframe for the parent process. With the Arrow
+    transport the table is written straight into a new shared memory block,
+    which the worker leaves for the parent to attach to and free.
+
+    :param df: parsed dataframe
+    :type df: pd.DataFrame
+    :param transport: "arrow" or "pickle", defaults to "arrow"; the frame is
+        pickled if shared memory can't be left untracked
+    :type transport: str, optional
+    :return: handle to send back to the parent
+    :rtype: SharedFrame
+    """
+    if transport not in TRANSPORTS:
+        raise ValueError(f"Unknown transport {transport!r}")
+    start = time.perf_counter()
+    table, positions = (None, list())
+    if transport == "arrow" and untracked_shared_memory():
+        table, positions = arrow_table(df)
+
+    if table is None:
+        payload = pickle.dumps(df, protocol=pickle.HIGHEST_PROTOCOL)
+        return SharedFrame(
+            None, 0, list(), payload, time.perf_counter() - start
+        )
+
+    pa = import_pyarrow()
+    size = pa.MockOutputStream()
+    write_ipc(table, size)
+    # the block outlives this worker, the parent unlinks it after export
+    shm = SharedMemory(create=True, size=max(size.size(), 1), track=False)
+    write_ipc(table, pa.FixedSizeBufferWriter(pa.py_buffer(shm.buf)))
+    shm.close()
+
+    others = [p for p in range(df.shape[1]) if p not in set(positions)]
+    payload = pickle.dumps(
+        {
+            "others": {p: df.iloc[:, p].array for p in others},
+            "columns": df.columns,
+            "attrs": df.attrs,
+        },
+        protocol=pickle.HIGHEST_PROTOCOL,
+    )
+    return SharedFrame(
+        shm.name, size.size(), positions, payload, time.perf_counter() - start
+    )
+
+
+def string_types(arrow_type):
+    # string columns stay Arrow backed, so they aren't copied out of the
+    # shared memory block
+    pa = import_pyarrow()
+    if pa.types.is_string(arrow_type) or pa.types.is_large_string(arrow_type):
+        return pd.ArrowDtype(arrow_type)
+    return None
+
+
+def attach_frame(handle: SharedFrame) -> tuple[pd.DataFrame, object]:
+    """
+    Rebuild a dataframe sent by share_frame. Arrow backed columns reference
+    the shared memory block, so it has to stay open until the dataframe is
+    no longer used; release it with release_block.
+
+    :param handle: handle returned by a worker
+    :type handle: SharedFrame
+    :return: the dataframe and its shared memory block, or None
+    :rtype: tuple[pd.DataFrame, SharedMemory | None]
+    """
+    start = time.perf_counter()
+    if handle.shm_name is None:
+        df = pickle.loads(handle.payload)
+        handle.attach_seconds = time.perf_counter() - start
+        return df, None
+
+    pa = import_pyarrow()
+    shm = SharedMemory(name=handle.shm_name, track=False)
+    reader = pa.ipc.open_stream(pa.py_buffer(shm.buf)[: handle.shm_bytes])
+    shared = reader.read_all().to_pandas(types_mapper=string_types)
+    rest = pickle.loads(handle.payload)
+
+    columns = dict()
+    for position in range(len(rest["columns"])):
+        if position in rest["others"]:
+            columns[position] = pd.Series(
+                rest["others"][position], index=shared.index
+            )
+        else:
+            columns[position] = shared[str(position)]
+    df = pd.DataFrame(columns, index=shared.index)
+    df.columns = rest["columns"]
+    df.attrs = rest["attrs"]
+    handle.attach_seconds = time.perf_counter() - start
+    return df, shm
+
+
+def release_block(shm) -> None:
+    """
+    Free a shared memory block once the dataframes using it are gone. The
+    name is removed even if a view on the block is still alive, and the
+    memory is returned when the last view goes.
+    """
+    if shm is None:
+        return
+    # Arrow buffers on the block may only be held by reference cycles
+    gc.collect()
+    try:
+        shm.close()
+    except BufferError:
+        pass
+    try:
+        shm.unlink()
+    except FileNotFoundError:
+        # already removed, e.g. by a resource tracker
+        pass
+
+
+def discard_frame(handle: SharedFrame) -> None:
+    """
+    Free the shared memory block of a frame that won't be attached, e.g.
+    when another worker failed.
+
+    :param handle: handle returned by a worker
+    :type handle: SharedFrame
+    """
+    if handle.shm_name is None:
+        return
+    try:
+        shm = SharedMemory(name=handle.shm_name, track=False)
+    except FileNotFoundError:
+        return
+    release_block(shm)
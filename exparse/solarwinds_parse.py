@@ -1,9 +1,65 @@
-from pathlib import Path
-
 import pandas as pd
 
+from common_functions import RecordFilter, filter_rows
+from compressed_input import ReportInput, open_input
+from parser_registry import register_parser
+from schema import Column, apply_schema
+
+# the columns of an export vary with the Orion view it was taken from, and
+# read_csv already reads them as numbers or text, so none is declared
+SCHEMA = list()
+# every row after the header row, keyed by its first column
+RECORD_KEY = r"(?<=\n)([^\t\r\n]*)\t"
+
 
-def parse_solarwinds(file: Path) -> pd.DataFrame:
-    df = pd.read_csv(file, sep="\t")
+@register_parser(
+    "solarwinds",
+    # column titles in the header row of a node list export
+    signatures=[
+        r"\A(?:[^\t\r\n]*\t)*Caption(?:\t|\r?$)",
+        r"\A(?:[^\t\r\n]*\t)*IP_Address(?:\t|\r?$)",
+    ],
+    filename_hint="solarwinds",
+    schema=SCHEMA,
+    record_key=RECORD_KEY,
+    record_preamble=True,
+)
+def parse_solarwinds(
+    file: ReportInput,
+    limit: int | None = None,
+    sample: int | None = None,
+    where: list[RecordFilter] | None = None,
+    columns: list[str] | None = None,
+) -> pd.DataFrame:
+    usecols = None
+    if columns is not None:
+        # read_csv only converts the used columns, plus those filtered on
+        usecols = list(columns) + [
+            f.heading for f in where or [] if f.heading not in columns
+        ]
+    if where:
+        # the preview picks from the rows passing the filters, so the whole
+        # file is read and filtered first
+        with open_input(file) as f:
+            df = pd.read_csv(f, sep="\t", usecols=usecols)
+        df = filter_rows(df, where)
+        if sample is not None:
+            df = df.iloc[::sample]
+        if limit is not None:
+            df = df.iloc[:limit]
+    else:
+        skiprows = None
+        if sample is not None:
+            # keep the header row and every sample-th data row
+            skiprows = lambda row: row > 0 and (row - 1) % sample != 0
+        # read_csv stops after nrows rows, so only the head of the file is
+        # read (and decompressed)
+        with open_input(file) as f:
+            df = pd.read_csv(
+                f, sep="\t", nrows=limit, skiprows=skiprows, usecols=usecols
+            )
+    if columns is not None:
+        df = df[list(columns)]
+    df = apply_schema(df, SCHEMA)
 
     return df
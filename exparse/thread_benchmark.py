@@ -0,0 +1,96 @@
+import contextlib
+import io
+import time
+from pathlib import Path
+
+import pandas as pd
+
+from free_threading import gil_enabled, record_threads
+from parser_registry import ParserSpec
+
+REPEAT = 3
+
+
+def best_time(func, report: bytes, threads: int | None, repeat: int):
+    """
+    Time the fastest of repeated parses of a report.
+
+    :return: the seconds of the fastest parse and its dataframe
+    :rtype: tuple[float, pd.DataFrame]
+    """
+    best = None
+    for _ in range(repeat):
+        # parsers print their progress
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            df = func(file=report, threads=threads)
+            seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return best, df
+
+
+def benchmark_threads(
+    files: dict[str, tuple],
+    parsers: dict[str, ParserSpec],
+    threads: int | None = None,
+    repeat: int = REPEAT,
+) -> pd.DataFrame:
+    """
+    Time every threaded parser on its input file, once in the calling thread
+    and once with its record-level work on a thread pool. The reports are
+    read before timing, so disk reads aren't counted.
+
+    :param files: (input file, parse function) of each category
+    :type files: dict[str, tuple]
+    :param parsers: registered parsers
+    :type parsers: dict[str, ParserSpec]
+    :param threads: threads of the thread pool, None for one per CPU
+    :type threads: int | None, optional
+    :param repeat: parses timed per mode, the fastest is kept
+    :type repeat: int, optional
+    :return: one row per parser with both timings, the speedup and whether
+        both modes gave the same dataframe
+    :rtype: pd.DataFrame
+    """
+    rows = list()
+    for category, (file, func) in files.items():
+        if not parsers[category].threaded:
+            continue
+        report = Path(file).read_bytes()
+        serial_seconds, serial_df = best_time(func, report, 1, repeat)
+        pool_seconds, pool_df = best_time(func, report, threads, repeat)
+        rows.append(
+            {
+                "category": category,
+                "records": len(serial_df),
+                "serial_seconds": serial_seconds,
+                "pool_seconds": pool_seconds,
+                "speedup": serial_seconds / pool_seconds,
+                "same": serial_df.equals(pool_df),
+            }
+        )
+    return pd.DataFrame(rows)
+
+
+def print_thread_benchmark(
+    files: dict[str, tuple],
+    parsers: dict[str, ParserSpec],
+    threads: int | None = None,
+    repeat: int = REPEAT,
+) -> pd.DataFrame:
+    """
+    Print the benchmark of the serial and thread-pool modes.
+
+    :return: the benchmark
+    :rtype: pd.DataFrame
+    """
+    if gil_enabled():
+        print(
+            "The GIL is enabled, so the thread-pool mode runs in one thread; "
+            "use a free-threaded Python build to compare the modes"
+        )
+    else:
+        print(f"Free-threaded Python, {record_threads(threads)} threads")
+    report = benchmark_threads(files, parsers, threads, repeat)
+    print(report.to_string(index=False))
+    return report
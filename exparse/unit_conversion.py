@@ -0,0 +1,261 @@
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+
+class UnitConversionIndex:
+    """
+    Conversion index built from the parsed unit of measure dictionary.
+
+    Every unit is stored with the connected component it belongs to and its
+    scale relative to that component's root unit, which is the transitive
+    closure of the equivalences in a compact form: any two units in the same
+    component convert with a single division, in constant time.
+    """
+
+    def __init__(
+        self,
+        components: dict[str, int],
+        scales: dict[str, float],
+        conflicts: pd.DataFrame,
+    ) -> None:
+        self.units = pd.Index(sorted(components), name="Unit")
+        self.components = np.array(
+            [components[unit] for unit in self.units], dtype=np.int64
+        )
+        self.scales = np.array(
+            [scales[unit] for unit in self.units], dtype=np.float64
+        )
+        self._lookup = {
+            unit: (component, scale)
+            for unit, component, scale in zip(
+                self.units, self.components, self.scales
+            )
+        }
+        # equivalences that could not be added to the graph consistently
+        self.conflicts = conflicts
+
+    def __contains__(self, unit: str) -> bool:
+        return normalise_unit(unit) in self._lookup
+
+    def __len__(self) -> int:
+        return len(self.units)
+
+    def factor(self, from_unit: str, to_unit: str) -> float:
+        """
+        Get the factor to multiply a value in one unit by to express it in
+        another unit.
+
+        :param from_unit: unit mnemonic to convert from
+        :type from_unit: str
+        :param to_unit: unit mnemonic to convert to
+        :type to_unit: str
+        :return: conversion factor, NaN if the units are not convertible
+        :rtype: float
+        """
+        source = self._lookup.get(normalise_unit(from_unit))
+        target = self._lookup.get(normalise_unit(to_unit))
+        if source is None or target is None or source[0] != target[0]:
+            return np.nan
+        return float(source[1] / target[1])
+
+    def convertible(self, from_units, to_units) -> np.ndarray:
+        """
+        Check element-wise whether pairs of units can be converted.
+
+        :param from_units: units to convert from
+        :param to_units: units to convert to
+        :return: boolean array, True where a conversion factor exists
+        :rtype: np.ndarray
+        """
+        return self._convertible(*self._positions(from_units, to_units))
+
+    def factors(self, from_units, to_units) -> np.ndarray:
+        """
+        Vectorised equivalent of factor for whole columns of units.
+
+        :param from_units: units to convert from
+        :param to_units: units to convert to, or a single unit for all rows
+        :return: array of conversion factors, NaN where not convertible
+        :rtype: np.ndarray
+        """
+        source, target = self._positions(from_units, to_units)
+        convertible = self._convertible(source, target)
+        result = np.full(len(source), np.nan)
+        result[convertible] = (
+            self.scales[source[convertible]] / self.scales[target[convertible]]
+        )
+        return result
+
+    def convert(self, values, from_units, to_units) -> pd.Series:
+        """
+        Convert a column of values from their units into target units in one
+        call, e.g. the dosing set Min Dose against Min Dosage Unit.
+
+        :param values: numeric values to convert
+        :param from_units: unit of each value
+        :param to_units: unit to convert each value to, or a single unit
+        :return: converted values, NaN where the units are not convertible
+        :rtype: pd.Series
+        """
+        index = values.index if isinstance(values, pd.Series) else None
+        numbers = pd.to_numeric(
+            pd.Series(values, index=index), errors="coerce"
+        )
+        return numbers * self.factors(from_units, to_units)
+
+    def to_frame(self) -> pd.DataFrame:
+        """
+        Materialise the full closure as a table of every convertible pair.
+
+        :return: dataframe of From Unit, To Unit and Conversion Factor
+        :rtype: pd.DataFrame
+        """
+        df = pd.DataFrame(
+            {
+                "Unit": self.units,
+                "Component": self.components,
+                "Scale": self.scales,
+            }
+        )
+        pairs = df.merge(df, on="Component", suffixes=(" From", " To"))
+        return pd.DataFrame(
+            {
+                "From Unit": pairs["Unit From"],
+                "To Unit": pairs["Unit To"],
+                "Conversion Factor": pairs["Scale From"] / pairs["Scale To"],
+            }
+        )
+
+    def _convertible(
+        self, source: np.ndarray, target: np.ndarray
+    ) -> np.ndarray:
+        # unknown units are at position -1, which mustn't index the arrays
+        known = (source >= 0) & (target >= 0)
+        convertible = np.zeros(len(source), dtype=bool)
+        convertible[known] = (
+            self.components[source[known]] == self.components[target[known]]
+        )
+        return convertible
+
+    def _positions(
+        self, from_units, to_units
+    ) -> tuple[np.ndarray, np.ndarray]:
+        source_units = normalise_units(from_units)
+        if isinstance(to_units, str):
+            target_units = pd.Series(
+                normalise_unit(to_units), index=source_units.index
+            )
+        else:
+            target_units = normalise_units(to_units)
+        source = self.units.get_indexer(source_units)
+        target = self.units.get_indexer(target_units)
+        return source, target
+
+
+def normalise_unit(unit) -> str | None:
+    # a missing unit is unconvertible, rather than the unit "NAN"
+    if pd.isna(unit):
+        return None
+    return str(unit).strip().upper()
+
+
+def normalise_units(units) -> pd.Series:
+    units = pd.Series(units, dtype="object")
+    normalised = units.astype(str).str.strip().str.upper()
+    return normalised.mask(units.isna(), None)
+
+
+def build_conversion_index(
+    df: pd.DataFrame, relative_tolerance: float = 1e-9
+) -> UnitConversionIndex:
+    """
+    Build a conversion index from the output of parse_units. Each row is read
+    as "1 Mnemonic = Conversion Factor x Equivalent Unit".
+
+    Equivalences that contradict the ones already in the graph (including
+    cycles with inconsistent factors) and rows with an invalid factor are
+    skipped and reported in the index's conflicts table.
+
+    :param df: dataframe from parse_units
+    :type df: pd.DataFrame
+    :param relative_tolerance: tolerance when comparing factors, defaults to 1e-9
+    :type relative_tolerance: float, optional
+    :return: the conversion index
+    :rtype: UnitConversionIndex
+    """
+    edges = pd.DataFrame(
+        {
+            "Mnemonic": normalise_units(df["Mnemonic"].fillna("")).to_numpy(),
+            "Equivalent Unit": normalise_units(
+                df["Equivalent Unit"].fillna("")
+            ).to_numpy(),
+            "Conversion Factor": pd.to_numeric(
+                df["Conversion Factor"], errors="coerce"
+            ).to_numpy(),
+        }
+    )
+    edges = edges[edges["Mnemonic"] != ""].drop_duplicates()
+
+    units = set(edges["Mnemonic"])
+    links = edges[
+        (edges["Equivalent Unit"] != "")
+        & (edges["Equivalent Unit"] != edges["Mnemonic"])
+    ]
+    units.update(links["Equivalent Unit"])
+
+    invalid = links["Conversion Factor"].isna() | (
+        links["Conversion Factor"] <= 0
+    )
+    conflicts = [
+        (mnemonic, equivalent, factor, "invalid conversion factor")
+        for mnemonic, equivalent, factor in links[invalid].itertuples(
+            index=False
+        )
+    ]
+
+    # adjacency list holding each edge's scale ratio in both directions
+    adjacency = {unit: list() for unit in units}
+    valid_links = list(links[~invalid].itertuples(index=False, name=None))
+    for edge, (mnemonic, equivalent, factor) in enumerate(valid_links):
+        adjacency[mnemonic].append((equivalent, 1 / factor, edge))
+        adjacency[equivalent].append((mnemonic, factor, edge))
+
+    # breadth first search from each unvisited unit assigns the scale of
+    # every unit relative to the root of its component
+    components = dict()
+    scales = dict()
+    checked_edges = set()
+    component = -1
+    for root in sorted(units):
+        if root in components:
+            continue
+        component += 1
+        components[root] = component
+        scales[root] = 1.0
+        queue = deque([root])
+        while queue:
+            unit = queue.popleft()
+            for neighbour, ratio, edge in adjacency[unit]:
+                if edge in checked_edges:
+                    continue
+                checked_edges.add(edge)
+                expected = scales[unit] * ratio
+                if neighbour not in components:
+                    components[neighbour] = component
+                    scales[neighbour] = expected
+                    queue.append(neighbour)
+                elif not np.isclose(
+                    scales[neighbour], expected, rtol=relative_tolerance
+                ):
+                    conflicts.append(
+                        valid_links[edge]
+                        + ("inconsistent with existing equivalences",)
+                    )
+
+    conflicts_df = pd.DataFrame(
+        conflicts,
+        columns=["Mnemonic", "Equivalent Unit", "Conversion Factor", "Issue"],
+    )
+    return UnitConversionIndex(components, scales, conflicts_df)
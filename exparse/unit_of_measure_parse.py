@@ -1,15 +1,68 @@
-from pathlib import Path
+import re
 
+import numpy as np
 import pandas as pd
 
 from common_functions import (
+    RecordFilter,
+    filter_rows,
     parse_fixed_width_table_from_text,
+    read_records,
     regex_substitution,
+    select_records,
+)
+from compressed_input import ReportInput, open_input
+from parser_registry import register_parser
+from schema import Column, apply_schema
+
+SCHEMA = [
+    Column("Mnemonic", required=True),
+    Column("Active", "boolean"),
+    Column("Conversion Factor", "numeric"),
+    Column("Code Type", "categorical"),
+]
+PATTERNS = [
+    # anchored, so a line without the heading is scanned once, not once per
+    # character
+    (r"^.*Equivalent   Conversion", ""),
+    # dashed separator lines under the headers would become units
+    (r"^-+(?:[ \t]+-+)*[ \t]*\n", ""),
+    # lines the cleanup leaves empty would become continuation rows
+    (r"^[ \t]*\n", ""),
+]
+# line of each unit in the raw report. The text up to the end of the table's
+# header line, the page headers removed by COMMON_CLEANUP_PATTERNS and the
+# dashed separator lines are matched without a key, so they start no record.
+# Continuation lines start with whitespace and stay with the unit above
+RECORD_KEY = (
+    r"\A(?:.*\n)*?Mnemonic[ \t].*"
+    r"|^(?:\*(?:LIVE|LSTD|TEST|TSTD)\*.*\n.*\n.*|DATE:.*|USER:.*"
+    r"|-+(?:[ \t]+-+)*[ \t]*$"
+    r"|Mnemonic[ \t].*)"
+    r"|^(\S+)"
 )
 
 
 # TODO - no work done on this at all!
-def parse_units(file: Path) -> pd.DataFrame:
+@register_parser(
+    "unit_of_measure",
+    signatures=[
+        r"Equivalent\s+Conversion",
+        r"Mnemonic\s+Active\s+Name\s+Unit\s+Factor",
+    ],
+    filename_hint="unit",
+    schema=SCHEMA,
+    patterns=PATTERNS,
+    record_key=RECORD_KEY,
+    record_preamble=True,
+)
+def parse_units(
+    file: ReportInput,
+    limit: int | None = None,
+    sample: int | None = None,
+    where: list[RecordFilter] | None = None,
+    columns: list[str] | None = None,
+) -> pd.DataFrame:
     HEADINGS = [
         "Mnemonic",
         "Active",
@@ -20,11 +73,17 @@ def parse_units(file: Path) -> pd.DataFrame:
         "Code",
         "Name",
     ]
-    patterns = [
-        (r".*Equivalent   Conversion", ""),
-    ]
-    table_text = file.read_text()
-    table_text = regex_substitution(table_text, patterns)
+    # filters are only applied to the parsed table, so a filtered preview
+    # reads every unit and picks from those passing them
+    if limit is None or where:
+        with open_input(file) as f:
+            lines = split_units(f.read(), True)
+    else:
+        lines = read_records(file, split_units, 2 + limit * (sample or 1))
+    if not where:
+        # keep the text before the table and the table's header line
+        lines = lines[:2] + select_records(lines[2:], limit, sample)
+    table_text = "".join(lines)
 
     df = parse_fixed_width_table_from_text(
         table_text=table_text,
@@ -33,7 +92,39 @@ def parse_units(file: Path) -> pd.DataFrame:
     df.columns = HEADINGS
     # get rid of rows that are just headers
     df = df[df["Mnemonic"] != "Mnemonic"]
-    df.replace("", pd.NA, inplace=True)
-    df.ffill(inplace=True)
+    # only continuation rows (no Mnemonic) inherit values from the unit above,
+    # so a base unit's blank Equivalent Unit isn't filled from its neighbour
+    continuation = (df["Mnemonic"] == "").to_numpy()
+    df = df.replace("", pd.NA)
+    filled = df.ffill()
+    df = pd.DataFrame(
+        np.where(continuation[:, None], filled.to_numpy(), df.to_numpy()),
+        index=df.index,
+        columns=df.columns,
+    )
+    # the table is parsed as a whole, so filters and columns apply to the
+    # filled rows
+    if where:
+        # the unit of each row, continuation rows included
+        units = pd.Series(np.cumsum(~continuation), index=df.index)
+        df = filter_rows(df, where)
+        picked = select_records(list(units[df.index].unique()), limit, sample)
+        df = df[units[df.index].isin(picked).to_numpy()]
+    if columns is not None:
+        keep = {"Mnemonic"} | set(columns)
+        df = df.loc[:, df.columns.isin(keep)]
+    df = apply_schema(df, SCHEMA)
 
     return df
+
+
+def split_units(text: str, complete: bool) -> list[str]:
+    """
+    Clean the report and split it into the text before the table, the header
+    line and then one chunk per unit, holding the unit's line and any
+    continuation lines below it. Repeated page headers are dropped.
+    """
+    table_text = regex_substitution(text, PATTERNS)
+    lines = re.split(r"(?=^\S)", table_text, flags=re.MULTILINE)
+    units = [line for line in lines[2:] if not line.startswith("Mnemonic")]
+    return lines[:2] + (units if complete else units[:-1])
@@ -0,0 +1,58 @@
+import datetime
+
+import numpy as np
+import openpyxl
+import pandas as pd
+
+from xlsx_export import write_xlsx
+
+
+def sheet_cells(path) -> dict:
+    # value, type, number format and bolding of every cell, plus the merges
+    workbook = openpyxl.load_workbook(path)
+    sheets = dict()
+    for worksheet in workbook.worksheets:
+        cells = {
+            cell.coordinate: (
+                cell.value,
+                cell.data_type,
+                cell.number_format if cell.data_type == "n" else None,
+                bool(cell.font.b),
+            )
+            for row in worksheet.iter_rows()
+            for cell in row
+            if cell.value is not None
+        }
+        merges = sorted(str(merged) for merged in worksheet.merged_cells)
+        sheets[worksheet.title] = (cells, merges)
+    return sheets
+
+
+def test_engines_write_the_same_cells(tmp_path):
+    flat = pd.DataFrame(
+        {
+            "Mnemonic": ["MG", "MCG", "G"],
+            "Factor": [0.001, np.nan, 1000.0],
+            "Count": [1, 2, 3],
+            "Active": [True, False, True],
+            "Formula": ["=SUM(A1:A2)", "=", "plain"],
+            "Date": [datetime.date(2025, 1, 1)] * 3,
+            "Started": pd.to_datetime(["2025-01-01 08:00"] * 3),
+            "Duration": pd.to_timedelta(["1h", "30min", "26h"]),
+        }
+    )
+    profiles = pd.DataFrame(
+        [["Y", "N"], ["8", None]],
+        index=["Active", "Rank"],
+        columns=pd.MultiIndex.from_tuples(
+            [("Main", "PROFILE1"), ("Main", "PROFILE2")]
+        ),
+    )
+    dfs = [("flat", flat), ("profiles", profiles)]
+
+    write_xlsx(dfs, tmp_path / "package.xlsx", workers=1)
+    write_xlsx(dfs, tmp_path / "openpyxl.xlsx", engine="openpyxl")
+
+    assert sheet_cells(tmp_path / "package.xlsx") == sheet_cells(
+        tmp_path / "openpyxl.xlsx"
+    )